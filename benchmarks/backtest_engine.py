@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding: UTF-8
+"""
+Compares the iloc based bar crawler with the array based BacktestEngine.
+
+    $ python benchmarks/backtest_engine.py --days 365
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src.backtest_engine import BacktestEngine
+
+
+def random_ohlcv(days):
+    size = days * 24 * 60
+    rng = np.random.default_rng(1)
+    close = 30000 + np.cumsum(rng.normal(0, 10, size))
+    open = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open, close) + rng.uniform(0, 5, size)
+    low = np.minimum(open, close) - rng.uniform(0, 5, size)
+    volume = rng.uniform(1, 100, size)
+    index = pd.date_range("2021-01-01", periods=size, freq="1min", tz="UTC", name="timestamp")
+    return pd.DataFrame({"open": open, "high": high, "low": low, "close": close, "volume": volume}, index=index)
+
+
+def strategy(open, close, high, low, volume):
+    return close[-1] > open[-1]
+
+
+def iloc_crawler(df, ohlcv_len):
+    for i in range(len(df) - ohlcv_len):
+        data = df.iloc[i:i + ohlcv_len, :]
+        timestamp = data.iloc[-1].name
+        close = data["close"].values
+        open = data["open"].values
+        high = data["high"].values
+        low = data["low"].values
+        volume = data["volume"].values
+        strategy(open, close, high, low, volume)
+    return timestamp
+
+
+def engine_crawler(df, ohlcv_len):
+    engine = BacktestEngine(df, ohlcv_len)
+    for i, timestamp, open, close, high, low, volume in engine.bars():
+        strategy(open, close, high, low, volume)
+    return timestamp
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest bar loop benchmark")
+    parser.add_argument("--days", default=365, type=int)
+    parser.add_argument("--ohlcv-len", default=100, type=int)
+    args = parser.parse_args()
+
+    df = random_ohlcv(args.days)
+    print(f"bars: {len(df)}, ohlcv_len: {args.ohlcv_len}")
+
+    results = {}
+    last = {}
+    for name, crawler in [("iloc", iloc_crawler), ("engine", engine_crawler)]:
+        start = time.time()
+        last[name] = crawler(df, args.ohlcv_len)
+        results[name] = time.time() - start
+        print(f"{name:<8}: {results[name]:.3f} s")
+
+    # both loops read the bar time, they must end on the same bar
+    print(f"last bar: iloc {last['iloc']}, engine {last['engine']}")
+
+    print(f"speedup : {results['iloc'] / results['engine']:.1f}x")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: UTF-8
+"""
+Compares the order list scan of the stubs with the matching engine on a grid strategy
+keeping many resting limit orders, a filled level is placed again on the next bar
+like entry() does, cancelling its id first.
+
+    $ python benchmarks/matching_engine.py --bars 20000 --levels 500
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src.matching_engine import MatchingEngine
+
+
+def legacy(bars, grid):
+    """
+    order list scan of the stubs before the matching engine
+    """
+    orders = []
+    fills = 0
+    filled = list(grid)
+    for high, low, close in bars:
+        for id in filled:
+            long, limit = grid[id]
+            orders = [o for o in orders if o["id"] != id]
+            orders.append({"id": id, "long": long, "qty": 1, "limit": limit, "stop": 0, "post_only": False})
+        filled = []
+        resting = []
+        for order in orders:
+            if (order["long"] and low < order["limit"]) or (not order["long"] and high > order["limit"]):
+                filled.append(order["id"])
+                continue
+            resting.append(order)
+        orders = resting
+        fills += len(filled)
+    return fills
+
+
+def engine(bars, grid):
+    orders = MatchingEngine()
+    fills = 0
+    filled = list(grid)
+    for high, low, close in bars:
+        for id in filled:
+            long, limit = grid[id]
+            orders.cancel(id)
+            orders.add(id, long, 1, limit)
+        filled = [fill[0] for fill in orders.match(high, low, close)]
+        fills += len(filled)
+    return fills
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Matching engine benchmark")
+    parser.add_argument("--bars", default=20000, type=int)
+    parser.add_argument("--levels", default=500, type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    close = 30000 + np.cumsum(rng.normal(0, 10, args.bars))
+    spread = rng.uniform(0, 20, args.bars)
+    bars = list(zip((close + spread).tolist(), (close - spread).tolist(), close.tolist()))
+    # buy levels below and sell levels above the first price, 10 apart
+    grid = {f"grid{i}": (i < args.levels // 2, 30000 + (i - args.levels // 2 + 0.5) * 10) for i in range(args.levels)}
+    print(f"bars: {args.bars}, levels: {args.levels}")
+
+    results = {}
+    fills = {}
+    for name, func in [("legacy", legacy), ("engine", engine)]:
+        start = time.time()
+        fills[name] = func(bars, grid)
+        results[name] = time.time() - start
+        print(f"{name:<7}: {results[name]:.3f} s, {fills[name]} fills")
+
+    assert fills["legacy"] == fills["engine"]
+    print(f"speedup: {results['legacy'] / results['engine']:.1f}x")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# coding: UTF-8
+"""
+Compares loading OHLCV data from the CSV file with the columnar OhlcvStore.
+
+    $ python benchmarks/ohlcv_store.py --days 365
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.backtest_engine import random_ohlcv
+from src import load_data
+from src.ohlcv_store import OhlcvStore
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OHLCV load benchmark")
+    parser.add_argument("--days", default=365, type=int)
+    args = parser.parse_args()
+
+    df = random_ohlcv(args.days)
+    print(f"bars: {len(df)}")
+
+    with tempfile.TemporaryDirectory() as dir:
+        file = os.path.join(dir, "data.csv")
+        path = os.path.join(dir, "store")
+        df.to_csv(file)
+        OhlcvStore(path).append(df)
+
+        results = {}
+        for name, source in [("csv", file), ("store", path)]:
+            start = time.time()
+            load_data(source)
+            results[name] = time.time() - start
+            print(f"{name:<8}: {results[name] * 1000:.1f} ms")
+
+        day = random_ohlcv(args.days + 1)[-24 * 60:]
+        start = time.time()
+        OhlcvStore(path).append(day)
+        print(f"append  : {(time.time() - start) * 1000:.1f} ms (one day)")
+
+    print(f"speedup : {results['csv'] / results['store']:.1f}x")
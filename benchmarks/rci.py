@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# coding: UTF-8
+"""
+Compares the sort and scan RCI with the vectorized and the rolling implementations,
+computing the RCI of every bar.
+
+    $ python benchmarks/rci.py --bars 6790 --itv 55
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src import d, rci_series
+from src.indicators import Rci
+
+
+def legacy_rci(src, itv):
+    """
+    src.rci before the vectorized implementation
+    """
+    reversed_src = src[::-1]
+    ret = [(1.0 - 6.0 * d(reversed_src[i: i + itv], itv) / (itv * (itv * itv - 1.0))) * 100.0 for i in range(2)]
+    return ret[::-1]
+
+
+def legacy(close, itv):
+    return [legacy_rci(close[:i + 1], itv)[-1] for i in range(itv, len(close))]
+
+
+def vectorized(close, itv):
+    return rci_series(close, itv)
+
+
+def rolling(close, itv):
+    indicator = Rci(itv)
+    return [indicator.update(value) for value in close]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RCI benchmark")
+    parser.add_argument("--bars", default=6790, type=int)
+    parser.add_argument("--itv", default=55, type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    close = np.round(30000 + np.cumsum(rng.normal(0, 10, args.bars)), 1)
+    print(f"bars: {args.bars}, itv: {args.itv}")
+
+    results = {}
+    values = {}
+    for name, func in [("legacy", legacy), ("vectorized", vectorized), ("rolling", rolling)]:
+        start = time.time()
+        values[name] = func(close, args.itv)
+        results[name] = time.time() - start
+        print(f"{name:<10}: {results[name]:.3f} s")
+
+    assert np.array_equal(values["legacy"], values["vectorized"][args.itv:])
+    assert np.array_equal(values["vectorized"], values["rolling"], equal_nan=True)
+    print(f"speedup   : {results['legacy'] / results['vectorized']:.1f}x vectorized, "
+          f"{results['legacy'] / results['rolling']:.1f}x rolling")
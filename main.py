@@ -17,6 +17,11 @@ if __name__ == "__main__":
     parser.add_argument("--exchange", default="binance",   required=True)
     parser.add_argument("--pair", default="BTCUSDT",   required=False)
     parser.add_argument("--strategy", default="doten", required=True)
+    parser.add_argument("--workers", default=1, type=int, required=False)
+    parser.add_argument("--sweep", default=0, type=int, required=False)
+    parser.add_argument("--walk-forward", default=None, type=int, nargs=2, metavar=("TRAIN", "TEST"), required=False)
+    parser.add_argument("--asyncio", default=False, action="store_true")
+    parser.add_argument("--sync-history", default=False, action="store_true")
     args = parser.parse_args()
 
     # create the bot instance
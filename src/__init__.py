@@ -8,12 +8,14 @@ import uuid
 from datetime import timedelta
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pandas as pd
 import requests
 import talib
 from bravado.exception import HTTPError
 
 from src.config import config as conf
+from src.ohlcv_store import OhlcvStore
 
 logging.basicConfig(
     level=logging.INFO,
@@ -58,19 +60,21 @@ def ord_suffix():
 def load_data(file):
     """
     Read data from a file.
+    :param file: CSV file or OhlcvStore directory
     """
+    if os.path.isdir(file):
+        return OhlcvStore(file).read()
     source = pd.read_csv(file)
-    # data_frame = pd.DataFrame({
-    #     'timestamp': pd.to_datetime(source['timestamp']),
-    #     'open': source['open'],
-    #     'close': source['close'],
-    #     'high': source['high'],
-    #     'low': source['low'],
-    #     'volume': source['volume']
-    # })
-    # data_frame = data_frame.set_index('timestamp')
-    # return data_frame.tz_localize(None).tz_localize('UTC', level=0)
-    return source
+    data_frame = pd.DataFrame({
+        'timestamp': pd.to_datetime(source['timestamp']),
+        'open': source['open'],
+        'close': source['close'],
+        'high': source['high'],
+        'low': source['low'],
+        'volume': source['volume']
+    })
+    data_frame = data_frame.set_index('timestamp')
+    return data_frame.tz_localize(None).tz_localize('UTC', level=0)
 
 
 def validate_continuous(data, bin_size):
@@ -311,6 +315,28 @@ def crossunder(a, b):
     return a[-2] > b[-2] and a[-1] < b[-1]
 
 
+def crossover_series(a, b):
+    """
+    crossover of every bar, False for the first one
+    """
+    a = np.asarray(a)
+    b = np.asarray(b)
+    rval = np.zeros(len(a), dtype=bool)
+    rval[1:] = (a[:-1] < b[:-1]) & (a[1:] > b[1:])
+    return rval
+
+
+def crossunder_series(a, b):
+    """
+    crossunder of every bar, False for the first one
+    """
+    a = np.asarray(a)
+    b = np.asarray(b)
+    rval = np.zeros(len(a), dtype=bool)
+    rval[1:] = (a[:-1] > b[:-1]) & (a[1:] < b[1:])
+    return rval
+
+
 def over(a, b):
     if a > b:
         return True
@@ -338,10 +364,36 @@ def d(src, itv):
     return sum
 
 
+def rci_series(src, itv):
+    """
+    rank correlation index of every bar, nan for the first itv - 1 bars.
+    prices of each window are ranked with one vectorized comparison, equal prices
+    share the best rank like d(), so the values are the same as rci.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    itv = int(itv)
+    rval = np.full(len(src), np.nan)
+    if itv < 2 or len(src) < itv:
+        return rval
+
+    # newest price first, its time rank is 1
+    windows = sliding_window_view(src, itv)[:, ::-1]
+    time_rank = np.arange(1, itv + 1)
+    # windows compared at once, bounds the itv x itv comparison matrices
+    chunk = max(1, 2 ** 22 // (itv * itv))
+    for start in range(0, len(windows), chunk):
+        w = windows[start:start + chunk]
+        price_rank = 1 + (w[:, None, :] > w[:, :, None]).sum(axis=2)
+        dist = ((time_rank - price_rank) ** 2).sum(axis=1)
+        rval[itv - 1 + start:itv - 1 + start + len(w)] = (1.0 - 6.0 * dist / (itv * (itv * itv - 1.0))) * 100.0
+    return rval
+
+
 def rci(src, itv):
-    reversed_src = src[::-1]
-    ret = [(1.0 - 6.0 * d(reversed_src[i : i + itv], itv) / (itv * (itv * itv - 1.0))) * 100.0 for i in range(2)]
-    return ret[::-1]
+    """
+    rank correlation index of the last two bars
+    """
+    return list(rci_series(np.asarray(src)[-int(itv) - 1:], itv)[-2:])
 
 
 def vix(close, low, pd=23, bbl=23, mult=1.9, lb=88, ph=0.85, pl=1.01):
@@ -380,6 +432,33 @@ def is_over(src, value, p):
     return True
 
 
+def heikinashi_values(open, high, low, close):
+    """
+    Heiken Ashi candles of OHLC arrays, the inputs are not modified.
+    HA open is the recurrence (previous HA open + previous HA close) / 2, which is an
+    exponential moving average with alpha 0.5 of the previous HA close, so it is
+    solved by the ewm scan of pandas instead of a loop over the rows.
+    :return: HA open, HA high, HA low, HA close arrays
+    """
+    open = np.asarray(open, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+
+    ha_close = (open + high + low + close) / 4
+    if len(ha_close) == 0:
+        return ha_close.copy(), ha_close.copy(), ha_close.copy(), ha_close
+
+    prev_close = np.empty_like(ha_close)
+    prev_close[0] = (open[0] + close[0]) / 2
+    prev_close[1:] = ha_close[:-1]
+    ha_open = pd.Series(prev_close).ewm(alpha=0.5, adjust=False).mean().values
+
+    ha_high = np.maximum(np.maximum(ha_open, ha_close), high)
+    ha_low = np.minimum(np.minimum(ha_open, ha_close), low)
+    return ha_open, ha_high, ha_low, ha_close
+
+
 def heikinashi(df, ohlc=["open", "high", "low", "close"]):
     """
     Function to compute Heiken Ashi Candles (HA)
@@ -387,91 +466,87 @@ def heikinashi(df, ohlc=["open", "high", "low", "close"]):
         df : Pandas DataFrame which contains ['date', 'open', 'high', 'low', 'close', 'volume'] columns
         ohlc: List defining OHLC Column names (default ['Open', 'High', 'Low', 'Close'])
     Returns :
-        df : Pandas DataFrame with new columns added for
+        df : new Pandas DataFrame, df with the columns added for
             Heiken Ashi Close (HA_$ohlc[3])
             Heiken Ashi Open (HA_$ohlc[0])
             Heiken Ashi High (HA_$ohlc[1])
             Heiken Ashi Low (HA_$ohlc[2])
     """
-
-    ha_open = "HA_" + ohlc[0]
-    ha_high = "HA_" + ohlc[1]
-    ha_low = "HA_" + ohlc[2]
-    ha_close = "HA_" + ohlc[3]
-
-    df[ha_close] = (df[ohlc[0]] + df[ohlc[1]] + df[ohlc[2]] + df[ohlc[3]]) / 4
-
-    df[ha_open] = 0.00
-    for i in range(0, len(df)):
-        if i == 0:
-            df[ha_open].iat[i] = (df[ohlc[0]].iat[i] + df[ohlc[3]].iat[i]) / 2
-        else:
-            df[ha_open].iat[i] = (df[ha_open].iat[i - 1] + df[ha_close].iat[i - 1]) / 2
-
-    df[ha_high] = df[[ha_open, ha_close, ohlc[1]]].max(axis=1)
-    df[ha_low] = df[[ha_open, ha_close, ohlc[2]]].min(axis=1)
-
-    return df
+    ha_open, ha_high, ha_low, ha_close = heikinashi_values(df[ohlc[0]].values, df[ohlc[1]].values,
+                                                            df[ohlc[2]].values, df[ohlc[3]].values)
+    return df.assign(**{
+        "HA_" + ohlc[3]: ha_close,
+        "HA_" + ohlc[0]: ha_open,
+        "HA_" + ohlc[1]: ha_high,
+        "HA_" + ohlc[2]: ha_low,
+    })
 
 
 def atr(high, low, close, period=14):
     return talib.ATR(high, low, close, period)
 
 
+def supertrend_values(high, low, close, f, n):
+    """
+    SuperTrend of OHLC arrays, the inputs are not modified.
+    The ATR is seeded with the mean of the first n - 1 true ranges then smoothed like
+    Wilder, values before the bar n - 1 are nan. The bands and the trend depend on their
+    previous values, they are computed in one pass over plain floats.
+    :param f: factor, 3 is commonly used
+    :param n: period, 7 is commonly used
+    :return: supertrend, trend (True when up), upper band, lower band arrays
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    size = len(close)
+
+    prev_close = np.concatenate([[np.nan], close[:-1]])
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+    supertrend = np.full(size, np.nan)
+    trend = np.ones(size, dtype=bool)
+    upper = np.full(size, np.nan)
+    lower = np.full(size, np.nan)
+    if n < 1 or size < n:
+        return supertrend, trend, upper, lower
+
+    hl2 = ((high + low) / 2).tolist()
+    tr = tr.tolist()
+    close_values = close.tolist()
+    atr = tr[:n - 1]
+    atr = sum(atr) / len(atr) if len(atr) > 0 else np.nan
+
+    ub = hl2[n - 1] + f * atr
+    lb = hl2[n - 1] - f * atr
+    up = close_values[n - 1] > ub
+    upper[n - 1], lower[n - 1], trend[n - 1] = ub, lb, up
+    supertrend[n - 1] = lb if up else ub
+
+    for i in range(n, size):
+        atr = (atr * (n - 1) + tr[i]) / n
+        basic_ub = hl2[i] + f * atr
+        basic_lb = hl2[i] - f * atr
+        ub = min(basic_ub, ub) if close_values[i - 1] <= ub else basic_ub
+        lb = max(basic_lb, lb) if close_values[i - 1] >= lb else basic_lb
+        # the trend turns when the close crosses the band it is following
+        up = close_values[i] >= lb if up else close_values[i] > ub
+        upper[i], lower[i], trend[i] = ub, lb, up
+        supertrend[i] = lb if up else ub
+
+    return supertrend, trend, upper, lower
+
+
 def supertrend(df, f, n):  # df is the dataframe, n is the period, f is the factor; f=3, n=7 are commonly used.
-    # Calculation of ATR
-    pd.options.mode.chained_assignment = None
-    df["H-L"] = abs(df["high"] - df["low"])
-    df["H-PC"] = abs(df["high"] - df["close"].shift(1))
-    df["L-PC"] = abs(df["low"] - df["close"].shift(1))
-    df["TR"] = df[["H-L", "H-PC", "L-PC"]].max(axis=1)
-    df["ATR"] = np.nan
-    df.ix[n - 1, "ATR"] = df["TR"][: n - 1].mean()  # .ix is deprecated from pandas verion- 0.19
-    for i in range(n, len(df)):
-        df["ATR"][i] = (df["ATR"][i - 1] * (n - 1) + df["TR"][i]) / n
-
-    # Calculation of SuperTrend
-    df["Upper Basic"] = (df["high"] + df["low"]) / 2 + (f * df["ATR"])
-    df["Lower Basic"] = (df["high"] + df["low"]) / 2 - (f * df["ATR"])
-    df["Upper Band"] = df["Upper Basic"]
-    df["Lower Band"] = df["Lower Basic"]
-    df["Trend"] = True  # Up(case of Bull or Long)-> True, Dn-> False
-    df["TSL"] = None  # Trailing Stop Loss Value
-    for i in range(n, len(df)):
-        if df["close"][i - 1] <= df["Upper Band"][i - 1]:
-            df["Upper Band"][i] = min(df["Upper Basic"][i], df["Upper Band"][i - 1])
-        else:
-            df["Upper Band"][i] = df["Upper Basic"][i]
-    for i in range(n, len(df)):
-        if df["close"][i - 1] >= df["Lower Band"][i - 1]:
-            df["Lower Band"][i] = max(df["Lower Basic"][i], df["Lower Band"][i - 1])
-        else:
-            df["Lower Band"][i] = df["Lower Basic"][i]
-    df["SuperTrend"] = np.nan
-    for i in df["SuperTrend"]:
-        if df["close"][n - 1] <= df["Upper Band"][n - 1]:
-            df["SuperTrend"][n - 1] = df["Upper Band"][n - 1]
-            df["Trend"][n - 1] = False
-            df["TSL"][n - 1] = df["Upper Band"][n - 1]
-        elif df["close"][n - 1] > df["Upper Band"][i]:
-            df["SuperTrend"][n - 1] = df["Lower Band"][n - 1]
-            df["Trend"][n - 1] = True
-            df["TSL"][n - 1] = df["Lower Band"][n - 1]
-    for i in range(n, len(df)):
-        if df["SuperTrend"][i - 1] == df["Upper Band"][i - 1] and df["close"][i] <= df["Upper Band"][i]:
-            df["SuperTrend"][i] = df["Upper Band"][i]
-            df["Trend"][i] = False
-            df["TSL"][i] = df["Upper Band"][i]
-        elif df["SuperTrend"][i - 1] == df["Upper Band"][i - 1] and df["close"][i] >= df["Upper Band"][i]:
-            df["SuperTrend"][i] = df["Lower Band"][i]
-            df["Trend"][i] = True
-            df["TSL"][i] = df["Lower Band"][i]
-        elif df["SuperTrend"][i - 1] == df["Lower Band"][i - 1] and df["close"][i] >= df["Lower Band"][i]:
-            df["SuperTrend"][i] = df["Lower Band"][i]
-            df["Trend"][i] = True
-            df["TSL"][i] = df["Lower Band"][i]
-        elif df["SuperTrend"][i - 1] == df["Lower Band"][i - 1] and df["close"][i] <= df["Lower Band"][i]:
-            df["SuperTrend"][i] = df["Upper Band"][i]
-            df["Trend"][i] = False
-            df["TSL"][i] = df["Upper Band"][i]
-    return df
+    """
+    SuperTrend of an OHLC data frame
+    :return: new data frame, df with the SuperTrend, Trend, TSL, Upper Band and Lower Band columns added
+    """
+    values, trend, upper, lower = supertrend_values(df["high"].values, df["low"].values, df["close"].values, f, n)
+    return df.assign(**{
+        "Upper Band": upper,
+        "Lower Band": lower,
+        "Trend": trend,
+        "TSL": values,
+        "SuperTrend": values,
+    })
@@ -0,0 +1,301 @@
+# coding: UTF-8
+
+import asyncio
+import functools
+import json
+import threading
+import traceback
+import urllib
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from src import logger, notify
+from src.binance_futures_api import Client
+from src.binance_futures_websocket import BinanceFuturesConnection
+from src.config import config as conf
+from src.exceptions import BinanceAPIException, BinanceRequestException
+
+
+class AsyncRuntime:
+    """
+    asyncio event loop of the process, on its own thread.
+    The websocket readers, keep alive timers and REST requests of the live exchanges
+    run on it as tasks, so every stream of every account fits in one thread and waits
+    on the network without holding a thread each.
+    Blocking calls, like the synchronous REST client of the exchanges, run on a pool
+    of worker threads so they do not stall the loop.
+    """
+    # Runtime of the process
+    instance = None
+    # Lock of the instance
+    instance_lock = threading.Lock()
+    # Number of worker threads of the blocking calls
+    workers = 4
+
+    @classmethod
+    def get(cls):
+        """
+        runtime of the process, it is started on the first call
+        """
+        with cls.instance_lock:
+            if cls.instance is None:
+                cls.instance = cls(cls.workers)
+            return cls.instance
+
+    def __init__(self, workers=4):
+        """
+        constructor
+        :param workers: number of worker threads of the blocking calls
+        """
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="runtime")
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self.thread = threading.Thread(target=self.__run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """
+        run a coroutine on the loop, from any thread
+        :return: concurrent.futures.Future of the result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """
+        await a blocking call run on a worker thread
+        """
+        return await self.loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    def stop(self):
+        """
+        stop the loop and its worker threads
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=False)
+
+
+class AsyncResponse:
+    """
+    Response of an aiohttp request read in full, with the attributes of a requests
+    response that the API exceptions use.
+    """
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncClient(Client):
+    """
+    Binance futures REST client on aiohttp.
+    The endpoints of Client are coroutines, for instance
+    `ret, res = await client.futures_position_information()`,
+    the requests of a client share one connection pool.
+    """
+    # aiohttp session, opened by the first request
+    session = None
+
+    def _init_session(self):
+        return None
+
+    async def _request(self, method, uri, signed, force_params=False, **kwargs):
+        kwargs = self._request_kwargs(method, signed, force_params, **kwargs)
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(headers={'Accept': 'application/json',
+                                                          'User-Agent': 'binance/python',
+                                                          'X-MBX-APIKEY': self.API_KEY or ''})
+        data = kwargs.get('data')
+        async with self.session.request(method.upper(), uri,
+                                        params=kwargs.get('params'),
+                                        data=urllib.parse.urlencode(data) if data else None,
+                                        headers={'Content-Type': 'application/x-www-form-urlencoded'} if data else None,
+                                        timeout=aiohttp.ClientTimeout(total=kwargs['timeout'])) as response:
+            response = AsyncResponse(response.status, await response.text())
+
+        if not str(response.status_code).startswith('2'):
+            raise BinanceAPIException(response)
+        try:
+            return response.json(), response
+        except ValueError:
+            raise BinanceRequestException('Invalid Response: %s' % response.text)
+
+    async def stream_get_listen_key(self):
+        """Start a new user data stream and return the listen key
+        """
+        ret, res = await self._post('listenKey', False, data={})
+        return ret['listenKey']
+
+    async def stream_keepalive(self):
+        """PING a user data stream to prevent a time out.
+        """
+        return await self._put('listenKey', False, data={})
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class AsyncBinanceFuturesConnection(BinanceFuturesConnection):
+    """
+    Shared Binance websocket connection of an account on the AsyncRuntime.
+    The socket is read by an aiohttp task of the runtime loop and the listen key is
+    kept alive by another one, with the async REST client.
+    The messages are decoded on the loop and queued to the event queues of the
+    subscribers, whose handlers run on their own worker threads. The queues never
+    block the loop, a full queue drops its events.
+    """
+    # (account, testnet) -> open connection
+    connections = {}
+    # Seconds before reconnecting a lost socket
+    reconnect_delay = 1
+
+    def open(self):
+        """
+        start the reader and keep alive tasks on the runtime
+        """
+        self.runtime = AsyncRuntime.get()
+        self.client = AsyncClient(api_key=conf['binance_keys'][self.account]['API_KEY'],
+                                  api_secret=conf['binance_keys'][self.account]['SECRET_KEY'])
+        self.ws = None
+        self.keep_alive = None
+        self.reader = self.runtime.submit(self.__read())
+
+    async def __get_listen_key(self):
+        """
+        authenticate user data streams
+        """
+        if len(self.client.API_KEY) > 0 and len(self.client.API_SECRET) > 0:
+            self.listenKey = await self.client.stream_get_listen_key()
+        else:
+            logger.info("WebSocket is not able to get listenKey for user data streams")
+
+    async def __keep_alive_user_datastream(self):
+        """
+        keep alive user data stream, needs to ping every 60m
+        """
+        await asyncio.sleep(10)
+        while self.is_running:
+            try:
+                await self.client.stream_keepalive()
+            except Exception as e:
+                logger.error(e)
+            await asyncio.sleep(3480)
+
+    async def __read(self):
+        """
+        read the socket, it is reconnected until the connection is closed
+        """
+        try:
+            await self.__get_listen_key()
+        except Exception as e:
+            logger.error(e)
+        if self.listenKey is not None:
+            self.keep_alive = asyncio.ensure_future(self.__keep_alive_user_datastream())
+
+        session = aiohttp.ClientSession()
+        try:
+            while self.is_running:
+                try:
+                    async with session.ws_connect(self.endpoint, heartbeat=180) as ws:
+                        self.ws = ws
+                        self.on_connected()
+                        async for message in ws:
+                            if message.type == aiohttp.WSMsgType.TEXT:
+                                self.dispatch(message.data)
+                            elif message.type == aiohttp.WSMsgType.ERROR:
+                                break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.__on_error(e)
+                finally:
+                    self.ws = None
+                    self.on_disconnected()
+
+                if self.is_running:
+                    logger.info("Websocket restart")
+                    notify("Websocket restart")
+                    await asyncio.sleep(self.reconnect_delay)
+        finally:
+            await session.close()
+            await self.client.close()
+
+    def __on_error(self, error):
+        logger.error(error)
+        logger.error(traceback.format_exc())
+
+        notify(f"Error occurred. {error}")
+        notify(traceback.format_exc())
+
+    def send(self, message):
+        """
+        send a message on the socket from any thread
+        """
+        ws = self.ws
+        if ws is not None and not ws.closed:
+            self.runtime.submit(ws.send_str(message))
+
+    def renew_listen_key(self):
+        """
+        get a new listen key and subscribe its user data stream
+        """
+        async def renew():
+            await self.__get_listen_key()
+            self.sync()
+
+        self.runtime.submit(renew())
+
+    def close(self):
+        """
+        close websocket
+        """
+        self.is_running = False
+
+        async def close():
+            if self.keep_alive is not None:
+                self.keep_alive.cancel()
+            if self.ws is not None:
+                await self.ws.close()
+
+        self.runtime.submit(close())
+
+
+class AsyncExchange:
+    """
+    Awaitable API of an exchange for strategies running on the AsyncRuntime.
+    Every method of the exchange is a coroutine, for instance
+    `await AsyncExchange(exchange).entry("Long", True, 1)`, run on a worker thread
+    of the runtime so its REST calls do not stall the loop. Other attributes are read
+    from the exchange.
+    """
+
+    def __init__(self, exchange, runtime=None):
+        """
+        constructor
+        :param exchange: exchange
+        :param runtime: AsyncRuntime, the runtime of the process by default
+        """
+        self.exchange = exchange
+        self.runtime = runtime if runtime is not None else AsyncRuntime.get()
+
+    def __getattr__(self, name):
+        value = getattr(self.exchange, name)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        async def call(*args, **kwargs):
+            return await self.runtime.run_blocking(value, *args, **kwargs)
+
+        return call
@@ -0,0 +1,80 @@
+# coding: UTF-8
+
+import numpy as np
+
+
+class BacktestEngine:
+    """
+    Bar loop for the backtest exchanges.
+    The OHLCV frame is converted once into contiguous numpy arrays and every bar
+    is handed to the strategy as zero-copy window views into those arrays,
+    instead of slicing the DataFrame with iloc on every bar.
+    """
+    # Timestamp axis (index of the OHLCV frame)
+    timestamps = None
+    # Price and volume columns
+    open = None
+    high = None
+    low = None
+    close = None
+    volume = None
+    # Window length handed to the strategy
+    ohlcv_len = 100
+
+    def __init__(self, df_ohlcv, ohlcv_len):
+        """
+        constructor
+        :param df_ohlcv: OHLCV data frame
+        :param ohlcv_len: length of the window passed to the strategy
+        """
+        self.ohlcv_len = ohlcv_len
+        self.timestamps = df_ohlcv.index
+        self.open = self.__column(df_ohlcv, "open")
+        self.high = self.__column(df_ohlcv, "high")
+        self.low = self.__column(df_ohlcv, "low")
+        self.close = self.__column(df_ohlcv, "close")
+        self.volume = self.__column(df_ohlcv, "volume")
+
+    @staticmethod
+    def __column(df_ohlcv, name):
+        """
+        read only contiguous float64 copy of a column
+        """
+        values = np.ascontiguousarray(df_ohlcv[name].values, dtype=np.float64)
+        values.flags.writeable = False
+        return values
+
+    def __len__(self):
+        """
+        number of bars the strategy is evaluated on
+        """
+        return max(len(self.close) - self.ohlcv_len, 0)
+
+    def window(self, i):
+        """
+        window views ending at the bar i + ohlcv_len - 1
+        :param i: bar number starting from 0
+        :return: open, close, high, low, volume
+        """
+        end = i + self.ohlcv_len
+        return self.open[i:end], self.close[i:end], self.high[i:end], self.low[i:end], self.volume[i:end]
+
+    def timestamp(self, i):
+        """
+        timestamp of the last bar in the window i
+        """
+        return self.timestamps[i + self.ohlcv_len - 1]
+
+    def bars(self):
+        """
+        iterate over all windows, same windows as df_ohlcv.iloc[i:i + ohlcv_len]
+        :return: generator of (i, timestamp, open, close, high, low, volume)
+        """
+        n = self.ohlcv_len
+        # iterating the index converts timestamps in batches, scalar lookups are much slower
+        timestamps = self.timestamps[n - 1:n - 1 + len(self)]
+        open, close, high, low, volume = self.open, self.close, self.high, self.low, self.volume
+
+        for i, timestamp in enumerate(timestamps):
+            end = i + n
+            yield i, timestamp, open[i:end], close[i:end], high[i:end], low[i:end], volume[i:end]
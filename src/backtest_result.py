@@ -0,0 +1,111 @@
+# coding: UTF-8
+
+import numpy as np
+import pandas as pd
+
+
+class BacktestResult:
+    """
+    Results of a back test, recorded by bar into arrays sized for the OHLCV data
+    when the back test starts: profit, drawdown, entry / exit signals and the series
+    of the strategy plots.
+    The bars before the first evaluated bar keep the start values, the bars after the
+    last evaluated one the values of the end of the back test.
+    """
+    # Bars evaluated by the back test, from start to end - 1
+    start = 0
+    end = 0
+
+    def __init__(self, index, start, end):
+        """
+        constructor
+        :param index: time index of the OHLCV data
+        :param start: first evaluated bar
+        :param end: bar after the last evaluated bar
+        """
+        self.index = index
+        self.start = start
+        self.end = end
+        self.size = len(index)
+        # profit at the close of every bar
+        self.balance = np.zeros(self.size)
+        # session drawdown in % at the close of every bar
+        self.drawdown = np.zeros(self.size)
+        self.buy = np.zeros(self.size, dtype=bool)
+        self.sell = np.zeros(self.size, dtype=bool)
+        self.close = np.zeros(self.size, dtype=bool)
+        # name -> values of the plot
+        self.plots = {}
+        # name -> {'color': color, 'overlay': overlay}
+        self.plot_options = {}
+        # last recorded bar
+        self.last = start - 1
+
+    def record(self, i, balance, drawdown):
+        """
+        record the profit and drawdown at the close of a bar
+        :param i: bar
+        :param balance: profit
+        :param drawdown: drawdown in %
+        """
+        self.balance[i] = balance
+        self.drawdown[i] = drawdown
+        self.last = i
+
+    def finish(self, balance, drawdown):
+        """
+        record the profit and drawdown of the end of the back test at the last recorded bar,
+        the bars after it keep these values
+        """
+        i = max(self.last, 0)
+        self.balance[i:] = balance
+        self.drawdown[i:] = drawdown
+
+    def plot(self, name, i, value, color, overlay=True):
+        """
+        record the value of a plot at a bar
+        """
+        values = self.plots.get(name)
+        if values is None:
+            values = self.plots[name] = np.full(self.size, np.nan)
+            self.plot_options[name] = {'color': color, 'overlay': overlay}
+        values[i] = value
+
+    @property
+    def profit(self):
+        """
+        profit of the back test
+        """
+        return self.balance[-1] if self.size > 0 else 0.0
+
+    @property
+    def equity(self):
+        """
+        profit at the close of the evaluated bars
+        """
+        return pd.Series(self.balance[self.start:self.end], index=self.index[self.start:self.end])
+
+    @property
+    def drawdowns(self):
+        """
+        drawdown in % at the close of the evaluated bars
+        """
+        return pd.Series(self.drawdown[self.start:self.end], index=self.index[self.start:self.end])
+
+    @property
+    def buy_signals(self):
+        return self.index[self.buy]
+
+    @property
+    def sell_signals(self):
+        return self.index[self.sell]
+
+    @property
+    def close_signals(self):
+        return self.index[self.close]
+
+    def plot_frame(self):
+        """
+        data frame of the plots
+        """
+        return pd.DataFrame(self.plots, index=self.index)
@@ -0,0 +1,374 @@
+# coding: UTF-8
+
+import numpy as np
+import pandas as pd
+
+from src import delta, resample
+
+# nanoseconds of a day, bins are anchored to the start of the day like pandas resample
+DAY_NS = 24 * 60 * 60 * 10 ** 9
+# nanoseconds of a minute, the smallest bar size
+MINUTE_NS = 60 * 10 ** 9
+
+
+def to_ns(timestamp):
+    """
+    convert a timestamp to int nanoseconds since epoch (UTC)
+    """
+    return pd.Timestamp(timestamp).value
+
+
+def to_timestamp(ns):
+    """
+    convert int nanoseconds since epoch to a UTC timestamp
+    """
+    return pd.Timestamp(ns, tz="UTC")
+
+
+class Bar:
+    """
+    OHLCV bar decoded from a websocket message.
+    A slotted record instead of a one-row data frame, the receive thread only parses
+    the numbers and the consumer builds a data frame when it needs one.
+    """
+    __slots__ = ("timestamp", "open", "high", "low", "close", "volume")
+
+    def __init__(self, timestamp, open, high, low, close, volume):
+        """
+        constructor
+        :param timestamp: bar time in nanoseconds since epoch (UTC)
+        """
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def __repr__(self):
+        return f"Bar({to_timestamp(self.timestamp)}, open={self.open}, high={self.high}, low={self.low}, " \
+               f"close={self.close}, volume={self.volume})"
+
+    def __eq__(self, other):
+        return isinstance(other, Bar) and all(getattr(self, k) == getattr(other, k) for k in Bar.__slots__)
+
+    def to_data_frame(self):
+        """
+        the bar as a one-row data frame, same as src.to_data_frame
+        """
+        return bars_to_data_frame([self])
+
+
+def bars_to_data_frame(bars):
+    """
+    bars as a data frame indexed by UTC timestamps, same as src.to_data_frame
+    :param bars: list of Bar
+    """
+    index = pd.DatetimeIndex(np.array([bar.timestamp for bar in bars], dtype=np.int64), tz="UTC", name="timestamp")
+    return pd.DataFrame({
+        "high": [bar.high for bar in bars],
+        "low": [bar.low for bar in bars],
+        "open": [bar.open for bar in bars],
+        "close": [bar.close for bar in bars],
+        "volume": [bar.volume for bar in bars]
+    }, index=index)
+
+
+class BarBuffer:
+    """
+    Fixed capacity ring buffer of closed OHLCV bars.
+    Every value is written twice, at slot and slot + capacity, so the last n bars
+    are always one contiguous slice and appending is O(1).
+    """
+    # Max number of bars kept
+    capacity = 0
+    # Number of bars in the buffer
+    count = 0
+    # Next slot to write
+    head = 0
+
+    def __init__(self, capacity):
+        """
+        constructor
+        :param capacity: max number of bars kept
+        """
+        self.capacity = max(int(capacity), 1)
+        self.count = 0
+        self.head = 0
+        self.__timestamp = np.zeros(2 * self.capacity, dtype=np.int64)
+        self.__open = np.zeros(2 * self.capacity, dtype=np.float64)
+        self.__high = np.zeros(2 * self.capacity, dtype=np.float64)
+        self.__low = np.zeros(2 * self.capacity, dtype=np.float64)
+        self.__close = np.zeros(2 * self.capacity, dtype=np.float64)
+        self.__volume = np.zeros(2 * self.capacity, dtype=np.float64)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, open, high, low, close, volume):
+        """
+        append a closed bar
+        :param timestamp: bar label in nanoseconds
+        """
+        for i in (self.head, self.head + self.capacity):
+            self.__timestamp[i] = timestamp
+            self.__open[i] = open
+            self.__high[i] = high
+            self.__low[i] = low
+            self.__close[i] = close
+            self.__volume[i] = volume
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def __slice(self):
+        end = self.head + self.capacity
+        return slice(end - self.count, end)
+
+    def last_timestamp(self):
+        """
+        label of the last closed bar in nanoseconds, None when empty
+        """
+        if self.count == 0:
+            return None
+        return int(self.__timestamp[self.head + self.capacity - 1])
+
+    def timestamps(self):
+        """
+        bar labels in nanoseconds, oldest first
+        """
+        return self.__timestamp[self.__slice()].copy()
+
+    def arrays(self):
+        """
+        copies of the buffered bars in the order the strategy takes them
+        :return: open, close, high, low, volume
+        """
+        s = self.__slice()
+        return self.__open[s].copy(), self.__close[s].copy(), self.__high[s].copy(), \
+            self.__low[s].copy(), self.__volume[s].copy()
+
+    def to_data_frame(self):
+        """
+        buffered bars as a data frame indexed by UTC timestamps
+        """
+        s = self.__slice()
+        index = pd.DatetimeIndex(self.__timestamp[s], tz="UTC", name="timestamp")
+        return pd.DataFrame({
+            "open": self.__open[s],
+            "high": self.__high[s],
+            "low": self.__low[s],
+            "close": self.__close[s],
+            "volume": self.__volume[s]
+        }, index=index)
+
+
+class BarBuilder:
+    """
+    Incremental OHLCV aggregator.
+    Base bars (for instance the kline stream) are folded into the currently forming
+    bar of bin_size. When a base bar of a later bin arrives, or a final base bar
+    completes the bin, the forming bar is closed and appended to the buffer.
+    Bins are closed on the right and labeled on the right, same as src.resample.
+    Each update is O(1) regardless of the buffer length.
+    """
+    # Time frame
+    bin_size = "1h"
+    # Closed bars
+    buffer = None
+    # Called with (timestamp, open, high, low, close, volume) of every closed bar
+    on_close = None
+
+    def __init__(self, bin_size, capacity):
+        """
+        constructor
+        :param bin_size: time frame of the built bars
+        :param capacity: number of closed bars kept
+        """
+        self.bin_size = bin_size
+        self.on_close = None
+        self.bin_ns = int(delta(bin_size).total_seconds()) * 10 ** 9
+        self.buffer = BarBuffer(capacity)
+        self.origin = None
+        # forming bar label and the aggregate of its finished base bars
+        self.label = None
+        self.agg = None
+        # base bar that is still updating
+        self.current = None
+
+    def bin_label(self, timestamp):
+        """
+        label of the bin the base bar belongs to
+        :param timestamp: base bar label in nanoseconds
+        """
+        if self.origin is None:
+            self.origin = timestamp - timestamp % DAY_NS
+        return self.origin - (-(timestamp - self.origin) // self.bin_ns) * self.bin_ns
+
+    def seed(self, data_frame):
+        """
+        append already closed bars of bin_size, for instance the initial REST fetch
+        :param data_frame: resampled OHLCV data frame
+        """
+        for timestamp, open, high, low, close, volume in zip(data_frame.index,
+                                                              data_frame["open"].values,
+                                                              data_frame["high"].values,
+                                                              data_frame["low"].values,
+                                                              data_frame["close"].values,
+                                                              data_frame["volume"].values):
+            # empty bins produced by resample
+            if open != open:
+                continue
+            timestamp = to_ns(timestamp)
+            last = self.buffer.last_timestamp()
+            if last is not None and timestamp <= last:
+                continue
+            self.bin_label(timestamp)
+            self.buffer.append(timestamp, open, high, low, close, volume)
+
+    def update(self, timestamp, open, high, low, close, volume, final=False):
+        """
+        fold a base bar into the forming bar
+        :param timestamp: base bar label (close time) in nanoseconds
+        :param final: the base bar will not be updated anymore
+        :return: True if a bar was closed
+        """
+        if open != open:
+            return False
+        last = self.buffer.last_timestamp()
+        if last is not None and timestamp <= last:
+            return False
+
+        label = self.bin_label(timestamp)
+        closed = False
+
+        if self.label is not None and label > self.label:
+            self.__close_bar()
+            closed = True
+
+        if self.label is None:
+            self.label = label
+            self.agg = None
+            self.current = [timestamp, open, high, low, close, volume]
+        elif timestamp == self.current[0]:
+            # same base bar updated again
+            self.current = [timestamp, self.current[1], high, low, close, volume]
+        elif timestamp > self.current[0]:
+            self.agg = self.__merge(self.agg, self.current)
+            self.current = [timestamp, open, high, low, close, volume]
+        else:
+            return closed
+
+        if final and timestamp == self.label:
+            self.__close_bar()
+            closed = True
+
+        return closed
+
+    def forming(self):
+        """
+        the bar that is still forming
+        :return: [label, open, high, low, close, volume] or None
+        """
+        if self.label is None:
+            return None
+        bar = self.__merge(self.agg, self.current)
+        bar[0] = self.label
+        return bar
+
+    def last_timestamp(self):
+        """
+        label of the last closed bar in nanoseconds
+        """
+        return self.buffer.last_timestamp()
+
+    def arrays(self):
+        """
+        closed bars in the order the strategy takes them
+        :return: open, close, high, low, volume
+        """
+        return self.buffer.arrays()
+
+    def __close_bar(self):
+        bar = self.forming()
+        self.buffer.append(*bar)
+        self.label = None
+        self.agg = None
+        self.current = None
+        if self.on_close is not None:
+            self.on_close(*bar)
+
+    @staticmethod
+    def __merge(agg, bar):
+        if agg is None:
+            return list(bar)
+        return [bar[0], agg[1], max(agg[2], bar[2]), min(agg[3], bar[3]), bar[4], agg[5] + bar[5]]
+
+
+class TimeframeStore:
+    """
+    Bars of several time frames built from the same stream of closed bars.
+    Every time frame has its own BarBuilder, so keeping them up to date costs O(1)
+    per closed bar and security() only builds a new data frame when a bar of
+    that time frame has closed.
+    """
+    # Number of bars kept per time frame
+    capacity = 100
+
+    def __init__(self, capacity):
+        """
+        constructor
+        :param capacity: number of closed bars kept per time frame
+        """
+        self.capacity = capacity
+        self.builders = {}
+        # bin_size -> (label of the last closed bar, data frame)
+        self.frames = {}
+
+    def __contains__(self, bin_size):
+        return bin_size in self.builders
+
+    def register(self, bin_size, data_frame):
+        """
+        start tracking a time frame
+        :param bin_size: time frame
+        :param data_frame: closed bars received so far, in a finer or equal time frame
+        """
+        builder = BarBuilder(bin_size, self.capacity)
+
+        if data_frame is not None and len(data_frame) > 0:
+            last = data_frame.index[-1]
+            closed = resample(data_frame, bin_size)
+            builder.seed(closed[closed.index <= last])
+            if builder.last_timestamp() is not None:
+                data_frame = data_frame[data_frame.index > to_timestamp(builder.last_timestamp())]
+            for timestamp, open, high, low, close, volume in zip(data_frame.index,
+                                                                  data_frame["open"].values,
+                                                                  data_frame["high"].values,
+                                                                  data_frame["low"].values,
+                                                                  data_frame["close"].values,
+                                                                  data_frame["volume"].values):
+                builder.update(to_ns(timestamp), open, high, low, close, volume, final=True)
+
+        self.builders[bin_size] = builder
+        self.frames.pop(bin_size, None)
+
+    def update(self, timestamp, open, high, low, close, volume):
+        """
+        fold a closed bar into every tracked time frame
+        :param timestamp: bar label in nanoseconds
+        """
+        for builder in self.builders.values():
+            builder.update(timestamp, open, high, low, close, volume, final=True)
+
+    def security(self, bin_size):
+        """
+        closed bars of a tracked time frame
+        :param bin_size: time frame
+        :return: data frame indexed by UTC timestamps
+        """
+        last = self.builders[bin_size].last_timestamp()
+        frame = self.frames.get(bin_size)
+        if frame is None or frame[0] != last:
+            frame = (last, self.builders[bin_size].buffer.to_data_frame())
+            self.frames[bin_size] = frame
+        return frame[1]
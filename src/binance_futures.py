@@ -3,12 +3,12 @@
 import json
 import math
 import os
+import threading
 import traceback
+from contextlib import contextmanager
 from datetime import datetime, timezone
 import time
 
-# import threading
-
 import pandas as pd
 from bravado.exception import HTTPNotFound
 from pytz import UTC
@@ -17,10 +17,14 @@ from src import logger, allowed_range, to_data_frame, resample, delta, FatalErro
 from src import retry_binance_futures as retry
 from src.config import config as conf
 
+from src.bar_builder import BarBuilder, TimeframeStore, to_ns, to_timestamp, MINUTE_NS
+from src.indicators import Indicators
 from src.binance_futures_api import Client
-from src.binance_futures_websocket import BinanceFuturesWs
+from src.binance_futures_websocket import BinanceFuturesWs, BinanceFuturesConnection
+from src.async_runtime import AsyncBinanceFuturesConnection
 
 # Class for production transaction
+from src.order_manager import OrderManager
 from src.orderbook import OrderBook
 
 
@@ -41,10 +45,16 @@ class BinanceFutures:
     position_size = None
     # Entry price
     entry_price = None
-    # Margin
+    # Margin, asset -> balance
     margin = None
     # Account information
     account_information = None
+    # Seconds between REST reconciliations of the position and margin fed by the user data stream
+    reconcile_interval = 60
+    # Time the position was last confirmed by REST or the user data stream
+    position_time = 0
+    # Time the margin was last confirmed by REST or the user data stream, asset -> time
+    margin_time = None
     # Time Frame
     bin_size = "1h"
     # Binance futures client
@@ -59,8 +69,16 @@ class BinanceFutures:
     enable_trade_log = True
     # OHLCV length
     ohlcv_len = 100
-    # OHLCV data
-    data = None
+    # OHLCV bar builder
+    ohlcv = None
+    # Other time frames requested through security
+    timeframes = None
+    # Streaming indicators requested through indicator
+    indicators = None
+    # Function computing the signal arrays of an OHLCV data frame, Bot.signals
+    signals = None
+    # (label of the last closed bar, signal arrays) computed by signals
+    signal_values = None
     # Profit target long and short for a simple limit exit strategy
     sltp_values = {"profit_long": 0, "profit_short": 0, "stop_long": 0, "stop_short": 0, "eval_tp_next_candle": False}
     # Round decimals
@@ -75,6 +93,14 @@ class BinanceFutures:
     best_bid_price = None
     # best ask price
     best_ask_price = None
+    # Order manager running the TP/SL replacements
+    order_manager = None
+    # Order book of the depth stream, subscribed when first requested
+    ob = None
+    # Max number of orders of a batch order request
+    batch_size = 5
+    # Read the websocket streams on the asyncio runtime instead of a websocket thread
+    async_runtime = False
 
     def __init__(self, account, pair, demo=False, threading=True):
         """
@@ -88,6 +114,8 @@ class BinanceFutures:
         self.pair = pair
         self.demo = demo
         self.is_running = threading
+        # thread id -> orders queued by batch_orders
+        self.batches = {}
 
     def __init_client(self):
         """
@@ -144,13 +172,17 @@ class BinanceFutures:
         """
         self.__init_client()
 
-        # if self.margin is not None:
-        #     return self.margin[0]
-        # else:  # when the WebSocket cant get it
+        if self.margin is not None and asset in self.margin and \
+                time.time() - self.margin_time[asset] < self.reconcile_interval:
+            return dict(self.margin[asset])
+
+        # reconcile the margin fed by the user data stream
         ret = retry(lambda: self.client.futures_account_balance_v2())
         if len(ret) > 0:
-            self.margin = [m for m in ret if m["asset"] == asset]
-            return self.margin[0]
+            now = time.time()
+            self.margin = {m["asset"]: m for m in ret}
+            self.margin_time = {m["asset"]: now for m in ret}
+            return dict(self.margin[asset]) if asset in self.margin else None
         else:
             return None
 
@@ -177,18 +209,25 @@ class BinanceFutures:
         """
         self.__init_client()
 
-        # Unfortunately we cannot rely just on the WebSocket updates (for instance PnL) since binance is not pushing updates for the ACCOUNT_UPDATE stream often enough
+        # The position is kept up to date by the ACCOUNT_UPDATE stream, but binance is not pushing updates often enough
+        # for the PnL so it is calculated from the market price, and the position is reconciled with REST periodically
+        # or after a fill that was not followed by an ACCOUNT_UPDATE yet
         # read more here https://binance-docs.github.io/apidocs/futures/en/#event-balance-and-position-update
 
-        # if self.position is not None:
-
-        #     return self.position[0]
-        # else:  # when the WebSocket cant get it
+        if self.position is not None and time.time() - self.position_time < self.reconcile_interval:
+            # a copy, the cached position only changes with the stream and REST
+            position = dict(self.position[0])
+            if self.market_price != 0:
+                position["unRealizedProfit"] = (self.market_price - float(position["entryPrice"])) * float(position["positionAmt"])
+            return position
 
         ret = retry(lambda: self.client.futures_position_information())
         if len(ret) > 0:
             self.position = [p for p in ret if p["symbol"] == self.pair]
-            return self.position[0]
+            self.position_time = time.time()
+            self.position_size = float(self.position[0]["positionAmt"])
+            self.entry_price = float(self.position[0]["entryPrice"])
+            return dict(self.position[0])
         else:
             return None
 
@@ -198,9 +237,6 @@ class BinanceFutures:
         :return:
         """
         self.__init_client()
-        if self.position_size is not None:  # and self.position_size == 0:
-            return self.position_size
-
         position = self.get_position()
 
         if position["symbol"] == self.pair:
@@ -215,9 +251,6 @@ class BinanceFutures:
         :return:
         """
         self.__init_client()
-        if self.entry_price is not None:
-            return self.entry_price
-
         position = self.get_position()
 
         if position["symbol"] == self.pair:
@@ -336,48 +369,59 @@ class BinanceFutures:
 
     def __new_order(self, ord_id, side, ord_qty, limit=0, stop=0, take_profit=0, post_only=False, reduce_only=False, trailing_stop=0, activationPrice=0, close_position=False):
         """
-        create an order
+        create an order, queued instead when a batch is open on this thread
         """
         # removes "+" from order suffix, because of the new regular expression rule for newClientOrderId updated as ^[\.A-Z\:/a-z0-9_-]{1,36}$ (2021-01-26)
         ord_id = ord_id.replace("+", "k")
+        params = {"symbol": self.pair, "newClientOrderId": ord_id, "side": side, "quantity": ord_qty}
 
         if trailing_stop > 0 and activationPrice > 0:
             ord_type = "TRAILING_STOP_MARKET"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, activationPrice=activationPrice, callbackRate=trailing_stop))
+            params.update(activationPrice=activationPrice, callbackRate=trailing_stop)
         elif trailing_stop > 0:
             ord_type = "TRAILING_STOP_MARKET"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, callbackRate=trailing_stop))
+            params.update(callbackRate=trailing_stop)
         elif limit > 0 and post_only:
             ord_type = "LIMIT"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, price=limit, timeInForce="GTX"))
+            params.update(price=limit, timeInForce="GTX")
         elif limit > 0 and stop > 0 and reduce_only:
             ord_type = "STOP"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, price=limit, stopPrice=stop, reduceOnly="true"))
+            params.update(price=limit, stopPrice=stop, reduceOnly="true")
         elif limit > 0 and reduce_only:
             ord_type = "LIMIT"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, price=limit, reduceOnly="true", timeInForce="GTC"))
+            params.update(price=limit, reduceOnly="true", timeInForce="GTC")
         elif limit > 0 and stop > 0:
             ord_type = "STOP"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, price=limit, stopPrice=stop))
+            params.update(price=limit, stopPrice=stop)
         elif limit > 0:
             ord_type = "LIMIT"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, price=limit, timeInForce="GTC"))
+            params.update(price=limit, timeInForce="GTC")
         elif stop > 0 and reduce_only:
             ord_type = "STOP_MARKET"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, stopPrice=stop, reduceOnly="true"))
+            params.update(stopPrice=stop, reduceOnly="true")
         elif take_profit > 0 and reduce_only:
             ord_type = "TAKE_PROFIT_MARKET"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, stopPrice=take_profit, reduceOnly="true"))
+            params.update(stopPrice=take_profit, reduceOnly="true")
         elif stop > 0:
             ord_type = "STOP"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, stopPrice=stop))
+            params.update(stopPrice=stop)
         elif post_only:  # limit order with post only
             ord_type = "LIMIT"
+            params.update(timeInForce="GTX")
+        else:
+            ord_type = "MARKET"
+        params["type"] = ord_type
+
+        batch = self.batches.get(threading.get_ident())
+
+        if ord_type == "LIMIT" and post_only and limit == 0:
+            # chases the best price, can not be batched
             i = 0
             while True:
                 prices = self.get_orderbook_ticker()
                 limit = float(prices["bidPrice"]) if side == "Buy" else float(prices["askPrice"])
-                retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty, price=limit, timeInForce="GTX"))
+                params["price"] = limit
+                retry(lambda: self.client.futures_create_order(**params))
                 time.sleep(4)
 
                 self.cancel(ord_id)
@@ -390,10 +434,19 @@ class BinanceFutures:
                     break
 
             self.cancel_all()
+        elif batch is not None:
+            # logged when the batch is sent and the order accepted
+            batch.append((params, (ord_id, ord_type, side, ord_qty, limit, stop)))
+            return
         else:
-            ord_type = "MARKET"
-            retry(lambda: self.client.futures_create_order(symbol=self.pair, type=ord_type, newClientOrderId=ord_id, side=side, quantity=ord_qty))
+            retry(lambda: self.client.futures_create_order(**params))
+
+        self.__log_new_order(ord_id, ord_type, side, ord_qty, limit, stop)
 
+    def __log_new_order(self, ord_id, ord_type, side, ord_qty, limit, stop):
+        """
+        trade log and notification of a new order
+        """
         if self.enable_trade_log:
             logger.info(f"========= New Order ==============")
             logger.info(f"ID     : {ord_id}")
@@ -406,6 +459,52 @@ class BinanceFutures:
 
             notify(f"New Order\nType: {ord_type}\nSide: {side}\nQty: {ord_qty}\nLimit: {limit}\nStop: {stop}")
 
+    @contextmanager
+    def batch_orders(self):
+        """
+        orders placed inside the block by this thread, for instance pyramiding legs or the TP
+        and SL of an open position, are sent together with the batch order endpoint when the
+        block exits. nothing is sent if the block raises.
+        the exchange runs the orders of a batch concurrently, so the orders of a batch must not
+        depend on each other: the orders opening or adding to the position are sent first and
+        the reduce only ones in a batch of their own afterwards. a reduce only leg of a limit
+        entry that has not filled yet is still rejected
+        """
+        self.__init_client()
+        ident = threading.get_ident()
+        self.batches[ident] = []
+        try:
+            yield
+        except BaseException:
+            self.batches.pop(ident, None)
+            raise
+        self.__send_batch(self.batches.pop(ident))
+
+    def __send_batch(self, orders):
+        """
+        send queued orders, batch_size at a time, the reduce only orders after the others.
+        an order is logged and notified once the exchange accepted it
+        :param orders: list of (params, new order log arguments)
+        """
+        opening = [o for o in orders if o[0].get("reduceOnly") != "true"]
+        reducing = [o for o in orders if o[0].get("reduceOnly") == "true"]
+        for group in [opening, reducing]:
+            for i in range(0, len(group), self.batch_size):
+                chunk = group[i:i + self.batch_size]
+                if len(chunk) == 1:
+                    params, log = chunk[0]
+                    retry(lambda: self.client.futures_create_order(**params))
+                    self.__log_new_order(*log)
+                    continue
+                batch = [{k: str(v) for k, v in params.items()} for params, _ in chunk]
+                results = retry(lambda: self.client.futures_place_batch_orders(batchOrders=json.dumps(batch)))
+                for (params, log), result in zip(chunk, results):
+                    if "code" in result:
+                        logger.error(f"Batch order {params['newClientOrderId']} rejected. {result.get('msg')}")
+                        notify(f"Batch order {params['newClientOrderId']} rejected. {result.get('msg')}")
+                    else:
+                        self.__log_new_order(*log)
+
     # def __amend_order(self, ord_id, side, ord_qty, limit=0, stop=0, post_only=False):
     #     """
     #    amend order
@@ -601,6 +700,15 @@ class BinanceFutures:
         else:
             return None
 
+    def get_orderbook(self):
+        """
+        order book kept up to date by the depth stream,
+        the stream is only subscribed once the order book is requested
+        """
+        if self.ob is None:
+            self.ob = OrderBook(self.ws)
+        return self.ob
+
     def get_orderbook_ticker(self):
         orderbook_ticker = retry(lambda: self.client.futures_orderbook_ticker(symbol=self.pair))
         return orderbook_ticker
@@ -679,7 +787,7 @@ class BinanceFutures:
         if pos_size == 0:
             return
         # tp
-        tp_order = self.get_open_order("TP")
+        tp_order = self.__get_open_order("TP")
         # logger.info(f"tp_order: {tp_order}")
 
         is_tp_full_size = False
@@ -697,30 +805,19 @@ class BinanceFutures:
         # logger.info(f"TPS: {tp_percent_short}")
 
         avg_entry = self.get_position_avg_price()
+        tp_order_id = tp_order["clientOrderId"] if tp_order is not None else None
 
         # tp execution logic
-        if tp_percent_long > 0 and is_tp_full_size == False:
+        if tp_percent_long > 0 and is_tp_full_size == False and not self.__is_pending("TP"):
             if pos_size > 0:
                 tp_price_long = round(avg_entry + (avg_entry * tp_percent_long), self.round_decimals)
-                if tp_order is not None:
-                    time.sleep(2)
-                    self.cancel(id=tp_order["clientOrderId"])
-                    time.sleep(2)
-                    self.order("TP", False, abs(pos_size), limit=tp_price_long, reduce_only=True)
-                else:
-                    self.order("TP", False, abs(pos_size), limit=tp_price_long, reduce_only=True)
-        if tp_percent_short > 0 and is_tp_full_size == False:
+                self.__replace_order("TP", tp_order_id, lambda: self.order("TP", False, abs(pos_size), limit=tp_price_long, reduce_only=True))
+        if tp_percent_short > 0 and is_tp_full_size == False and not self.__is_pending("TP"):
             if pos_size < 0:
                 tp_price_short = round(avg_entry - (avg_entry * tp_percent_short), self.round_decimals)
-                if tp_order is not None:
-                    time.sleep(2)
-                    self.cancel(id=tp_order["clientOrderId"])
-                    time.sleep(2)
-                    self.order("TP", True, abs(pos_size), limit=tp_price_short, reduce_only=True)
-                else:
-                    self.order("TP", True, abs(pos_size), limit=tp_price_short, reduce_only=True)
+                self.__replace_order("TP", tp_order_id, lambda: self.order("TP", True, abs(pos_size), limit=tp_price_short, reduce_only=True))
         # sl
-        sl_order = self.get_open_order("SL")
+        sl_order = self.__get_open_order("SL")
         if sl_order is not None:
             origQty = float(sl_order["origQty"])
             orig_side = sl_order["side"] == "BUY" if True else False
@@ -730,28 +827,72 @@ class BinanceFutures:
 
         sl_percent_long = self.get_sltp_values()["stop_long"]
         sl_percent_short = self.get_sltp_values()["stop_short"]
+        sl_order_id = sl_order["clientOrderId"] if sl_order is not None else None
 
         # sl execution logic
-        if sl_percent_long > 0 and is_sl_full_size == False:
+        if sl_percent_long > 0 and is_sl_full_size == False and not self.__is_pending("SL"):
             if pos_size > 0:
                 sl_price_long = round(avg_entry - (avg_entry * sl_percent_long), self.round_decimals)
-                if sl_order is not None:
-                    time.sleep(2)
-                    self.cancel(id=sl_order["clientOrderId"])
-                    time.sleep(2)
-                    self.order("SL", False, abs(pos_size), stop=sl_price_long, reduce_only=True)
-                else:
-                    self.order("SL", False, abs(pos_size), stop=sl_price_long, reduce_only=True)
-        if sl_percent_short > 0 and is_sl_full_size == False:
+                self.__replace_order("SL", sl_order_id, lambda: self.order("SL", False, abs(pos_size), stop=sl_price_long, reduce_only=True))
+        if sl_percent_short > 0 and is_sl_full_size == False and not self.__is_pending("SL"):
             if pos_size < 0:
                 sl_price_short = round(avg_entry + (avg_entry * sl_percent_short), self.round_decimals)
-                if sl_order is not None:
-                    time.sleep(2)
-                    self.cancel(id=sl_order["clientOrderId"])
-                    time.sleep(2)
-                    self.order("SL", True, abs(pos_size), stop=sl_price_short, reduce_only=True)
-                else:
-                    self.order("SL", True, abs(pos_size), stop=sl_price_short, reduce_only=True)
+                self.__replace_order("SL", sl_order_id, lambda: self.order("SL", True, abs(pos_size), stop=sl_price_short, reduce_only=True))
+
+    def __get_open_order(self, id):
+        """
+        open order by id, from the order manager cache when it is running
+        """
+        if self.order_manager is not None:
+            return self.order_manager.open_order(id)
+        return self.get_open_order(id)
+
+    def __is_pending(self, id):
+        """
+        a replacement of the order is still in progress
+        """
+        return self.order_manager is not None and self.order_manager.pending(id)
+
+    def __replace_order(self, id, cancel_id, place):
+        """
+        cancel an order and place its replacement, off the websocket thread when the order manager is running
+        :param id: order id
+        :param cancel_id: client order id of the order to cancel, None to only place
+        :param place: function placing the new order
+        """
+        if self.order_manager is not None:
+            self.order_manager.submit(id, cancel_id, self.__cancel_order, place)
+            return
+        if cancel_id is not None:
+            self.cancel(id=cancel_id)
+        place()
+
+    def __cancel_order(self, client_order_id):
+        """
+        cancel an order by client order id without looking it up first
+        """
+        try:
+            retry(lambda: self.client.futures_cancel_order(symbol=self.pair, origClientOrderId=client_order_id))
+        except HTTPNotFound:
+            return False
+        logger.info(f"Cancel Order : {client_order_id}")
+        return True
+
+    def fetch_klines(self, bin_size, start_time, end_time, limit=1500):
+        """
+        fetch one page of klines
+        :param bin_size: kline interval
+        :param start_time: label (close time) of the first kline
+        :param end_time: label (close time) of the last kline
+        :param limit: max number of klines
+        :return: data frame labeled by the kline close time
+        """
+        self.__init_client()
+        # klines are requested by open time
+        start = int(datetime.timestamp(start_time - delta(bin_size)) * 1000)
+        end = int(datetime.timestamp(end_time - delta(bin_size)) * 1000)
+        source = retry(lambda: self.client.futures_klines(symbol=self.pair, interval=bin_size, startTime=start, endTime=end, limit=limit))
+        return to_data_frame([{"timestamp": datetime.fromtimestamp(s[0] / 1000, UTC) + delta(bin_size), "high": float(s[2]), "low": float(s[3]), "open": float(s[1]), "close": float(s[4]), "volume": float(s[5])} for s in source])
 
     def fetch_ohlcv(self, bin_size, start_time, end_time):
         """
@@ -797,56 +938,111 @@ class BinanceFutures:
 
         return resample(data, bin_size)
 
+    @property
+    def data(self):
+        """
+        closed OHLCV bars of bin_size
+        """
+        if self.ohlcv is None:
+            return None
+        return self.ohlcv.buffer.to_data_frame()
+
     def security(self, bin_size):
         """
         Recalculate and obtain different time frame data
         """
-        return resample(self.data, bin_size)[:-1]
+        if self.timeframes is None:
+            self.timeframes = TimeframeStore(self.ohlcv_len)
+        if bin_size not in self.timeframes:
+            self.timeframes.register(bin_size, self.data)
+        return self.timeframes.security(bin_size)
 
-    def __update_ohlcv(self, action, new_data):
-        new_data = new_data.rename(index={new_data.iloc[0].name: new_data.iloc[0].name.ceil(freq="1T")})
+    def indicator(self, cls, *args, **kwargs):
         """
-        get OHLCV data and execute the strategy
+        streaming indicator of src.indicators updated with every closed bar,
+        seeded with the closed bars the first time it is requested.
+        for instance self.exchange.indicator(Sma, 200)[-1]
+        :param cls: indicator class
+        :param args: indicator parameters
+        """
+        if self.indicators is None:
+            self.indicators = Indicators()
+        return self.indicators.get(cls, args, kwargs, self.ohlcv.arrays)
+
+    def signal(self, name, bars_ago=0):
+        """
+        value of a signal computed by the signals function at the last closed bar.
+        the signals are computed over the closed bars once per bar
+        :param name: signal name
+        :param bars_ago: 0 for the last closed bar, 1 for the one before...
         """
-        if self.data is None:
-            end_time = datetime.now(timezone.utc)
-            start_time = end_time - self.ohlcv_len * delta(self.bin_size)
-            # logger.info(f"start time fetch ohlcv: {start_time}")
-            # logger.info(f"end time fetch ohlcv: {end_time}")
-            self.data = self.fetch_ohlcv(self.bin_size, start_time, end_time)
-            if self.data.iloc[-1].name > end_time:
-                last_candle = self.data.iloc[-1].values
-                self.data = self.data[:-1]
-                self.data.loc[end_time.replace(microsecond=0)] = last_candle
+        last = self.ohlcv.last_timestamp()
+        if self.signal_values is None or self.signal_values[0] != last:
+            self.signal_values = (last, self.signals(self.data))
+        return self.signal_values[1][name][-1 - bars_ago]
 
-            logger.info(f"Initial Buffer Fill - Last Candle: {self.data.iloc[-1].name}")
+    def __on_close_bar(self, timestamp, open, high, low, close, volume):
+        """
+        feed a closed bar to the other time frames and the streaming indicators
+        """
+        if self.timeframes is not None:
+            self.timeframes.update(timestamp, open, high, low, close, volume)
+        if self.indicators is not None:
+            self.indicators.update(open, close, high, low, volume)
+
+    def __init_ohlcv(self):
+        """
+        fill the bar builder with the closed bars of bin_size and the base bars of the forming one
+        """
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - self.ohlcv_len * delta(self.bin_size)
+        # logger.info(f"start time fetch ohlcv: {start_time}")
+        # logger.info(f"end time fetch ohlcv: {end_time}")
+        self.ohlcv = BarBuilder(self.bin_size, self.ohlcv_len)
+        self.ohlcv.on_close = self.__on_close_bar
 
+        data = self.fetch_ohlcv(self.bin_size, start_time, end_time)
+        self.ohlcv.seed(data[data.index <= end_time])
+
+        base_bin_size = allowed_range[self.bin_size][0]
+        if base_bin_size == self.bin_size:
+            forming = data[data.index > end_time]
         else:
-            if self.data.iloc[-1].name == new_data.iloc[0].name:
-                self.data = pd.concat([self.data[:-1], new_data])
-            else:
-                self.data = pd.concat([self.data, new_data])
+            forming = self.fetch_ohlcv(base_bin_size, to_timestamp(self.ohlcv.last_timestamp()), end_time)
+
+        for timestamp, row in forming.iterrows():
+            self.ohlcv.update(to_ns(timestamp), row["open"], row["high"], row["low"], row["close"], row["volume"])
+
+        logger.info(f"Initial Buffer Fill - Last Candle: {to_timestamp(self.ohlcv.last_timestamp())}")
+
+    def __update_ohlcv(self, action, new_data):
+        """
+        get OHLCV data and execute the strategy
+        """
+        if self.ohlcv is None:
+            self.__init_ohlcv()
+
+        # kline close time rounded up to the minute is the bar label
+        timestamp = -(-new_data.timestamp // MINUTE_NS) * MINUTE_NS
+        self.ohlcv.update(timestamp, new_data.open, new_data.high, new_data.low, new_data.close, new_data.volume)
 
         # exclude current candle data
-        re_sample_data = resample(self.data, self.bin_size)[:-1]
+        last_action_time = self.ohlcv.last_timestamp()
 
-        if self.last_action_time is not None and self.last_action_time == re_sample_data.iloc[-1].name:
+        if last_action_time is None:
             return
 
-        self.data = pd.concat([re_sample_data.iloc[-1 * self.ohlcv_len :, :], self.data.iloc[[-1]]])
+        if self.last_action_time is not None and self.last_action_time == last_action_time:
+            return
 
-        open = re_sample_data["open"].values
-        close = re_sample_data["close"].values
-        high = re_sample_data["high"].values
-        low = re_sample_data["low"].values
-        volume = re_sample_data["volume"].values
+        open, close, high, low, volume = self.ohlcv.arrays()
 
         try:
             if self.strategy is not None:
-                self.timestamp = re_sample_data.iloc[-1].name.isoformat()
+                self.timestamp = to_timestamp(last_action_time).isoformat()
                 self.strategy(open, close, high, low, volume)
                 self.eval_exit()
-            self.last_action_time = re_sample_data.iloc[-1].name
+            self.last_action_time = last_action_time
         except FatalError as e:
             # Fatal error
             logger.error(f"Fatal error. {e}")
@@ -897,6 +1093,19 @@ class BinanceFutures:
         https://binance-docs.github.io/apidocs/futures/en/#event-order-update
         """
         self.order_update = order
+        if self.order_manager is not None and order["s"] == self.pair:
+            self.order_manager.on_order_update({
+                "clientOrderId": order["c"],
+                "side": order["S"],
+                "type": order["o"],
+                "origQty": order["q"],
+                "price": order["p"],
+                "stopPrice": order["sp"],
+                "status": order["X"]
+            })
+        # a fill changes the position, read it from REST until ACCOUNT_UPDATE confirms it
+        if order["s"] == self.pair and order["x"] == "TRADE":
+            self.position_time = 0
         # Evaluation of profit and loss
         self.eval_exit()
         # self.eval_sltp()
@@ -911,7 +1120,9 @@ class BinanceFutures:
             # logger.info(f'position: {position}')
             # Was the position size changed?
         if len(position) == 1:
-            is_update_pos_size = self.get_position_size != float(position[0]["pa"])
+            if self.position is None:
+                self.get_position()
+            is_update_pos_size = self.position_size != float(position[0]["pa"])
 
             # Reset trail to current price if position size changes
             if is_update_pos_size and float(position[0]["pa"]) != 0:
@@ -924,18 +1135,17 @@ class BinanceFutures:
                 logger.info(f"Balance: {self.get_balance()} USDT")
                 notify(f"Updated Position\n" f"Price: {self.position[0]['entryPrice']} => {position[0]['ep']}\n" f"Qty: {self.position[0]['positionAmt']} => {position[0]['pa']}\n" f"Balance: {self.get_balance()} USDT")
 
-            self.position[0] = (
-                {
-                    "entryPrice": position[0]["ep"],
-                    "marginType": position[0]["mt"],
-                    "positionAmt": position[0]["pa"],
-                    "symbol": position[0]["s"],
-                    "unRealizedProfit": position[0]["up"],
-                    "positionSide": position[0]["ps"],
-                }
-                if self.position is not None
-                else self.position[0]
-            )
+            # fields the stream does not carry, like the leverage, are kept
+            self.position[0] = {
+                **self.position[0],
+                "entryPrice": position[0]["ep"],
+                "marginType": position[0]["mt"],
+                "positionAmt": position[0]["pa"],
+                "symbol": position[0]["s"],
+                "unRealizedProfit": position[0]["up"],
+                "positionSide": position[0]["ps"],
+            }
+            self.position_time = time.time()
 
             self.position_size = float(self.position[0]["positionAmt"])
             self.entry_price = float(self.position[0]["entryPrice"])
@@ -947,11 +1157,17 @@ class BinanceFutures:
     def __on_update_margin(self, action, margin):
         """
         Update margin
+        :param margin: balances of the assets changed by the account update
         """
-        if self.margin is not None:
-            self.margin[0] = {"balance": float(margin["wb"]), "crossWalletBalance": float(margin["cw"])}
-        else:
+        if self.margin is None:
             self.get_margin()
+            return
+        for balance in margin:
+            # assets that were never read are fetched by REST when they are
+            if balance["a"] in self.margin:
+                self.margin[balance["a"]] = {**self.margin[balance["a"]], "balance": float(balance["wb"]),
+                                             "crossWalletBalance": float(balance["cw"])}
+                self.margin_time[balance["a"]] = time.time()
 
     def __on_update_bookticker(self, action, bookticker):
         """
@@ -970,7 +1186,9 @@ class BinanceFutures:
         self.bin_size = bin_size
         self.strategy = strategy
         if self.is_running:
-            self.ws = BinanceFuturesWs(account=self.account, pair=self.pair, test=self.demo)
+            self.ws = BinanceFuturesWs(account=self.account, pair=self.pair, test=self.demo,
+                                       connection_class=AsyncBinanceFuturesConnection if self.async_runtime
+                                       else BinanceFuturesConnection)
             self.ws.bind(allowed_range[bin_size][0], self.__update_ohlcv)
             self.ws.bind("instrument", self.__on_update_instrument)
             self.ws.bind("wallet", self.__on_update_wallet)
@@ -978,8 +1196,8 @@ class BinanceFutures:
             self.ws.bind("order", self.__on_update_order)
             self.ws.bind("margin", self.__on_update_margin)
             self.ws.bind("IndividualSymbolBookTickerStreams", self.__on_update_bookticker)
-            # todo orderbook
-            # self.ob = OrderBook(self.ws)
+            self.order_manager = OrderManager(reconcile=self.get_all_open_orders)
+            self.order_manager.load(self.get_all_open_orders())
         logger.info(f" on_update(self, bin_size, strategy)")
 
     def stop(self):
@@ -989,6 +1207,8 @@ class BinanceFutures:
         if self.is_running:
             self.is_running = False
             self.ws.close()
+            if self.order_manager is not None:
+                self.order_manager.stop()
 
     def show_result(self):
         """
@@ -155,6 +155,14 @@ class Client(object):
 
     def _request(self, method, uri, signed, force_params=False, **kwargs):
 
+        kwargs = self._request_kwargs(method, signed, force_params, **kwargs)
+        self.response = getattr(self.session, method)(uri, **kwargs)
+        return self._handle_response()
+
+    def _request_kwargs(self, method, signed, force_params=False, **kwargs):
+        """Signed and ordered arguments of a request
+        """
+
         # set default requests timeout
         kwargs['timeout'] = 10
 
@@ -191,8 +199,7 @@ class Client(object):
             kwargs['params'] = '&'.join('%s=%s' % (data[0], data[1]) for data in kwargs['data'])
             del(kwargs['data'])
 
-        self.response = getattr(self.session, method)(uri, **kwargs)
-        return self._handle_response()
+        return kwargs
 
     def _request_api(self, method, path, signed=False, version=PUBLIC_API_VERSION, **kwargs):
         uri = self._create_api_uri(path, signed, version)
@@ -392,6 +399,12 @@ class Client(object):
         """
         return self._request_futures_api('post', 'order', True, data=params)
 
+    def futures_place_batch_orders(self, **params):
+        """Send in up to 5 new orders, batchOrders is a JSON list of the order params.
+        https://binance-docs.github.io/apidocs/futures/en/#place-multiple-orders-trade
+        """
+        return self._request_futures_api('post', 'batchOrders', True, data=params)
+
     def futures_get_order(self, **params):
         """Check an order's status.
         https://binance-docs.github.io/apidocs/futures/en/#query-order-user_data
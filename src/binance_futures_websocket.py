@@ -9,14 +9,35 @@ import traceback
 import urllib
 
 import websocket
-from datetime import datetime
-from pytz import UTC
 
-from src import logger, to_data_frame, notify
+from src import logger, notify
+from src.bar_builder import Bar
+from src.event_queue import EventQueue
 from src.config import config as conf
 from src.binance_futures_api import Client
 
 
+# bind key -> (handler key, stream of the pair), None being the user data stream of the listen key
+STREAMS = {
+    '1m': ('1m', 'kline_1m'),
+    '5m': ('5m', 'kline_5m'),
+    '30m': ('30m', 'kline_30m'),
+    '1h': ('1h', 'kline_1h'),
+    '1d': ('1d', 'kline_1d'),
+    '1w': ('1w', 'kline_1w'),
+    'instrument': ('24hrTicker', 'ticker'),
+    'IndividualSymbolBookTickerStreams': ('IndividualSymbolBookTickerStreams', 'bookTicker'),
+    'orderBookL2': ('orderBookL2', 'depth20@100ms'),
+    'margin': ('margin', None),
+    'position': ('ACCOUNT_UPDATE', None),
+    'order': ('ORDER_TRADE_UPDATE', None),
+    'wallet': ('wallet', None),
+}
+
+# handler keys of the streams only the latest event of which is handled
+CONFLATED = ('24hrTicker', 'IndividualSymbolBookTickerStreams')
+
+
 def generate_nonce():
     return int(round(time.time() * 1000))
 
@@ -41,45 +62,80 @@ def generate_signature(secret, verb, url, nonce, data):
     return signature
 
 
-class BinanceFuturesWs:
+class BinanceFuturesConnection:
+    """
+    Websocket connection of an account, shared by the BinanceFuturesWs of every pair
+    and strategy of the account in the process.
+    It owns the socket, its thread, the listen key and its keep alive timer, subscribes
+    the streams bound by its subscribers on one combined stream and routes the events
+    of a pair stream to the subscribers of the pair. The user data events concern the
+    whole account and are sent to every subscriber.
+    """
+    # (account, testnet) -> open connection
+    connections = {}
+    # Lock of the connections
+    connections_lock = threading.Lock()
     # Account
     account = ''
-    #Pair
-    pair= 'BTCUSDT'
     # testnet
     testnet = False
-    # condition that the bot runs on.
+    # condition that the connection runs on.
     is_running = True
-    # Notification destination listener
-    handlers = {}
     listenKey = None
-    
-    def __init__(self, account, pair, test=False):
+    # pair -> subscribers of the pair
+    subscribers = None
+    # Streams subscribed on the current connection
+    subscribed = None
+
+    @classmethod
+    def get(cls, subscriber):
+        """
+        attach a subscriber to the connection of its account, it is opened on the first call
+        :param subscriber: BinanceFuturesWs
+        :return: connection
+        """
+        with cls.connections_lock:
+            connection = cls.connections.get((subscriber.account, subscriber.testnet))
+            if connection is None:
+                connection = cls(subscriber.account, subscriber.testnet)
+                cls.connections[(subscriber.account, subscriber.testnet)] = connection
+            connection.attach(subscriber)
+            return connection
+
+    def __init__(self, account, test=False):
         """
         constructor
         """
         self.account = account
-        self.pair = pair.lower()
         self.testnet = test
         if test:
             domain = 'testnet.bitmex.com'
         else:
             domain = 'fstream.binance.com'
+        self.subscribers = {}
+        self.subscribed = set()
+        self.connected = False
+        self.request_id = 0
+        self.lock = threading.RLock()
+        self.endpoint = 'wss://' + domain + '/stream'
+        self.open()
+
+    def open(self):
+        """
+        get the listen key, connect the socket on its thread and start the keep alive
+        """
         self.__get_auth_user_data_streams()
-        self.endpoint = 'wss://' + domain + '/stream?streams=' + self.listenKey + '/' + self.pair + '@ticker/' + self.pair + '@kline_1m/' \
-                        + self.pair + '@kline_5m/' + self.pair + '@kline_30m/' \
-                        + self.pair + '@kline_1h/'  + self.pair + '@kline_1d/' + self.pair + '@kline_1w/' \
-                        + self.pair + '@depth20@100ms/' + self.pair + '@bookTicker'
         self.ws = websocket.WebSocketApp(self.endpoint,
+                             on_open=self.__on_open,
                              on_message=self.__on_message,
                              on_error=self.__on_error,
-                             on_close=self.__on_close)                             
-                             
+                             on_close=self.__on_close)
+
         self.wst = threading.Thread(target=self.__start)
         self.wst.daemon = True
         self.wst.start()
         self.__keep_alive_user_datastream(self.listenKey)
-   
+
     def __get_auth_user_data_streams(self):
         """
         authenticate user data streams
@@ -117,7 +173,34 @@ class BinanceFuturesWs:
         else: 
             self.__get_auth_user_data_streams()
             timer.start() 
-          
+
+    def attach(self, subscriber):
+        """
+        add the subscriber of a pair, the lists are replaced rather than changed so
+        the socket thread reads them without the lock
+        :param subscriber: BinanceFuturesWs
+        """
+        with self.lock:
+            self.subscribers = {**self.subscribers,
+                                subscriber.pair: self.subscribers.get(subscriber.pair, ()) + (subscriber,)}
+            self.sync()
+
+    def detach(self, subscriber):
+        """
+        remove a subscriber, the connection is closed with its last subscriber
+        :param subscriber: BinanceFuturesWs
+        """
+        with self.connections_lock, self.lock:
+            subscribers = tuple(s for s in self.subscribers.get(subscriber.pair, ()) if s is not subscriber)
+            self.subscribers = {pair: s for pair, s in {**self.subscribers, subscriber.pair: subscribers}.items()
+                                if len(s) > 0}
+            if len(self.subscribers) > 0:
+                self.sync()
+                return
+            if self.connections.get((self.account, self.testnet)) is self:
+                del self.connections[(self.account, self.testnet)]
+        self.close()
+
     def __on_error(self, ws, message):
         """
         On Error listener
@@ -130,6 +213,64 @@ class BinanceFuturesWs:
         notify(f"Error occurred. {message}")
         notify(traceback.format_exc())
 
+    def __on_open(self, ws):
+        """
+        On Open listener
+        :param ws:
+        """
+        self.on_connected()
+
+    def on_connected(self):
+        """
+        subscribe the streams of the bound handlers on a new connection
+        """
+        with self.lock:
+            self.connected = True
+            self.subscribed = set()
+            self.sync()
+
+    def __streams(self):
+        """
+        streams needed by the handlers of the subscribers
+        """
+        streams = set()
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                streams |= subscriber.streams(self.listenKey)
+        return streams
+
+    def sync(self):
+        """
+        subscribe the streams of new handlers and unsubscribe the streams nothing listens to anymore
+        """
+        with self.lock:
+            if not self.connected:
+                return
+            streams = self.__streams()
+            if len(streams - self.subscribed) > 0:
+                self.__send('SUBSCRIBE', streams - self.subscribed)
+            if len(self.subscribed - streams) > 0:
+                self.__send('UNSUBSCRIBE', self.subscribed - streams)
+            self.subscribed = streams
+
+    def __send(self, method, streams):
+        self.request_id += 1
+        logger.info(f"{method} {sorted(streams)}")
+        self.send(json.dumps({'method': method, 'params': sorted(streams), 'id': self.request_id}))
+
+    def send(self, message):
+        """
+        send a message on the socket
+        """
+        self.ws.send(message)
+
+    def renew_listen_key(self):
+        """
+        get a new listen key and subscribe its user data stream
+        """
+        self.__get_auth_user_data_streams()
+        self.sync()
+
     def __on_message(self, ws, message):
         """
         On Message listener
@@ -137,79 +278,93 @@ class BinanceFuturesWs:
         :param message:
         :return:
         """        
+        self.dispatch(message)
+
+    def dispatch(self, message):
+        """
+        decode a message and send its events to the subscribers
+        :param message: message of the combined stream
+        """
         try:
             obj = json.loads(message)
-            
-            
+
+            if 'data' not in obj:
+                # response to a SUBSCRIBE / UNSUBSCRIBE request
+                if obj.get('error') is not None:
+                    logger.error(f"Stream subscription failed. {obj['error']}")
+                return
+
+            # <pair>@<stream> for the market streams, the listen key for the user data stream
+            pair = obj['stream'].split('@')[0]
+
             if 'e' in obj['data']:                
                 e = obj['data']['e']
                 action = ""                
                 datas = obj['data']                
                 
                 if e.startswith("kline"):
-                    data = [{
-                        "timestamp" : datas['k']['T'],
-                        "high" : float(datas['k']['h']),
-                        "low" : float(datas['k']['l']),
-                        "open" : float(datas['k']['o']),
-                        "close" : float(datas['k']['c']),
-                        "volume" : float(datas['k']['v'])
-                    }]                     
-                    data[0]['timestamp'] = datetime.fromtimestamp(data[0]['timestamp']/1000).astimezone(UTC)                                        
-                    self.__emit(obj['data']['k']['i'], action, to_data_frame([data[0]]))                    
+                    k = datas['k']
+                    # kline close time in ms
+                    bar = Bar(k['T'] * 1000000, float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v']))
+                    self.__emit(pair, k['i'], action, bar)
                 elif e.startswith("24hrTicker"):
-                    self.__emit(e, action, datas)               
+                    self.__emit(pair, e, action, datas)               
 
                 elif e.startswith("ACCOUNT_UPDATE"):
-                    self.__emit(e, action, datas['a']['P'])
-                    self.__emit('wallet', action, datas['a']['B'][0])
-                    self.__emit('margin', action, datas['a']['B'][0])                  
+                    self.__broadcast(e, action, datas['a']['P'])
+                    self.__broadcast('wallet', action, datas['a']['B'][0])
+                    self.__broadcast('margin', action, datas['a']['B'])                  
                     
-                # todo  ORDER_TRADE_UPDATE
                 elif e.startswith("ORDER_TRADE_UPDATE"):
-                    self.__emit(e, action, datas['o'])
-                #todo orderbook stream
-                # elif table.startswith(""):
-                #     self.__emit(e, action, data)
+                    self.__broadcast(e, action, datas['o'])
+                elif e.startswith("depthUpdate"):
+                    # partial depth streams send the best levels as a snapshot
+                    data = [{"side": "Buy", "price": float(p), "size": float(q)} for p, q in datas['b']] + \
+                           [{"side": "Sell", "price": float(p), "size": float(q)} for p, q in datas['a']]
+                    self.__emit(pair, 'orderBookL2', 'partial', data)
                 elif e.startswith("listenKeyExpired"):
-                    self.__emit('close', action, datas)                    
-                    self.__get_auth_user_data_streams()
+                    self.__broadcast('close', action, datas)                    
+                    self.renew_listen_key()
                     logger.info(f"listenKeyExpired!!!")
-                    #self.__on_close(ws)
 
             elif not 'e' in obj['data']:
                 e = 'IndividualSymbolBookTickerStreams'
                 action = ''
                 data = obj['data']
-                #logger.info(f"{data}")
-                self.__emit(e, action, data)
-
-
+                self.__emit(pair, e, action, data)
 
         except Exception as e:
             logger.error(e)
             logger.error(traceback.format_exc())
        
-    def __emit(self, key, action, value):       
+    def __emit(self, pair, key, action, value):       
         """
-        send data
+        send data to the subscribers of a pair
         """
-        if key in self.handlers:
-            self.handlers[key](action, value)
+        for subscriber in self.subscribers.get(pair, ()):
+            subscriber.emit(key, action, value)
+
+    def __broadcast(self, key, action, value):
+        """
+        send data to every subscriber
+        """
+        for subscribers in list(self.subscribers.values()):
+            for subscriber in subscribers:
+                subscriber.emit(key, action, value)
 
     def __on_close(self, ws):
         """
         On Close Listener
         :param ws:
         """
-        if 'close' in self.handlers:
-            self.handlers['close']()
+        self.on_disconnected()
 
         if self.is_running:
             logger.info("Websocket restart")
             notify(f"Websocket restart")
 
             self.ws = websocket.WebSocketApp(self.endpoint,
+                                 on_open=self.__on_open,
                                  on_message=self.__on_message,
                                  on_error=self.__on_error,
                                  on_close=self.__on_close)                                 
@@ -218,45 +373,147 @@ class BinanceFuturesWs:
             self.wst.daemon = True
             self.wst.start()
 
+    def on_disconnected(self):
+        """
+        notify the subscribers of a lost connection
+        """
+        with self.lock:
+            self.connected = False
+
+        for subscribers in list(self.subscribers.values()):
+            for subscriber in subscribers:
+                subscriber.emit_close()
+
+    def close(self):
+        """
+        close websocket
+        """
+        self.is_running = False
+        self.ws.close()
+
+
+class BinanceFuturesWs:
+    """
+    Websocket streams of a pair.
+    The streams of every pair and strategy of an account go through one shared
+    BinanceFuturesConnection, a BinanceFuturesWs only keeps the handlers of its pair.
+    The handlers run on the worker of its EventQueue, not on the receive thread. A pair
+    whose handlers fall behind drops its own events, the other pairs are not held up.
+    """
+    # Account
+    account = ''
+    #Pair
+    pair= 'BTCUSDT'
+    # testnet
+    testnet = False
+    # condition that the bot runs on.
+    is_running = True
+    # Notification destination listener
+    handlers = None
+    # Shared connection of the account
+    connection = None
+    # Events waiting for the handlers, None to run the handlers on the receive thread
+    queue = None
+    
+    def __init__(self, account, pair, test=False, connection_class=BinanceFuturesConnection):
+        """
+        constructor.
+        only the streams of the bound handlers are subscribed, binding or unbinding
+        a handler subscribes or unsubscribes its stream on the live connection
+        :param connection_class: transport of the shared connection, BinanceFuturesConnection
+                                 or AsyncBinanceFuturesConnection
+        """
+        self.account = account
+        self.pair = pair.lower()
+        self.testnet = test
+        self.handlers = {}
+        # the receive thread of the connection is shared by every pair of the account, a full
+        # queue drops its events instead of holding up the other pairs
+        self.queue = EventQueue(self.__handle, conflate=CONFLATED, name=f"events-{self.pair}")
+        self.connection = connection_class.get(self)
+
+    def streams(self, listenKey):
+        """
+        streams needed by the bound handlers
+        :param listenKey: listen key of the user data stream
+        """
+        handlers = set(self.handlers)
+        streams = set()
+        for key, stream in STREAMS.values():
+            if key not in handlers:
+                continue
+            if stream is not None:
+                streams.add(self.pair + '@' + stream)
+            elif listenKey is not None:
+                streams.add(listenKey)
+        return streams
+
+    def emit(self, key, action, value):       
+        """
+        send data
+        """
+        if key not in self.handlers:
+            return
+        if self.queue is not None:
+            self.queue.put(key, action, value)
+        else:
+            self.__handle(key, action, value)
+
+    def emit_close(self):
+        """
+        notify the close of the connection
+        """
+        self.emit('close', None, None)
+
+    def __handle(self, key, action, value):
+        handler = self.handlers.get(key)
+        if handler is None:
+            return
+        if key == 'close' and action is None:
+            # close of the connection
+            handler()
+        else:
+            handler(action, value)
+
+    def metrics(self):
+        """
+        depth and lag of the event queue
+        """
+        return self.queue.metrics()
+
     def on_close(self, func):
         """
         on close fn
         :param func:
         """
-        self.handlers['close'] = func
+        self.handlers = {**self.handlers, 'close': func}
 
     def bind(self, key, func):
         """
-        bind fn
+        bind fn, the stream of the key is subscribed if it is not already
         :param key:
         :param func:
         """
-        if key == '1m':
-            self.handlers['1m'] = func
-        if key == '5m':
-            self.handlers['5m'] = func
-        if key == '1h':
-            self.handlers['1h'] = func
-        if key == '1d':
-            self.handlers['1d'] = func
-        if key == 'instrument':
-            self.handlers['24hrTicker'] = func
-        if key == 'margin':
-            self.handlers['margin'] = func
-        if key == 'position':
-            self.handlers['ACCOUNT_UPDATE'] = func
-        if key == 'order':
-            self.handlers['ORDER_TRADE_UPDATE'] = func
-        if key == 'wallet':
-            self.handlers['wallet'] = func
-        if key == 'IndividualSymbolBookTickerStreams':
-            self.handlers['IndividualSymbolBookTickerStreams'] = func
-        if key == 'orderBookL2':
-            self.handlers['orderBookL2'] = func
+        if key not in STREAMS:
+            return
+        self.handlers = {**self.handlers, STREAMS[key][0]: func}
+        self.connection.sync()
+
+    def unbind(self, key):
+        """
+        unbind fn, the stream of the key is unsubscribed when no other handler needs it
+        :param key:
+        """
+        if key not in STREAMS:
+            return
+        self.handlers = {k: v for k, v in self.handlers.items() if k != STREAMS[key][0]}
+        self.connection.sync()
 
     def close(self):
         """
-        close websocket
+        stop the streams of the pair, the connection is closed with its last pair
         """
-        self.is_running = False
-        self.ws.close()
+        if self.is_running:
+            self.is_running = False
+            self.connection.detach(self)
+            self.queue.stop()
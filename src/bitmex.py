@@ -13,6 +13,8 @@ from pytz import UTC
 
 from src import logger, retry, allowed_range, to_data_frame, \
     resample, delta, FatalError, notify, ord_suffix
+from src.bar_builder import BarBuilder, TimeframeStore, to_ns, to_timestamp
+from src.indicators import Indicators
 from src.bitmex_api import bitmex_api
 from src.config import config as conf
 from src.bitmex_websocket import BitMexWs
@@ -51,8 +53,16 @@ class BitMex:
     enable_trade_log = True
     # OHLCV length
     ohlcv_len = 100
-    # OHLCV data
-    data = None
+    # OHLCV bar builder
+    ohlcv = None
+    # Other time frames requested through security
+    timeframes = None
+    # Streaming indicators requested through indicator
+    indicators = None
+    # Function computing the signal arrays of an OHLCV data frame, Bot.signals
+    signals = None
+    # (label of the last closed bar, signal arrays) computed by signals
+    signal_values = None
     # Profit target long and short for a simple limit exit strategy
     sltp_values = {
                     'profit_long': 0,
@@ -667,6 +677,21 @@ class BitMex:
                 else:  
                     self.order("SL", True, abs(pos_size), stop=sl_price_short, reduce_only=True, allow_amend=False)
 
+    def fetch_buckets(self, bin_size, start_time, end_time, limit=500):
+        """
+        fetch one page of complete trade buckets
+        :param bin_size: bucket size
+        :param start_time: label of the first bucket
+        :param end_time: label of the last bucket
+        :param limit: max number of buckets
+        :return: data frame labeled by the bucket end
+        """
+        self.__init_client()
+        source = retry(lambda: self.public_client.Trade.Trade_getBucketed(symbol=self.pair, binSize=bin_size,
+                                                                          startTime=start_time, endTime=end_time,
+                                                                          count=limit, partial=False).result())
+        return to_data_frame(source)
+
     def fetch_ohlcv(self, bin_size, start_time, end_time):
         """
         fetch OHLCV data
@@ -698,50 +723,109 @@ class BitMex:
                 break        
         return resample(data, bin_size)        
 
+    @property
+    def data(self):
+        """
+        closed OHLCV bars of bin_size
+        """
+        if self.ohlcv is None:
+            return None
+        return self.ohlcv.buffer.to_data_frame()
+
     def security(self, bin_size):
         """
         Recalculate and obtain different time frame data
-        """        
-        return resample(self.data, bin_size)[:-1]
+        """
+        if self.timeframes is None:
+            self.timeframes = TimeframeStore(self.ohlcv_len)
+        if bin_size not in self.timeframes:
+            self.timeframes.register(bin_size, self.data)
+        return self.timeframes.security(bin_size)
+
+    def indicator(self, cls, *args, **kwargs):
+        """
+        streaming indicator of src.indicators updated with every closed bar,
+        seeded with the closed bars the first time it is requested.
+        for instance self.exchange.indicator(Sma, 200)[-1]
+        :param cls: indicator class
+        :param args: indicator parameters
+        """
+        if self.indicators is None:
+            self.indicators = Indicators()
+        return self.indicators.get(cls, args, kwargs, self.ohlcv.arrays)
+
+    def signal(self, name, bars_ago=0):
+        """
+        value of a signal computed by the signals function at the last closed bar.
+        the signals are computed over the closed bars once per bar
+        :param name: signal name
+        :param bars_ago: 0 for the last closed bar, 1 for the one before...
+        """
+        last = self.ohlcv.last_timestamp()
+        if self.signal_values is None or self.signal_values[0] != last:
+            self.signal_values = (last, self.signals(self.data))
+        return self.signal_values[1][name][-1 - bars_ago]
+
+    def __on_close_bar(self, timestamp, open, high, low, close, volume):
+        """
+        feed a closed bar to the other time frames and the streaming indicators
+        """
+        if self.timeframes is not None:
+            self.timeframes.update(timestamp, open, high, low, close, volume)
+        if self.indicators is not None:
+            self.indicators.update(open, close, high, low, volume)
+
+    def __init_ohlcv(self):
+        """
+        fill the bar builder with the closed bars of bin_size and the base bars of the forming one
+        """
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - self.ohlcv_len * delta(self.bin_size)
+        self.ohlcv = BarBuilder(self.bin_size, self.ohlcv_len)
+        self.ohlcv.on_close = self.__on_close_bar
+
+        d1 = self.fetch_ohlcv(self.bin_size, start_time, end_time)
+        if len(d1) == 0:
+            return
+        self.ohlcv.seed(d1[d1.index <= end_time])
+        if self.ohlcv.last_timestamp() is None:
+            return
+
+        base_bin_size = allowed_range[self.bin_size][0]
+        d2 = self.fetch_ohlcv(base_bin_size,
+                              to_timestamp(self.ohlcv.last_timestamp()) + delta(base_bin_size), end_time)
+        for timestamp, row in d2.iterrows():
+            # buckets up to now are complete, the last one may still be partial
+            self.ohlcv.update(to_ns(timestamp), row['open'], row['high'], row['low'], row['close'], row['volume'],
+                              final=timestamp <= end_time)
 
     def __update_ohlcv(self, action, new_data):
         """
         get OHLCV data and execute the strategy
         """        
-        if self.data is None:
-            end_time = datetime.now(timezone.utc)
-            start_time = end_time - self.ohlcv_len * delta(self.bin_size)
-            d1 = self.fetch_ohlcv(self.bin_size, start_time, end_time)
-            if len(d1) > 0:
-                d2 = self.fetch_ohlcv(allowed_range[self.bin_size][0],
-                                      d1.iloc[-1].name + delta(allowed_range[self.bin_size][0]), end_time)
-
-                self.data = pd.concat([d1, d2])               
-            else:
-                self.data = d1                
+        if self.ohlcv is None:
+            self.__init_ohlcv()
         else:
-            self.data = pd.concat([self.data, new_data])            
+            # tradeBin buckets are published once they are complete
+            self.ohlcv.update(new_data.timestamp, new_data.open, new_data.high, new_data.low, new_data.close,
+                              new_data.volume, final=True)
 
         # exclude current candle data 
-        re_sample_data = resample(self.data, self.bin_size)[:-1]
-        
-        if self.data.iloc[-1].name == re_sample_data.iloc[-1].name:
-            self.data = re_sample_data.iloc[-1 * self.ohlcv_len:, :]
+        last_action_time = self.ohlcv.last_timestamp()
+
+        if last_action_time is None:
+            return
 
         if self.last_action_time is not None and \
-                self.last_action_time == re_sample_data.iloc[-1].name:
+                self.last_action_time == last_action_time:
             return
 
-        open = re_sample_data['open'].values
-        close = re_sample_data['close'].values
-        high = re_sample_data['high'].values
-        low = re_sample_data['low'].values
-        volume = re_sample_data['volume'].values
+        open, close, high, low, volume = self.ohlcv.arrays()
 
         try:
             if self.strategy is not None:                
                 self.strategy(open, close, high, low, volume)                
-            self.last_action_time = re_sample_data.iloc[-1].name
+            self.last_action_time = last_action_time
         except FatalError as e:
             # Fatal Error
             logger.error(f"Fatal error. {e}")
@@ -4,13 +4,19 @@ import os
 import time
 from datetime import timedelta, datetime, timezone
 
-import pandas as pd
-
-from src import logger, allowed_range, retry, delta, load_data, resample
+from src import logger, delta, load_data
+from src.backtest_engine import BacktestEngine
+from src.backtest_result import BacktestResult
+from src.bar_builder import TimeframeStore
+from src.indicators import Indicators
+from src.history_sync import HistorySync, RateLimiter
+from src.ohlcv_store import OhlcvStore
+from src.pruning import Pruned
 from src.bitmex_stub import BitMexStub
 
 OHLC_DIRNAME = os.path.join(os.path.dirname(__file__), "../ohlc/{}")
 OHLC_FILENAME = os.path.join(os.path.dirname(__file__), "../ohlc/{}/data.csv")
+OHLC_STORE = os.path.join(os.path.dirname(__file__), "../ohlc/{}/{}")
 
 class BitMexBackTest(BitMexStub):
     # Pair
@@ -25,20 +31,24 @@ class BitMexBackTest(BitMexStub):
     time = None
     # Order count
     order_count = 0
-    # Buy signal history
-    buy_signals = []
-    # Sell signal history
-    sell_signals = []
-    # EXIT history
-    close_signals = []
-    # Balance history
-    balance_history = []
+    # Back test result
+    result = None
     # Start balance
     start_balance = 0
-    # Plot data
-    plot_data = {}
-    # Resample data
-    resample_data = {}
+    # Other time frames requested through security
+    timeframes = None
+    # Bar engine
+    engine = None
+    # Position of the current bar in df_ohlcv
+    bar_index = None
+    # Refresh the local OHLCV history before the back test, it is only downloaded when there is none otherwise
+    sync_history = False
+    # Rules stopping a parameter search back test early, see src.pruning
+    pruning_rules = None
+    # Bars between two checks of the pruning rules
+    prune_interval = 100
+    # Max requests per minute of the history download
+    history_rate_limit = 30
 
     def __init__(self, account, pair):
         """
@@ -52,6 +62,16 @@ class BitMexBackTest(BitMexStub):
         self.enable_trade_log = False
         self.start_balance = self.get_balance()
 
+    @property
+    def data(self):
+        """
+        OHLCV window of the current bar, built only when accessed
+        :return:
+        """
+        if self.bar_index is None:
+            return None
+        return self.df_ohlcv.iloc[self.bar_index - self.ohlcv_len + 1:self.bar_index + 1, :]
+
     def get_market_price(self):
         """
         get market price
@@ -107,10 +127,14 @@ class BitMexBackTest(BitMexStub):
         """
         BitMexStub.commit(self, id, long, qty, price, need_commission)
 
-        if long:
-            self.buy_signals.append(self.index)
-        else:
-            self.sell_signals.append(self.index)
+        self.__signal("buy" if long else "sell")
+
+    def __signal(self, name):
+        """
+        mark the current bar in the buy, sell or close signals of the result
+        """
+        if self.result is not None:
+            getattr(self.result, name)[self.bar_index] = True
 
     def close_all(self):
         """
@@ -119,7 +143,7 @@ class BitMexBackTest(BitMexStub):
         if self.get_position_size() == 0:
             return 
         BitMexStub.close_all(self)
-        self.close_signals.append(self.index)
+        self.__signal("close")
 
     def close_all_at_price(self, price):
         """
@@ -129,7 +153,7 @@ class BitMexBackTest(BitMexStub):
         if self.get_position_size() == 0:
             return 
         BitMexStub.close_all_at_price(self, price)
-        self.close_signals.append(self.index)        
+        self.__signal("close")
 
     def eval_sltp(self):
         """
@@ -198,17 +222,11 @@ class BitMexBackTest(BitMexStub):
         """
         start = time.time()
 
-        for i in range(self.ohlcv_len):
-            self.balance_history.append((self.get_balance() - self.start_balance)/100000000*self.get_market_price())
+        self.engine = BacktestEngine(self.df_ohlcv, self.ohlcv_len)
+        self.result = BacktestResult(self.df_ohlcv.index, self.ohlcv_len - 1, self.ohlcv_len - 1 + len(self.engine))
 
-        for i in range(len(self.df_ohlcv) - self.ohlcv_len):
-            self.data = self.df_ohlcv.iloc[i:i + self.ohlcv_len, :]
-            timestamp = self.data.iloc[-1].name
-            close = self.data['close'].values
-            open = self.data['open'].values
-            high = self.data['high'].values
-            low = self.data['low'].values
-            volume = self.data['volume'].values
+        for i, timestamp, open, close, high, low, volume in self.engine.bars():
+            self.bar_index = i + self.ohlcv_len - 1
 
             if self.get_position_size() > 0 and low[-1] > self.get_trail_price():
                 self.set_trail_price(low[-1])
@@ -218,22 +236,52 @@ class BitMexBackTest(BitMexStub):
             self.market_price = close[-1]
             #self.time = timestamp.tz_convert('Asia/Tokyo')
             self.index = timestamp
+            if self.timeframes is not None:
+                self.timeframes.update(timestamp.value, open[-1], high[-1], low[-1], close[-1], volume[-1])
+            if self.indicators is not None:
+                self.indicators.update(open[-1], close[-1], high[-1], low[-1], volume[-1])
             self.eval_sltp()
             self.strategy(open, close, high, low, volume)
 
-            self.balance_history.append((self.get_balance() - self.start_balance) / 100000000 * self.get_market_price())
+            self.result.record(self.bar_index, self.profit(), self.max_draw_down_session_perc)
             self.eval_exit()
             #eval_sltp()
 
+            if self.pruning_rules and i % self.prune_interval == 0:
+                self.prune(i / len(self.engine))
+
         self.close_all()
+        # the position still open is closed at the last bar
+        self.result.finish(self.profit(), self.max_draw_down_session_perc)
         logger.info(f"Back test time : {time.time() - start}")
 
+    def profit(self):
+        """
+        profit since the start of the back test
+        """
+        return (self.get_balance() - self.start_balance) / 100000000 * self.get_market_price()
+
+    def prune(self, progress):
+        """
+        stop the back test when a pruning rule fires, the position is closed first
+        so the results are the ones of the bars evaluated so far
+        :param progress: fraction of the bars evaluated
+        """
+        for rule in self.pruning_rules:
+            reason = rule.check(self, progress)
+            if reason is not None:
+                self.close_all()
+                self.result.finish(self.profit(), self.max_draw_down_session_perc)
+                logger.info(f"Back test pruned : {reason}")
+                raise Pruned(reason)
+
     def on_update(self, bin_size, strategy):
         """
         Register the strategy function.
         :param strategy:
         """
-        self.__load_ohlcv(bin_size)
+        if self.df_ohlcv is None:
+            self.load_ohlcv(bin_size)
 
         BitMexStub.on_update(self, bin_size, strategy)
         self.__crawler_run()
@@ -242,57 +290,70 @@ class BitMexBackTest(BitMexStub):
         """
         Recalculate and obtain different time frame data
         """
-        if bin_size not in self.resample_data:
-            self.resample_data[bin_size] = resample(self.df_ohlcv, bin_size)
-        return self.resample_data[bin_size][:self.data.iloc[-1].name].iloc[-1 * self.ohlcv_len:, :]
+        if self.timeframes is None:
+            self.timeframes = TimeframeStore(self.ohlcv_len)
+        if bin_size not in self.timeframes:
+            # only the bars that can end up in the returned window are replayed
+            start = self.index - (self.ohlcv_len + 1) * delta(bin_size)
+            self.timeframes.register(bin_size, self.df_ohlcv.loc[start:self.index])
+        return self.timeframes.security(bin_size)
 
-    def download_data(self, file, bin_size, start_time, end_time):
+    def indicator(self, cls, *args, **kwargs):
         """
-        download or get the data
+        streaming indicator updated with every bar of the back test,
+        seeded with the window of the current bar the first time it is requested
+        :param cls: indicator class of src.indicators
+        :param args: indicator parameters
         """
-        if not os.path.exists(os.path.dirname(file)):
-            os.makedirs(os.path.dirname(file))
-
-        data = pd.DataFrame()
-        left_time = None
-        source = None
-        is_last_fetch = False
-
-        while True:
-            if left_time is None:
-                left_time = start_time
-                right_time = left_time + delta(allowed_range[bin_size][0]) * 99
-            else:
-                left_time = source.iloc[-1].name + + delta(allowed_range[bin_size][0]) * allowed_range[bin_size][2]
-                right_time = left_time + delta(allowed_range[bin_size][0]) * 99
-
-            if right_time > end_time:
-                right_time = end_time
-                is_last_fetch = True
-
-            source = self.fetch_ohlcv(bin_size=bin_size, start_time=left_time, end_time=right_time)
-            data = pd.concat([data, source])
+        if self.indicators is None:
+            self.indicators = Indicators()
+        return self.indicators.get(cls, args, kwargs, lambda: self.engine.window(self.bar_index - self.ohlcv_len + 1))
 
-            if is_last_fetch:
-                data.to_csv(file)
-                break
+    def signal(self, name, bars_ago=0):
+        """
+        value of a signal at the current bar of the back test.
+        the signals function is called once with the whole OHLCV data, a signal
+        at a bar must only depend on the bars up to that one
+        :param name: signal name
+        :param bars_ago: 0 for the current bar, 1 for the one before...
+        """
+        if self.signal_values is None:
+            self.signal_values = (None, self.signals(self.df_ohlcv))
+        return self.signal_values[1][name][self.bar_index - bars_ago]
 
-            time.sleep(2)
+    def download_data(self, path, bin_size, start_time, end_time):
+        """
+        download or get the data, only the bars missing in the store at path are fetched
+        :return: number of downloaded bars
+        """
+        sync = HistorySync(OhlcvStore(path), bin_size, self.fetch_buckets, page_size=500, page_weight=1,
+                           rate_limiter=RateLimiter(self.history_rate_limit))
+        return sync.sync(start_time, end_time)
 
-    def __load_ohlcv(self, bin_size):
+    def load_ohlcv(self, bin_size):
         """
         Read the data.
         :return:
         """
         start_time = datetime.now(timezone.utc) - 1 * timedelta(days=121)
         end_time = datetime.now(timezone.utc)
-        file = OHLC_FILENAME.format(bin_size)
-
-        if os.path.exists(file):
-            self.df_ohlcv = load_data(file)
-        else:
-            self.download_data(file, bin_size, start_time, end_time)
-            self.df_ohlcv = load_data(file)
+        path = OHLC_STORE.format(self.pair, bin_size)
+        store = OhlcvStore(path)
+
+        if not store.exists():
+            file = OHLC_FILENAME.format(bin_size)
+            if os.path.exists(file):
+                # import data downloaded as csv by older versions
+                store.append(load_data(file))
+
+        if not store.exists():
+            self.download_data(path, bin_size, start_time, end_time)
+        elif self.sync_history:
+            try:
+                self.download_data(path, bin_size, start_time, end_time)
+            except Exception as e:
+                logger.warning(f"OHLCV history sync failed, using the local data. {e}")
+        self.df_ohlcv = load_data(path)
 
     def show_result(self):
         """
@@ -309,7 +370,9 @@ class BitMexBackTest(BitMexStub):
 
         import matplotlib.pyplot as plt
 
-        plt_num = len([k for k, v in self.plot_data.items() if not v['overlay']]) + 2
+        plots = self.result.plot_frame()
+
+        plt_num = len([k for k, v in self.result.plot_options.items() if not v['overlay']]) + 2
         i = 1
 
         plt.figure(figsize=(12,8))
@@ -317,29 +380,29 @@ class BitMexBackTest(BitMexStub):
         plt.subplot(plt_num,1,i)
         plt.plot(self.df_ohlcv.index, self.df_ohlcv["high"])
         plt.plot(self.df_ohlcv.index, self.df_ohlcv["low"])
-        for k, v in self.plot_data.items():
+        for k, v in self.result.plot_options.items():
             if v['overlay']:
                 color = v['color']
-                plt.plot(self.df_ohlcv.index, self.df_ohlcv[k], color)
+                plt.plot(self.df_ohlcv.index, plots[k], color)
         plt.ylabel("Price(USD)")
         ymin = min(self.df_ohlcv["low"]) - 200
         ymax = max(self.df_ohlcv["high"]) + 200
-        plt.vlines(self.buy_signals, ymin, ymax, "blue", linestyles='dashed', linewidth=1)
-        plt.vlines(self.sell_signals, ymin, ymax, "red", linestyles='dashed', linewidth=1)
-        plt.vlines(self.close_signals, ymin, ymax, "green", linestyles='dashed', linewidth=1)
+        plt.vlines(self.result.buy_signals, ymin, ymax, "blue", linestyles='dashed', linewidth=1)
+        plt.vlines(self.result.sell_signals, ymin, ymax, "red", linestyles='dashed', linewidth=1)
+        plt.vlines(self.result.close_signals, ymin, ymax, "green", linestyles='dashed', linewidth=1)
 
         i = i + 1
 
-        for k, v in self.plot_data.items():
+        for k, v in self.result.plot_options.items():
             if not v['overlay']:
                 plt.subplot(plt_num,1,i)
                 color = v['color']
-                plt.plot(self.df_ohlcv.index, self.df_ohlcv[k], color)
+                plt.plot(self.df_ohlcv.index, plots[k], color)
                 plt.ylabel(f"{k}")
                 i = i + 1
 
         plt.subplot(plt_num,1,i)
-        plt.plot(self.df_ohlcv.index, self.balance_history)
+        plt.plot(self.df_ohlcv.index, self.result.balance)
         plt.hlines(y=0, xmin=self.df_ohlcv.index[0],
                    xmax=self.df_ohlcv.index[-1], colors='k', linestyles='dashed')
         plt.ylabel("PL(USD)")
@@ -350,6 +413,4 @@ class BitMexBackTest(BitMexStub):
         """
         Draw the graph
         """
-        self.df_ohlcv.at[self.index, name] = value
-        if name not in self.plot_data:
-            self.plot_data[name] = {'color': color, 'overlay': overlay}
\ No newline at end of file
+        self.result.plot(name, self.bar_index, value, color, overlay)
\ No newline at end of file
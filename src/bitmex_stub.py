@@ -2,6 +2,7 @@
 
 from src import logger
 from src.bitmex import BitMex
+from src.matching_engine import MatchingEngine
 
 # stub trading
 class BitMexStub(BitMex):
@@ -31,8 +32,8 @@ class BitMexStub(BitMex):
     max_draw_down_session = 0
     # max drawdown session %
     max_draw_down_session_perc = 0
-    # orders
-    open_orders = []
+    # resting limit and stop orders
+    orders = None
 
     def __init__(self, account, pair, threading=True):
         """
@@ -42,6 +43,7 @@ class BitMexStub(BitMex):
         :param threading:
         """
         self.pair = pair
+        self.orders = MatchingEngine()
         BitMex.__init__(self, account, pair, threading=threading)
         self.balance_ath = self.balance
 
@@ -84,7 +86,7 @@ class BitMexStub(BitMex):
         """
         cancel the current orders
         """
-        self.open_orders = []
+        self.orders.clear()
 
     def close_all(self):
         """
@@ -115,7 +117,7 @@ class BitMexStub(BitMex):
         :param long: Long or short?
         :return success
         """
-        self.open_orders = [o for o in self.open_orders if o["id"] != id]
+        self.orders.cancel(id)
         return True
 
     def entry(self, id, long, qty, limit=0, stop=0, post_only=False, when=True):
@@ -146,7 +148,7 @@ class BitMexStub(BitMex):
         ord_qty = qty + abs(pos_size)
 
         if limit > 0 or stop > 0:
-            self.open_orders.append({"id": id, "long": long, "qty": ord_qty, "limit": limit, "stop": stop, "post_only": post_only})
+            self.orders.add(id, long, ord_qty, limit, stop, post_only)
         else:
             self.commit(id, long, ord_qty, self.get_market_price(), True)
             return
@@ -204,7 +206,7 @@ class BitMexStub(BitMex):
             return
 
         if limit > 0 or stop > 0:
-            self.open_orders.append({"id": id, "long": long, "qty": ord_qty, "limit": limit, "stop": stop, "post_only": post_only})
+            self.orders.add(id, long, ord_qty, limit, stop, post_only)
         else:
             self.commit(id, long, ord_qty, self.get_market_price(), True)
             return
@@ -340,40 +342,14 @@ class BitMexStub(BitMex):
         :param strategy:
         """
         def __override_strategy(open, close, high, low, volume):
-            new_open_orders = []
-
             if self.get_position_size() > 0 and low[-1] > self.get_trail_price():
                 self.set_trail_price(low[-1])
             if self.get_position_size() < 0 and high[-1] < self.get_trail_price():
                 self.set_trail_price(high[-1])
 
-            for _, order in enumerate(self.open_orders):
-                id = order["id"]
-                long = order["long"]
-                qty = order["qty"]
-                limit = order["limit"]
-                stop = order["stop"]
-                post_only = order["post_only"]
-
-                if limit > 0 and stop > 0:
-                    if (long and high[-1] > stop and close[-1] < limit) or (not long and low[-1] < stop and close[-1] > limit):
-                        self.commit(id, long, qty, limit, False)
-                        continue
-                    elif (long and high[-1] > stop) or (not long and low[-1] < stop):
-                        new_open_orders.append({"id": id, "long": long, "qty": qty, "limit": limit, "stop": 0})
-                        continue
-                elif limit > 0:
-                    if (long and low[-1] < limit) or (not long and high[-1] > limit):
-                        self.commit(id, long, qty, limit, False)
-                        continue
-                elif stop > 0:
-                    if (long and high[-1] > stop) or (not long and low[-1] < stop):
-                        self.commit(id, long, qty, stop, False)
-                        continue
-
-                new_open_orders.append(order)
-
-            self.open_orders = new_open_orders
+            for id, long, qty, price in self.orders.match(high[-1], low[-1], close[-1]):
+                self.commit(id, long, qty, price, False)
+
             strategy(open, close, high, low, volume)
             self.eval_exit()
 
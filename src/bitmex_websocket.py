@@ -9,9 +9,11 @@ import traceback
 import urllib
 
 import websocket
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 
-from src import logger, to_data_frame, notify
+from src import logger, notify
+from src.bar_builder import Bar
+from src.event_queue import EventQueue
 from src.config import config as conf
 
 
@@ -43,7 +45,9 @@ class BitMexWs:
     # condition that the bot runs on.
     is_running = True
     # Notification destination listener
-    handlers = {}
+    handlers = None
+    # Events waiting for the handlers, None to run the handlers on the receive thread
+    queue = None
     
     def __init__(self, account, pair, test=False):
         """
@@ -52,6 +56,10 @@ class BitMexWs:
         self.account = account
         self.pair = pair
         self.testnet = test
+        self.handlers = {}
+        # the instrument and order book tables send partial updates, no event is conflated or
+        # dropped, the socket thread of the pair waits while the queue is full
+        self.queue = EventQueue(self.__handle, name=f"events-{self.pair}", block=True)
         if test:
             domain = 'testnet.bitmex.com'
         else:
@@ -123,19 +131,10 @@ class BitMexWs:
                 data = obj['data']
 
                 if table.startswith("tradeBin"):
-                    data[0]['timestamp'] = datetime.strptime(data[0]['timestamp'][:-5], '%Y-%m-%dT%H:%M:%S')
-                    new_data = []
-                    new_data.append(data[0])
-                    #add placeholder tick so it resamples correctly
-                    new_data.append({
-                        "timestamp": data[0]['timestamp'] + timedelta(seconds=0.01),
-                        "open": data[0]['close'],
-                        "high": data[0]['close'],
-                        "low" : data[0]['close'],
-                        "close" : data[0]['close'],
-                        "volume": 0
-                    })                    
-                    self.__emit(table, action, to_data_frame(new_data))                 
+                    d = data[0]
+                    timestamp = datetime.strptime(d['timestamp'][:-5], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+                    bar = Bar(int(timestamp.timestamp()) * 1000000000, d['open'], d['high'], d['low'], d['close'], d['volume'])
+                    self.__emit(table, action, bar)
                 elif table.startswith("instrument"):
                     self.__emit(table, action, data[0])
 
@@ -159,16 +158,28 @@ class BitMexWs:
         """
         send data
         """
-        if key in self.handlers:
-            self.handlers[key](action, value)
+        if key not in self.handlers:
+            return
+        if self.queue is not None:
+            self.queue.put(key, action, value)
+        else:
+            self.__handle(key, action, value)
+
+    def __handle(self, key, action, value):
+        handler = self.handlers.get(key)
+        if handler is None:
+            return
+        if key == 'close':
+            handler()
+        else:
+            handler(action, value)
 
     def __on_close(self, ws):
         """
         On Close Listener
         :param ws:
         """
-        if 'close' in self.handlers:
-            self.handlers['close']()
+        self.__emit('close', None, None)
 
         if self.is_running:
             logger.info("Websocket restart")
@@ -221,3 +232,4 @@ class BitMexWs:
         """
         self.is_running = False
         self.ws.close()
+        self.queue.stop()
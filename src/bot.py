@@ -1,8 +1,15 @@
 # coding: UTF-8
 
+import multiprocessing
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-from hyperopt import fmin, tpe, STATUS_OK, STATUS_FAIL, Trials
+import numpy as np
+import pandas as pd
+from hyperopt import fmin, tpe, space_eval, pyll, STATUS_OK, STATUS_FAIL, Trials
+from hyperopt.base import Domain, spec_from_misc, JOB_STATE_RUNNING, JOB_STATE_DONE
+from hyperopt.utils import coarse_utcnow
 
 from src import logger, notify
 from src.bitmex import BitMex
@@ -11,10 +18,42 @@ from src.bitmex_stub import BitMexStub
 from src.binance_futures_stub import BinanceFuturesStub
 from src.bitmex_backtest import BitMexBackTest
 from src.binance_futures_backtest import BinanceFuturesBackTest
+from src.pruning import Pruned
+from src.sweep import Sweep, sample
+from src.trial_store import TrialStore, fingerprint
+from src.walk_forward import WalkForward
 from datetime import datetime, timezone
 from time import sleep
 import time
 
+# Trial database of the parameter searches
+TRIALS_DB = os.path.join(os.path.dirname(__file__), "../hyperopt/trials.sqlite")
+
+# Bot and OHLCV data of a parameter search worker process
+search_bot = None
+search_ohlcv = None
+
+
+def init_search_worker(bot, df_ohlcv):
+    """
+    initialize a parameter search worker process.
+    with the fork start method the arguments are inherited, so the OHLCV data is shared copy-on-write
+    :param bot: bot to evaluate
+    :param df_ohlcv: OHLCV data
+    """
+    global search_bot, search_ohlcv
+    search_bot = bot
+    search_ohlcv = df_ohlcv
+
+
+def run_search_trial(args):
+    """
+    evaluate a parameter set in a worker process
+    :param args: parameters
+    :return: hyperopt result
+    """
+    return search_bot.evaluate(args, search_ohlcv)
+
 
 class Bot:
     # Parameters
@@ -37,6 +76,27 @@ class Bot:
     stub_test = False
     # parameter search?
     hyperopt = False
+    # Number of parameter search processes
+    workers = 1
+    # Number of parameter search evaluations
+    max_evals = 200
+    # Number of parameter sets of a sweep, 0 when not sweeping
+    sweep = 0
+    # Indicator values shared by the parameter sets of a sweep
+    memo_cache = None
+    # Trial database of the parameter search, None to keep the trials in memory only
+    trials_path = TRIALS_DB
+    # TrialStore of the running parameter search
+    trial_store = None
+    # Refresh the local OHLCV history before a back test, search, sweep or walk-forward, once
+    # in this process. new bars change the data fingerprint so the stored trials are not reused
+    sync_history = False
+    # Loss reported for a back test stopped by a pruning rule
+    prune_loss = 100
+    # (train, test) days of the walk-forward windows, None when not running a walk-forward
+    walk_forward = None
+    # Run the live streams on the asyncio runtime
+    async_runtime = False
 
     def __init__(self, bin_size):
         """
@@ -52,6 +112,14 @@ class Bot:
         """
         pass
 
+    def pruning(self):
+        """
+        Rules of src.pruning stopping the back test of a parameter set early during a
+        parameter search, for instance [MaxDrawdown(30), MinTrades(10, checkpoint=0.5)].
+        A stopped back test reports prune_loss to the search.
+        """
+        return []
+
     def ohlcv_len(self):
         """
         The length of the OHLC to the strategy
@@ -82,45 +150,256 @@ class Bot:
         """
         pass
 
+    def signals(self, df):
+        """
+        Precomputed signals, optional. A bot can compute its indicators and entry / exit
+        conditions here as arrays over the whole OHLCV data frame, and read the value at
+        the current bar in strategy with self.exchange.signal(name).
+        Back tests call it once with the whole history, live trading once per closed bar
+        with the last ohlcv_len bars, so a value must only depend on the bars up to its own.
+        Bots whose only orders are "long" and "short" market entries reversing the
+        position can also be evaluated by the Sweep runner, indicators should then be
+        computed with self.memo.
+        :param df: OHLCV data frame
+        :return: dict of signal name -> array of len(df)
+        """
+        return {}
+
+    def memo(self, func, *args):
+        """
+        func(*args) memoized during a parameter sweep, so an indicator is computed
+        once per distinct parameter. for instance self.memo(sma, close, fast_len)
+        :param func: indicator function
+        :param args: arrays and parameters of the indicator
+        """
+        if self.memo_cache is None:
+            return func(*args)
+        key = (func,) + tuple((a.__array_interface__["data"][0], a.shape, a.strides, a.dtype.str)
+                              if isinstance(a, np.ndarray) else a for a in args)
+        if key not in self.memo_cache:
+            self.memo_cache[key] = func(*args)
+        return self.memo_cache[key]
+
+    def backtest_exchange(self):
+        """
+        create the back test exchange
+        :return: exchange
+        """
+        if self.exchange_arg == "bitmex":
+            return BitMexBackTest(account=self.account, pair=self.pair)
+        if self.exchange_arg == "binance":
+            return BinanceFuturesBackTest(account=self.account, pair=self.pair)
+        raise Exception("--exchange argument missing or invalid")
+
+    def evaluate(self, args, df_ohlcv=None, pruning=True):
+        """
+        back test a parameter set
+        :param args: parameters
+        :param df_ohlcv: OHLCV data, loaded from the file when None
+        :param pruning: stop the back test early with the pruning() rules
+        :return: hyperopt result
+        """
+        logger.info(f"Params : {args}")
+        try:
+            self.params = args
+            self.exchange = self.backtest_exchange()
+            self.exchange.ohlcv_len = self.ohlcv_len()
+            self.exchange.signals = self.signals
+            self.exchange.df_ohlcv = df_ohlcv
+            self.exchange.pruning_rules = self.pruning() if pruning else None
+            self.exchange.on_update(self.bin_size, self.strategy)
+            profit_factor = self.exchange.win_profit/self.exchange.lose_loss
+            logger.info(f"Profit Factor : {profit_factor}")
+            ret = {
+                'status': STATUS_OK,
+                'loss': 1/profit_factor
+            }
+        except Pruned as e:
+            ret = {
+                'status': STATUS_OK,
+                'loss': self.prune_loss,
+                'pruned': str(e)
+            }
+        except Exception as e:
+            ret = {
+                'status': STATUS_FAIL
+            }
+
+        return ret
+
+    def stored_evaluate(self, args, df_ohlcv, vals=None):
+        """
+        back test a parameter set, unless its result is in the trial store
+        :param args: parameters
+        :param df_ohlcv: OHLCV data
+        :param vals: hyperopt vals of the trial, stored with the result
+        :return: hyperopt result
+        """
+        if self.trial_store is not None:
+            result = self.trial_store.get(args)
+            if result is not None:
+                logger.info(f"Params : {args} already evaluated")
+                return result
+        result = self.evaluate(args, df_ohlcv)
+        # pruned results depend on the rules, they are evaluated again by the next search
+        if self.trial_store is not None and 'pruned' not in result:
+            self.trial_store.put(args, result, vals)
+        return result
+
+    def stored_trials(self, space):
+        """
+        trials of the trial store as completed hyperopt trials, so TPE resumes from them.
+        they are rebuilt from the stored hyperopt vals, not from the evaluated values,
+        which differ for hp.choice (index and option). trials stored without vals are skipped
+        :param space: search space
+        :return: trials
+        """
+        trials = Trials()
+        if self.trial_store is None:
+            return trials
+        domain = Domain(lambda args: None, space)
+        stored = [(result, vals) for _, result, vals in self.trial_store.trials()
+                  if vals is not None and set(vals) == set(domain.params)]
+        if len(stored) == 0:
+            return trials
+
+        tids = trials.new_trial_ids(len(stored))
+        miscs = [{'tid': tid, 'cmd': domain.cmd, 'workdir': domain.workdir,
+                  'idxs': {label: [tid] if len(values) > 0 else [] for label, values in vals.items()},
+                  'vals': vals} for tid, (_, vals) in zip(tids, stored)]
+        docs = trials.new_trial_docs(tids, [None] * len(stored), [result for result, _ in stored], miscs)
+        for doc in docs:
+            doc['state'] = JOB_STATE_DONE
+        trials.insert_trial_docs(docs)
+        trials.refresh()
+        logger.info(f"Resuming from {len(stored)} stored trials")
+        return trials
+
     def params_search(self):
         """
  ˜      function to search params
         """
-        def objective(args):
-            logger.info(f"Params : {args}")
-            try:
-                if self.exchange_arg == "bitmex":
-                    self.params = args
-                    self.exchange = BitMexBackTest(account=self.account, pair=self.pair)
-                    self.exchange.on_update(self.bin_size, self.strategy)
-                    profit_factor = self.exchange.win_profit/self.exchange.lose_loss
-                    logger.info(f"Profit Factor : {profit_factor}")
-                    ret = {
-                        'status': STATUS_OK,
-                        'loss': 1/profit_factor
-                    }
-                if self.exchange_arg == 'binance':
-                    self.params = args
-                    self.exchange = BinanceFuturesBackTest(account=self.account, pair=self.pair)
-                    self.exchange.on_update(self.bin_size, self.strategy)
-                    profit_factor = self.exchange.win_profit/self.exchange.lose_loss
-                    logger.info(f"Profit Factor : {profit_factor}")
-                    ret = {
-                        'status': STATUS_OK,
-                        'loss': 1/profit_factor
-                    }
-            except Exception as e:
-                ret = {
-                    'status': STATUS_FAIL
-                }
-
-            return ret
+        # the data is loaded once and shared by every trial
+        exchange = self.backtest_exchange()
+        exchange.sync_history = self.sync_history
+        exchange.load_ohlcv(self.bin_size)
+        df_ohlcv = exchange.df_ohlcv
 
-        trials = Trials()
-        best_params = fmin(objective, self.options(), algo=tpe.suggest, trials=trials, max_evals=200)
+        if self.trials_path is not None:
+            self.trial_store = TrialStore(self.trials_path, type(self).__name__, self.pair, self.bin_size,
+                                          fingerprint(df_ohlcv))
+        try:
+            if self.workers > 1:
+                trials = self.parallel_params_search(df_ohlcv)
+                best_params = trials.argmin
+            else:
+                def objective(expr, memo, ctrl):
+                    args = pyll.rec_eval(expr, memo=memo)
+                    return self.stored_evaluate(args, df_ohlcv, ctrl.current_trial['misc']['vals'])
+
+                trials = self.stored_trials(self.options())
+                best_params = fmin(objective, self.options(), algo=tpe.suggest, trials=trials,
+                                   max_evals=self.max_evals, pass_expr_memo_ctrl=True)
+        finally:
+            if self.trial_store is not None:
+                self.trial_store.close()
+                self.trial_store = None
         logger.info(f"Best params is {best_params}")
         logger.info(f"Best profit factor is {1/trials.best_trial['result']['loss']}")
 
+    def params_sweep(self):
+        """
+        evaluate sweep parameter sets drawn from options() together with the Sweep runner
+        """
+        exchange = self.backtest_exchange()
+        exchange.sync_history = self.sync_history
+        exchange.load_ohlcv(self.bin_size)
+        param_sets = sample(self.options(), self.sweep)
+        table = Sweep(self, exchange.df_ohlcv, exchange).run(param_sets)
+        logger.info(f"Sweep of {len(param_sets)} parameter sets\n{table.head(20).to_string()}")
+        return table
+
+    def params_walk_forward(self):
+        """
+        walk-forward optimization over the OHLCV history, the windows of walk_forward days
+        run on workers processes. the out of sample equity curve is saved next to the trial database
+        :return: windows, equity curve
+        """
+        exchange = self.backtest_exchange()
+        exchange.sync_history = self.sync_history
+        exchange.load_ohlcv(self.bin_size)
+        train, test = self.walk_forward
+        table, equity = WalkForward(self, exchange.df_ohlcv, pd.Timedelta(days=train), pd.Timedelta(days=test),
+                                    self.workers).run()
+
+        logger.info(f"Walk-forward windows\n{table.to_string()}")
+        if len(equity) > 0:
+            logger.info(f"Out of sample profit : {equity.iloc[-1]}")
+            path = os.path.join(os.path.dirname(TRIALS_DB), f"walk_forward_{type(self).__name__}_{self.pair}.csv")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            equity.to_csv(path, header=["profit"])
+            logger.info(f"Out of sample equity curve : {path}")
+        return table, equity
+
+    def parallel_params_search(self, df_ohlcv):
+        """
+        search params with the back tests spread over a process pool.
+        a new parameter set is suggested by TPE every time a worker becomes free
+        :param df_ohlcv: OHLCV data shared by the workers
+        :return: trials
+        """
+        space = self.options()
+        domain = Domain(lambda args: None, space)
+        trials = self.stored_trials(space)
+        rstate = np.random.default_rng()
+        context = multiprocessing.get_context("fork") \
+            if "fork" in multiprocessing.get_all_start_methods() else None
+        queued = len(trials)
+        running = {}
+        # the store stays in this process, workers only run the back tests
+        store, self.trial_store = self.trial_store, None
+
+        logger.info(f"Parameter search with {self.workers} workers")
+
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                 initializer=init_search_worker, initargs=(self, df_ohlcv)) as executor:
+            while queued < self.max_evals or len(running) > 0:
+                while queued < self.max_evals and len(running) < self.workers:
+                    new_ids = trials.new_trial_ids(1)
+                    trials.refresh()
+                    docs = tpe.suggest(new_ids, domain, trials, rstate.integers(2 ** 31 - 1))
+                    trials.insert_trial_docs(docs)
+                    trials.refresh()
+                    # the inserted docs can be copies (SONify with bson), the trials keep their own
+                    docs = [doc for doc in trials._dynamic_trials if doc['tid'] in new_ids]
+                    for doc in docs:
+                        doc['book_time'] = coarse_utcnow()
+                        args = space_eval(space, spec_from_misc(doc['misc']))
+                        result = None if store is None else store.get(args)
+                        if result is not None:
+                            logger.info(f"Params : {args} already evaluated")
+                            doc['state'] = JOB_STATE_DONE
+                            doc['result'] = result
+                            doc['refresh_time'] = coarse_utcnow()
+                        else:
+                            doc['state'] = JOB_STATE_RUNNING
+                            running[executor.submit(run_search_trial, args)] = (doc, args)
+                    queued += len(docs)
+                    trials.refresh()
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    doc, args = running.pop(future)
+                    doc['state'] = JOB_STATE_DONE
+                    doc['result'] = future.result()
+                    doc['refresh_time'] = coarse_utcnow()
+                    if store is not None and 'pruned' not in doc['result']:
+                        store.put(args, doc['result'], doc['misc']['vals'])
+                trials.refresh()
+
+        self.trial_store = store
+        return trials
+
     def run(self):
         """
 ˜       Function to run the bot
@@ -130,6 +409,16 @@ class Bot:
             self.params_search()
             return
 
+        elif self.walk_forward is not None:
+            logger.info("Bot Mode : Walk-forward")
+            self.params_walk_forward()
+            return
+
+        elif self.sweep > 0:
+            logger.info("Bot Mode : Sweep")
+            self.params_sweep()
+            return
+
         elif self.stub_test:
             logger.info(f"Bot Mode : Stub")
             if self.exchange_arg == "binance":
@@ -148,16 +437,19 @@ class Bot:
             else:
                 logger.info(f"--exchange argument missing or invalid")
                 return
+            self.exchange.sync_history = self.sync_history
         else:
             logger.info(f"Bot Mode : Trade")
             if self.exchange_arg == "binance":
                 self.exchange = BinanceFutures(account=self.account, pair=self.pair, demo=self.test_net)
+                self.exchange.async_runtime = self.async_runtime
             elif self.exchange_arg == "bitmex":
                 self.exchange = BitMex(account=self.account, pair=self.pair, demo=self.test_net)
             else:
                 logger.info(f"--exchange argument missing or invalid")
                 return
         self.exchange.ohlcv_len = self.ohlcv_len()
+        self.exchange.signals = self.signals
         self.exchange.on_update(self.bin_size, self.strategy)
 
         logger.info(f"Starting Bot")
@@ -0,0 +1,180 @@
+# coding: UTF-8
+
+import collections
+import threading
+import time
+import traceback
+
+from src import logger
+
+
+class EventQueue:
+    """
+    Bounded queue between the websocket receive thread and the handlers of a bot.
+    The handlers run on a dedicated worker thread, in the order the events were received,
+    so a handler waiting on a REST call or a sleep no longer holds up the socket reads.
+    An event of a conflated key replaces the pending event of the same key instead of
+    being queued, the worker only sees the latest ticker.
+    The receive thread is usually shared by the bots of every pair of an account, so
+    it never waits on a full queue: the event is dropped, counted in the overflow
+    metric and logged, and the other bots keep receiving their events. A queue fed by
+    a receive thread of its own can be created blocking, the thread then waits for
+    the worker and no event is dropped.
+    """
+    # Max number of pending events
+    maxsize = 10000
+    # Keys of the events that only matter by their latest value
+    conflate = frozenset()
+    # Lag in seconds logged as a warning
+    lag_warning = 5
+
+    def __init__(self, handler, conflate=(), maxsize=10000, name="events", block=False):
+        """
+        constructor
+        :param handler: func(key, action, value) run by the worker for every event
+        :param conflate: keys of the conflated events
+        :param maxsize: max number of pending events
+        :param name: name of the worker thread
+        :param block: True to make put wait while the queue is full, only for a receive
+                      thread that feeds this queue alone
+        """
+        self.handler = handler
+        self.conflate = frozenset(conflate)
+        self.maxsize = maxsize
+        self.block = block
+        # [key, action, value, time it was queued]
+        self.events = collections.deque()
+        # conflated key -> its pending event
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.running = True
+        self.busy = False
+        # metrics
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.processed = 0
+        self.conflated = 0
+        self.blocked = 0
+        self.overflow = 0
+        self.lagging = False
+        self.overflowing = False
+        self.thread = threading.Thread(target=self.__run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.events)
+
+    def put(self, key, action, value):
+        """
+        queue an event, it is dropped when the queue is full unless the queue is
+        blocking, then the receive thread waits
+        """
+        with self.condition:
+            if not self.running:
+                return
+            event = self.pending.get(key)
+            if event is not None:
+                event[1] = action
+                event[2] = value
+                self.conflated += 1
+                return
+            if len(self.events) >= self.maxsize and not self.block:
+                self.overflow += 1
+                if not self.overflowing:
+                    logger.warning(f"{self.thread.name} : {self.maxsize} events pending, new events are dropped")
+                self.overflowing = True
+                return
+            if len(self.events) >= self.maxsize:
+                self.blocked += 1
+                while len(self.events) >= self.maxsize and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+            self.overflowing = False
+            event = [key, action, value, time.time()]
+            self.events.append(event)
+            if key in self.conflate:
+                self.pending[key] = event
+            self.max_depth = max(self.max_depth, len(self.events))
+            self.condition.notify_all()
+
+    def __run(self):
+        while True:
+            with self.condition:
+                while len(self.events) == 0 and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                event = self.events.popleft()
+                key, action, value, queued = event
+                if self.pending.get(key) is event:
+                    del self.pending[key]
+                self.busy = True
+                self.condition.notify_all()
+
+            self.__lag(time.time() - queued)
+            try:
+                self.handler(key, action, value)
+            except Exception as e:
+                logger.error(e)
+                logger.error(traceback.format_exc())
+
+            with self.condition:
+                self.busy = False
+                self.processed += 1
+                self.condition.notify_all()
+
+    def __lag(self, lag):
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        if lag > self.lag_warning and not self.lagging:
+            logger.warning(f"{self.thread.name} : events are handled {lag:.1f}s late, {len(self.events)} pending")
+        self.lagging = lag > self.lag_warning
+
+    def lag(self):
+        """
+        seconds the oldest pending event has been waiting
+        """
+        with self.condition:
+            return time.time() - self.events[0][3] if len(self.events) > 0 else 0.0
+
+    def metrics(self):
+        """
+        queue depth and lag
+        :return: dict of depth, max_depth, lag (s), last_lag (s), max_lag (s), processed,
+                 conflated, blocked (number of times the receive thread waited) and
+                 overflow (events dropped because the queue was full)
+        """
+        with self.condition:
+            return {
+                "depth": len(self.events),
+                "max_depth": self.max_depth,
+                "lag": time.time() - self.events[0][3] if len(self.events) > 0 else 0.0,
+                "last_lag": self.last_lag,
+                "max_lag": self.max_lag,
+                "processed": self.processed,
+                "conflated": self.conflated,
+                "blocked": self.blocked,
+                "overflow": self.overflow,
+            }
+
+    def join(self, timeout=None):
+        """
+        wait until every queued event is handled
+        :return: False on timeout
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: (len(self.events) == 0 and not self.busy) or not self.running,
+                                           timeout)
+
+    def stop(self):
+        """
+        stop the worker, the pending events are dropped
+        """
+        with self.condition:
+            self.running = False
+            self.events.clear()
+            self.pending.clear()
+            self.condition.notify_all()
@@ -22,6 +22,11 @@ class BotFactory():
             bot.account = args.account
             bot.exchange_arg = args.exchange
             bot.pair = args.pair
+            bot.workers = args.workers
+            bot.sweep = args.sweep
+            bot.walk_forward = args.walk_forward
+            bot.async_runtime = args.asyncio
+            bot.sync_history = args.sync_history
             return bot
         except Exception as _:
             raise Exception(f"Not Found Strategy : {args.strategy}")
@@ -0,0 +1,196 @@
+# coding: UTF-8
+
+import threading
+import time
+
+import numpy as np
+
+from src import logger, allowed_range, delta
+from src.bar_builder import BarBuilder, DAY_NS, to_ns, to_timestamp
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the request weight spent per period.
+    """
+    # Weight available per period
+    budget = 1200
+    # Period in seconds
+    period = 60
+
+    def __init__(self, budget, period=60):
+        """
+        constructor
+        :param budget: weight available per period
+        :param period: period in seconds
+        """
+        self.budget = budget
+        self.period = period
+        self.tokens = budget
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, weight=1):
+        """
+        wait until the weight is available and spend it
+        :param weight: weight of the request
+        """
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.budget, self.tokens + (now - self.updated) * self.budget / self.period)
+                self.updated = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                time.sleep((weight - self.tokens) * self.period / self.budget)
+
+
+class HistorySync:
+    """
+    Keeps an OhlcvStore of bin_size bars in sync with the exchange.
+    The stored timestamps are compared with the expected bar grid and only the
+    missing ranges (head, gaps and stale tail) are downloaded, page by page, then
+    aggregated to bin_size and merged into the store. Running it again on an up to
+    date store does not fetch anything.
+    Gaps the exchange has no bars for, followed by bars it has, are recorded in the
+    store metadata and not requested again.
+    """
+    # Time frame of the store
+    bin_size = "1h"
+    # Max number of base bars returned by one request
+    page_size = 1500
+    # Weight of one request
+    page_weight = 1
+
+    def __init__(self, store, bin_size, fetch, page_size=1500, page_weight=1, rate_limiter=None):
+        """
+        constructor
+        :param store: OhlcvStore of bin_size bars
+        :param bin_size: time frame
+        :param fetch: fetch(bin_size, start_time, end_time) returning the base bars labeled
+                      between start_time and end_time, at most page_size rows
+        :param page_size: max number of rows returned by fetch
+        :param page_weight: request weight of one fetch
+        :param rate_limiter: RateLimiter shared by the requests
+        """
+        self.store = store
+        self.bin_size = bin_size
+        self.fetch = fetch
+        self.page_size = page_size
+        self.page_weight = page_weight
+        self.rate_limiter = rate_limiter
+
+    def origin(self, start_time):
+        """
+        origin of the bar grid, the first stored bar or the start of the first day
+        """
+        timestamps = self.store.arrays()["timestamp"]
+        if len(timestamps) > 0:
+            return int(timestamps[0])
+        start = to_ns(start_time)
+        return start - start % DAY_NS
+
+    def missing_ranges(self, start_time, end_time):
+        """
+        ranges of closed bars between start_time and end_time that are not in the store
+        :return: list of (first label, last label) in nanoseconds
+        """
+        step = int(delta(self.bin_size).total_seconds()) * 10 ** 9
+        origin = self.origin(start_time)
+        first = origin - (-(to_ns(start_time) - origin) // step) * step
+        # bars labeled after end_time are still forming
+        last = origin + (to_ns(end_time) - origin) // step * step
+        if first > last:
+            return []
+
+        timestamps = np.asarray(self.store.arrays()["timestamp"])
+        ranges = holes(timestamps, first, last, step)
+        for empty_first, empty_last in self.store.empty_ranges():
+            ranges = [part for r in ranges for part in subtract(r, empty_first, empty_last, step)]
+        return ranges
+
+    def sync(self, start_time, end_time):
+        """
+        download the missing bars between start_time and end_time
+        :return: number of bars added to the store
+        """
+        base_bin_size = allowed_range[self.bin_size][0]
+        base_step = int(delta(base_bin_size).total_seconds()) * 10 ** 9
+        step = int(delta(self.bin_size).total_seconds()) * 10 ** 9
+        origin = self.origin(start_time)
+        stored_last = self.store.last_timestamp()
+        stored_last = to_ns(stored_last) if stored_last is not None else None
+        count = 0
+        empty = []
+
+        for first, last in self.missing_ranges(start_time, end_time):
+            logger.info(f"Fetching OHLCV data - {to_timestamp(first)} - {to_timestamp(last)}")
+            builder = BarBuilder(self.bin_size, (last - first) // step + 1)
+            builder.origin = origin
+            # first base bar of the first missing bin
+            left = first - step + base_step
+
+            while left <= last:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire(self.page_weight)
+                page = self.fetch(base_bin_size, to_timestamp(left), to_timestamp(last))
+                if len(page) == 0:
+                    break
+                for timestamp, open, high, low, close, volume in zip(page.index.asi8,
+                                                                      page["open"].values,
+                                                                      page["high"].values,
+                                                                      page["low"].values,
+                                                                      page["close"].values,
+                                                                      page["volume"].values):
+                    builder.update(int(timestamp), open, high, low, close, volume, final=True)
+                left = int(page.index.asi8[-1]) + base_step
+                if len(page) < self.page_size:
+                    break
+
+            # the bin of the last base bar is complete when the range is
+            forming = builder.forming()
+            if forming is not None and forming[0] <= last:
+                builder.buffer.append(*forming)
+
+            data = builder.buffer.to_data_frame()
+            data = data[(data.index >= to_timestamp(first)) & (data.index <= to_timestamp(last))]
+            count += self.store.merge(data)
+
+            # holes followed by a bar will not be filled anymore, a hole at the end may still be
+            labels = data.dropna(subset=["open"]).index.asi8
+            following = int(labels[-1]) if len(labels) > 0 else None
+            if stored_last is not None and stored_last > last:
+                following = stored_last
+            if following is not None:
+                empty += [(a, b) for a, b in holes(labels, first, last, step) if b < following]
+
+        if len(empty) > 0:
+            logger.info(f"No OHLCV data from the exchange for {len(empty)} ranges, they are skipped from now on")
+            self.store.add_empty_ranges(empty)
+        return count
+
+
+def holes(timestamps, first, last, step):
+    """
+    ranges of the bar grid between first and last without a timestamp
+    :return: list of (first label, last label)
+    """
+    timestamps = np.asarray(timestamps)
+    timestamps = timestamps[(timestamps >= first) & (timestamps <= last)]
+    points = np.concatenate([[first - step], timestamps, [last + step]])
+    gaps = np.flatnonzero(np.diff(points) > step)
+    return [(int(points[i]) + step, int(points[i + 1]) - step) for i in gaps]
+
+
+def subtract(gap, first, last, step):
+    """
+    parts of a range of labels outside first - last
+    """
+    a, b = gap
+    parts = []
+    if a < first:
+        parts.append((a, min(b, first - step)))
+    if b > last:
+        parts.append((max(a, last + step), b))
+    return [(a, b) for a, b in parts if a <= b]
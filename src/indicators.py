@@ -0,0 +1,391 @@
+# coding: UTF-8
+
+import math
+from bisect import bisect_left, insort
+from collections import deque
+
+import numpy as np
+
+# bar fields in the order the strategy takes them
+SOURCES = ("open", "close", "high", "low", "volume")
+
+
+class Indicator:
+    """
+    Base of the streaming indicators.
+    update() takes the next value and returns the indicator value in O(1), Rci aside,
+    nan until enough values have been seen, so the values are the same as the TA-Lib /
+    pandas functions of src computed over the whole series.
+    The last `history` values are kept and can be read like the arrays,
+    indicator[-1] being the value of the last bar.
+    """
+    # Bar field the indicator is computed from
+    source = "close"
+    # Number of values kept
+    history = 10
+
+    def __init__(self, source="close", history=10):
+        """
+        constructor
+        :param source: bar field, one of open, close, high, low, volume
+        :param history: number of values kept
+        """
+        self.source = source
+        self.history = history
+        self.__source = SOURCES.index(source)
+        self.values = deque([math.nan] * history, maxlen=history)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def value(self):
+        """
+        value of the last bar
+        """
+        return self.values[-1]
+
+    def bar(self, open, close, high, low, volume):
+        """
+        update with a closed bar
+        :return: indicator value
+        """
+        return self.update((open, close, high, low, volume)[self.__source])
+
+    def seed(self, open, close, high, low, volume):
+        """
+        update with closed bars, for instance the bars received before the indicator was created
+        :param open, close, high, low, volume: arrays of the same length, oldest first
+        """
+        for bar in zip(open, close, high, low, volume):
+            self.bar(*bar)
+
+    def update(self, value):
+        """
+        update with the next value
+        :return: indicator value
+        """
+        value = self.next(value)
+        self.values.append(value)
+        return value
+
+    def next(self, value):
+        raise NotImplementedError()
+
+
+class Sma(Indicator):
+    """
+    Simple moving average, same as src.sma
+    """
+
+    def __init__(self, period, source="close", history=10):
+        Indicator.__init__(self, source, history)
+        self.period = int(period)
+        self.window = deque()
+        self.sum = 0.0
+        self.count = 0
+
+    def next(self, value):
+        self.window.append(value)
+        self.sum += value
+        if len(self.window) > self.period:
+            self.sum -= self.window.popleft()
+        # a running sum drifts, it is summed again once per period
+        self.count += 1
+        if self.count % self.period == 0:
+            self.sum = math.fsum(self.window)
+        if len(self.window) < self.period:
+            return math.nan
+        return self.sum / self.period
+
+
+class Stdev(Indicator):
+    """
+    Rolling sample standard deviation, same as src.stdev
+    """
+
+    def __init__(self, period, source="close", history=10):
+        Indicator.__init__(self, source, history)
+        self.period = int(period)
+        self.window = deque()
+        self.mean = 0.0
+        # sum of the squared differences from the mean
+        self.m2 = 0.0
+
+    def next(self, value):
+        self.window.append(value)
+        n = len(self.window)
+        d = value - self.mean
+        self.mean += d / n
+        self.m2 += d * (value - self.mean)
+        if n > self.period:
+            old = self.window.popleft()
+            n -= 1
+            d = old - self.mean
+            self.mean -= d / n
+            self.m2 -= d * (old - self.mean)
+        if n < self.period or n < 2:
+            return math.nan
+        return math.sqrt(max(self.m2, 0.0) / (n - 1))
+
+
+class Ema(Indicator):
+    """
+    Exponential moving average seeded with the sma of the first period values, same as src.ema
+    """
+
+    def __init__(self, period, source="close", history=10):
+        Indicator.__init__(self, source, history)
+        self.period = int(period)
+        self.k = 2.0 / (self.period + 1)
+        self.count = 0
+        self.ema = 0.0
+
+    def next(self, value):
+        if value != value and self.count == 0:
+            # leading nan are skipped like TA-Lib
+            return math.nan
+        self.count += 1
+        if self.count < self.period:
+            self.ema += value
+            return math.nan
+        if self.count == self.period:
+            self.ema = (self.ema + value) / self.period
+        else:
+            self.ema += self.k * (value - self.ema)
+        return self.ema
+
+
+class Wma(Indicator):
+    """
+    Linearly weighted moving average, same as src.wma
+    """
+
+    def __init__(self, period, source="close", history=10):
+        Indicator.__init__(self, source, history)
+        self.period = int(period)
+        self.divider = self.period * (self.period + 1) / 2
+        self.window = deque()
+        # sum of the window and sum weighted by 1..period, oldest first
+        self.sum = 0.0
+        self.weighted = 0.0
+        self.count = 0
+
+    def next(self, value):
+        if value != value and len(self.window) == 0:
+            # leading nan are skipped like TA-Lib
+            return math.nan
+        if len(self.window) == self.period:
+            self.weighted += self.period * value - self.sum
+            self.sum += value - self.window.popleft()
+        else:
+            self.weighted += (len(self.window) + 1) * value
+            self.sum += value
+        self.window.append(value)
+        # the running sums drift, they are summed again once per period
+        self.count += 1
+        if self.count % self.period == 0:
+            self.sum = math.fsum(self.window)
+            self.weighted = math.fsum((i + 1) * v for i, v in enumerate(self.window))
+        if len(self.window) < self.period:
+            return math.nan
+        return self.weighted / self.divider
+
+
+class Hull(Indicator):
+    """
+    Hull moving average, same as src.hull
+    """
+
+    def __init__(self, period, source="close", history=10):
+        Indicator.__init__(self, source, history)
+        self.period = period
+        self.half = Wma(period / 2, history=1)
+        self.full = Wma(period, history=1)
+        self.smooth = Wma(round(math.sqrt(period)), history=1)
+
+    def next(self, value):
+        diff = 2 * self.half.update(value) - self.full.update(value)
+        return self.smooth.update(diff)
+
+
+class Rsi(Indicator):
+    """
+    Relative strength index with Wilder smoothing, same as src.rsi
+    """
+
+    def __init__(self, period=14, source="close", history=10):
+        Indicator.__init__(self, source, history)
+        self.period = int(period)
+        self.prev = None
+        self.count = 0
+        self.gain = 0.0
+        self.loss = 0.0
+
+    def next(self, value):
+        if self.prev is None:
+            self.prev = value
+            return math.nan
+        change = value - self.prev
+        self.prev = value
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        self.count += 1
+        if self.count <= self.period:
+            self.gain += gain
+            self.loss += loss
+            if self.count < self.period:
+                return math.nan
+            self.gain /= self.period
+            self.loss /= self.period
+        else:
+            self.gain = (self.gain * (self.period - 1) + gain) / self.period
+            self.loss = (self.loss * (self.period - 1) + loss) / self.period
+        total = self.gain + self.loss
+        return 100 * self.gain / total if total != 0 else 0.0
+
+
+class Atr(Indicator):
+    """
+    Average true range with Wilder smoothing, same as src.atr
+    """
+
+    def __init__(self, period=14, history=10):
+        Indicator.__init__(self, "close", history)
+        self.period = int(period)
+        self.prev_close = None
+        self.count = 0
+        self.atr = 0.0
+
+    def bar(self, open, close, high, low, volume):
+        if self.prev_close is None:
+            self.prev_close = close
+            return self.update(math.nan)
+        tr = max(high, self.prev_close) - min(low, self.prev_close)
+        self.prev_close = close
+        return self.update(tr)
+
+    def next(self, tr):
+        if tr != tr:
+            return math.nan
+        self.count += 1
+        if self.count < self.period:
+            self.atr += tr
+            return math.nan
+        if self.count == self.period:
+            self.atr = (self.atr + tr) / self.period
+        else:
+            self.atr = (self.atr * (self.period - 1) + tr) / self.period
+        return self.atr
+
+
+class Highest(Indicator):
+    """
+    Highest value of the last period values, same as src.highest
+    """
+    # Sign applied to the values, -1 turns the max into a min
+    sign = 1
+
+    def __init__(self, period, source="high", history=10):
+        Indicator.__init__(self, source, history)
+        self.period = int(period)
+        self.count = 0
+        # (index, value) with decreasing values, the max is the first one
+        self.candidates = deque()
+
+    def next(self, value):
+        value = self.sign * value
+        while len(self.candidates) > 0 and self.candidates[-1][1] <= value:
+            self.candidates.pop()
+        self.candidates.append((self.count, value))
+        if self.candidates[0][0] <= self.count - self.period:
+            self.candidates.popleft()
+        self.count += 1
+        if self.count < self.period:
+            return math.nan
+        return self.sign * self.candidates[0][1]
+
+
+class Lowest(Highest):
+    """
+    Lowest value of the last period values, same as src.lowest
+    """
+    sign = -1
+
+    def __init__(self, period, source="low", history=10):
+        Highest.__init__(self, period, source, history)
+
+
+class Rci(Indicator):
+    """
+    Rank correlation index, same as src.rci_series.
+    The window is also kept sorted, so ranking it is one binary search per price
+    instead of sorting it again on every bar.
+    Unlike the other indicators an update is not O(1): every price of the window
+    changes its rank, so it costs O(period log period), the same order as one bar
+    of rci_series, with the per bar overhead of numpy.
+    """
+
+    def __init__(self, period, source="close", history=10):
+        Indicator.__init__(self, source, history)
+        self.period = int(period)
+        self.window = deque()
+        self.sorted = []
+        # oldest price first, the newest one has the time rank 1
+        self.time_rank = np.arange(self.period, 0, -1)
+        self.divider = self.period * (self.period * self.period - 1.0)
+
+    def next(self, value):
+        self.window.append(value)
+        insort(self.sorted, value)
+        if len(self.window) > self.period:
+            del self.sorted[bisect_left(self.sorted, self.window.popleft())]
+        if len(self.window) < self.period or self.period < 2:
+            return math.nan
+        window = np.fromiter(self.window, dtype=np.float64, count=self.period)
+        # 1 + number of higher prices, equal prices share the best rank
+        price_rank = 1 + self.period - np.searchsorted(self.sorted, window, side="right")
+        dist = float(((self.time_rank - price_rank) ** 2).sum())
+        return (1.0 - 6.0 * dist / self.divider) * 100.0
+
+
+class Indicators:
+    """
+    Streaming indicators of a strategy.
+    An indicator is created and seeded with the closed bars the first time the
+    strategy asks for it, then updated with every closed bar, so the strategy cost
+    per bar no longer grows with the indicator period, Rci aside.
+    """
+
+    def __init__(self):
+        # (class, args, kwargs) -> indicator
+        self.indicators = {}
+
+    def __len__(self):
+        return len(self.indicators)
+
+    def get(self, cls, args, kwargs, bars):
+        """
+        the indicator, created if it does not exist
+        :param cls: indicator class
+        :param args: positional parameters of the indicator
+        :param kwargs: keyword parameters of the indicator
+        :param bars: function returning the closed bars (open, close, high, low, volume) to seed it with
+        """
+        key = (cls, args, tuple(sorted(kwargs.items())))
+        indicator = self.indicators.get(key)
+        if indicator is None:
+            indicator = cls(*args, **kwargs)
+            indicator.seed(*bars())
+            self.indicators[key] = indicator
+        return indicator
+
+    def update(self, open, close, high, low, volume):
+        """
+        update every indicator with a closed bar
+        """
+        for indicator in self.indicators.values():
+            indicator.bar(open, close, high, low, volume)
@@ -0,0 +1,142 @@
+# coding: UTF-8
+
+import heapq
+
+
+class MatchingEngine:
+    """
+    Resting limit and stop orders of the stub and back test exchanges.
+    The orders wait in four heaps, buy / sell limits and buy / sell stops, ordered by
+    the price that triggers them first, so a bar only pops the orders its high or low
+    crossed instead of checking every order.
+    A cancel only drops the order from the id index, its heap entries are skipped
+    when they reach the top and the heaps are rebuilt once most entries are cancelled.
+    Triggered orders are filled in the order they were placed, like the list of
+    orders the stubs used to scan.
+    """
+    # Rebuild the heaps when the cancelled entries outnumber the live orders and this count
+    compact_size = 64
+
+    def __init__(self):
+        # sequence number -> order
+        self.live = {}
+        # order id -> sequence numbers, an id can be used by several pyramiding orders
+        self.ids = {}
+        # (sort key, sequence number), the key of the heaps filled from the top is the negative price
+        self.buy_limits = []
+        self.sell_limits = []
+        self.buy_stops = []
+        self.sell_stops = []
+        self.seq = 0
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.live)
+
+    def open_orders(self):
+        """
+        resting orders, oldest first
+        """
+        return [self.live[seq] for seq in sorted(self.live)]
+
+    def add(self, id, long, qty, limit=0, stop=0, post_only=False):
+        """
+        place an order
+        :param id: order id
+        :param long: buy or sell
+        :param qty: quantity
+        :param limit: limit price, 0 for a stop market order
+        :param stop: stop price, 0 for a limit order
+        :param post_only: post only
+        """
+        seq = self.seq
+        self.seq += 1
+        self.live[seq] = {"id": id, "long": long, "qty": qty, "limit": limit, "stop": stop, "post_only": post_only}
+        self.ids.setdefault(id, []).append(seq)
+        self.__push(seq)
+
+    def __push(self, seq):
+        order = self.live[seq]
+        if order["stop"] > 0:
+            # a buy stop triggers when the high is above the stop price, a sell stop when the low is below it
+            if order["long"]:
+                heapq.heappush(self.buy_stops, (order["stop"], seq))
+            else:
+                heapq.heappush(self.sell_stops, (-order["stop"], seq))
+        elif order["long"]:
+            # a buy limit fills when the low is below the limit price, a sell limit when the high is above it
+            heapq.heappush(self.buy_limits, (-order["limit"], seq))
+        else:
+            heapq.heappush(self.sell_limits, (order["limit"], seq))
+
+    def cancel(self, id):
+        """
+        cancel the orders of an id
+        """
+        for seq in self.ids.pop(id, ()):
+            if self.live.pop(seq, None) is not None:
+                self.dead += 1
+        if self.dead > len(self.live) + self.compact_size:
+            self.__compact()
+
+    def clear(self):
+        """
+        cancel every order
+        """
+        self.live.clear()
+        self.ids.clear()
+        for heap in (self.buy_limits, self.sell_limits, self.buy_stops, self.sell_stops):
+            heap.clear()
+        self.dead = 0
+
+    def __compact(self):
+        for heap in (self.buy_limits, self.sell_limits, self.buy_stops, self.sell_stops):
+            heap[:] = [entry for entry in heap if entry[1] in self.live]
+            heapq.heapify(heap)
+        self.dead = 0
+
+    def __pop(self, heap, crossed, triggered):
+        """
+        pop the orders of a heap whose sort key is below crossed
+        """
+        while len(heap) > 0 and heap[0][0] < crossed:
+            _, seq = heapq.heappop(heap)
+            if seq in self.live:
+                triggered.append(seq)
+            else:
+                self.dead -= 1
+
+    def match(self, high, low, close):
+        """
+        trigger the orders crossed by a bar.
+        a stop limit order whose stop is crossed fills at its limit when the close is past
+        the limit, otherwise it rests as a limit order from the next bar.
+        :param high: high of the bar
+        :param low: low of the bar
+        :param close: close of the bar
+        :return: fills (id, long, qty, price), oldest order first
+        """
+        triggered = []
+        self.__pop(self.buy_limits, -low, triggered)
+        self.__pop(self.sell_limits, high, triggered)
+        self.__pop(self.buy_stops, high, triggered)
+        self.__pop(self.sell_stops, -low, triggered)
+        if len(triggered) == 0:
+            return []
+
+        fills = []
+        for seq in sorted(triggered):
+            order = self.live[seq]
+            limit = order["limit"]
+            long = order["long"]
+            if order["stop"] > 0 and limit > 0 and not (close < limit if long else close > limit):
+                order["stop"] = 0
+                self.__push(seq)
+                continue
+            del self.live[seq]
+            seqs = self.ids[order["id"]]
+            seqs.remove(seq)
+            if len(seqs) == 0:
+                del self.ids[order["id"]]
+            fills.append((order["id"], long, order["qty"], limit if limit > 0 else order["stop"]))
+        return fills
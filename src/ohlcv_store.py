@@ -0,0 +1,179 @@
+# coding: UTF-8
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# column name -> dtype, one raw little endian file per column
+COLUMNS = {
+    "timestamp": "<i8",
+    "open": "<f8",
+    "high": "<f8",
+    "low": "<f8",
+    "close": "<f8",
+    "volume": "<f8",
+}
+
+
+class OhlcvStore:
+    """
+    Columnar binary OHLCV storage.
+    Every column is a raw array file in the store directory, timestamps are int64
+    nanoseconds since epoch (UTC). Reading maps the files straight into numpy arrays
+    and appending only writes the new rows at the end of each file.
+    """
+    # Store directory
+    path = None
+
+    def __init__(self, path):
+        """
+        constructor
+        :param path: store directory, for instance ohlc/{pair}/{bin_size}
+        """
+        self.path = path
+
+    def __file(self, column):
+        return os.path.join(self.path, column + ".bin")
+
+    def __metadata_file(self):
+        return os.path.join(self.path, "metadata.json")
+
+    def metadata(self):
+        """
+        metadata of the store
+        :return: dict
+        """
+        if not os.path.exists(self.__metadata_file()):
+            return {}
+        with open(self.__metadata_file()) as f:
+            return json.load(f)
+
+    def empty_ranges(self):
+        """
+        ranges the exchange has no bars for, like maintenance windows
+        :return: list of (first label, last label) in nanoseconds
+        """
+        return [tuple(r) for r in self.metadata().get("empty_ranges", [])]
+
+    def add_empty_ranges(self, ranges):
+        """
+        record ranges confirmed empty by the exchange
+        :param ranges: list of (first label, last label) in nanoseconds
+        """
+        if len(ranges) == 0:
+            return
+        metadata = self.metadata()
+        metadata["empty_ranges"] = sorted(set(self.empty_ranges()) | {(int(a), int(b)) for a, b in ranges})
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self.__metadata_file() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(metadata, f)
+        os.replace(tmp, self.__metadata_file())
+
+    def exists(self):
+        """
+        the store has been written
+        """
+        return os.path.exists(self.__file("timestamp"))
+
+    def __len__(self):
+        """
+        number of complete rows, a row is complete once it is in every column file
+        """
+        if not self.exists():
+            return 0
+        return min(os.path.getsize(self.__file(column)) // np.dtype(dtype).itemsize
+                   for column, dtype in COLUMNS.items() if os.path.exists(self.__file(column)))
+
+    def last_timestamp(self):
+        """
+        last stored timestamp, None when empty
+        """
+        n = len(self)
+        if n == 0:
+            return None
+        timestamp = np.memmap(self.__file("timestamp"), dtype=COLUMNS["timestamp"], mode="r", shape=(n,))
+        return pd.Timestamp(int(timestamp[-1]), tz="UTC")
+
+    def arrays(self):
+        """
+        read only memory mapped columns
+        :return: dict of column name -> array
+        """
+        n = len(self)
+        if n == 0:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in COLUMNS.items()}
+        return {column: np.memmap(self.__file(column), dtype=dtype, mode="r", shape=(n,))
+                for column, dtype in COLUMNS.items()}
+
+    def read(self):
+        """
+        read the whole store
+        :return: OHLCV data frame indexed by UTC timestamps
+        """
+        arrays = self.arrays()
+        index = pd.DatetimeIndex(np.asarray(arrays.pop("timestamp")), tz="UTC", name="timestamp")
+        return pd.DataFrame({column: np.asarray(values) for column, values in arrays.items()}, index=index)
+
+    def append(self, data_frame):
+        """
+        append the rows that are newer than the last stored timestamp
+        :param data_frame: OHLCV data frame indexed by timestamps
+        :return: number of appended rows
+        """
+        data_frame = data_frame.dropna(subset=["open"])
+        last = self.last_timestamp()
+        if last is not None:
+            data_frame = data_frame[data_frame.index > last]
+        if len(data_frame) == 0:
+            return 0
+
+        os.makedirs(self.path, exist_ok=True)
+        n = len(self)
+        index = data_frame.index
+        if index.tz is None:
+            index = index.tz_localize("UTC")
+        values = {"timestamp": index.tz_convert("UTC").asi8}
+        for column in COLUMNS:
+            if column != "timestamp":
+                values[column] = data_frame[column].values
+
+        for column, dtype in COLUMNS.items():
+            file = self.__file(column)
+            with open(file, "r+b" if os.path.exists(file) else "wb") as f:
+                # drop a row left behind by an interrupted append
+                f.truncate(n * np.dtype(dtype).itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(values[column], dtype=dtype).tobytes())
+        return len(data_frame)
+
+    def merge(self, data_frame):
+        """
+        insert rows anywhere in the store, rows with a stored timestamp replace the stored ones.
+        appends when every row is newer than the store, otherwise the columns are rewritten
+        :param data_frame: OHLCV data frame indexed by timestamps
+        :return: number of new timestamps
+        """
+        data_frame = data_frame.dropna(subset=["open"])
+        last = self.last_timestamp()
+        if len(data_frame) == 0:
+            return 0
+        if last is None or data_frame.index[0] > last:
+            return self.append(data_frame)
+
+        stored = self.read()
+        count = len(data_frame.index.difference(stored.index))
+        merged = pd.concat([stored, data_frame[stored.columns]])
+        merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+
+        tmp = OhlcvStore(self.path + ".tmp")
+        for column in COLUMNS:
+            if os.path.exists(tmp.__file(column)):
+                os.remove(tmp.__file(column))
+        tmp.append(merged)
+        for column in COLUMNS:
+            os.replace(tmp.__file(column), self.__file(column))
+        os.rmdir(tmp.path)
+        return count
@@ -0,0 +1,196 @@
+# coding: UTF-8
+
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+from src import logger, notify
+
+
+class OrderManager:
+    """
+    Runs cancel / replace intents on its own thread instead of the websocket thread.
+    Intents are queued per key (for instance "TP" or "SL"), a newer intent replaces
+    the one still waiting for the same key. Cancels and new orders are confirmed by
+    the order update events of the user data stream, which also keep the open
+    orders cache up to date.
+    An intent not confirmed in time stays pending, as its request may still be in
+    flight, until an order update of its key or a REST reconcile of the open orders
+    shows what became of it, so it is never issued twice.
+    """
+    # Seconds to wait for an order update confirming a cancel or a new order
+    confirm_timeout = 5
+    # Seconds an intent stays unconfirmed before the open orders are reconciled with REST
+    reconcile_interval = 10
+    # Order statuses of open orders
+    open_statuses = ("NEW", "PARTIALLY_FILLED")
+
+    def __init__(self, confirm_timeout=5, reconcile=None, reconcile_interval=10):
+        """
+        constructor
+        :param confirm_timeout: seconds to wait for a confirmation
+        :param reconcile: function returning the open orders from REST
+        :param reconcile_interval: seconds before an unconfirmed intent is reconciled
+        """
+        self.confirm_timeout = confirm_timeout
+        self.reconcile = reconcile
+        self.reconcile_interval = reconcile_interval
+        self.condition = threading.Condition()
+        # key -> (cancel id, cancel, place) waiting to run
+        self.intents = OrderedDict()
+        # key of the intent that is running
+        self.running = None
+        # key -> time of the intents whose outcome is unknown
+        self.unconfirmed = {}
+        # clientOrderId -> order
+        self.open_orders = {}
+        self.is_running = True
+        self.thread = threading.Thread(target=self.__run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, key, cancel_id=None, cancel=None, place=None):
+        """
+        queue an intent
+        :param key: intent key, the prefix of the client order id
+        :param cancel_id: client order id to cancel first
+        :param cancel: function cancelling an order by client order id
+        :param place: function placing the new order
+        """
+        with self.condition:
+            self.intents[key] = (cancel_id, cancel, place)
+            self.condition.notify_all()
+
+    def pending(self, key):
+        """
+        an intent for the key is waiting, running or not confirmed yet
+        """
+        with self.condition:
+            return key in self.intents or self.running == key or key in self.unconfirmed
+
+    def load(self, orders):
+        """
+        replace the open orders cache, for instance with the REST open orders
+        :param orders: list of orders
+        """
+        with self.condition:
+            self.open_orders = {o["clientOrderId"]: o for o in orders or []}
+            self.condition.notify_all()
+
+    def open_order(self, id):
+        """
+        cached open order whose client order id starts with id
+        """
+        with self.condition:
+            for client_order_id, order in self.open_orders.items():
+                if client_order_id.startswith(id):
+                    return order
+            return None
+
+    def on_order_update(self, order):
+        """
+        update the open orders cache from an order update event
+        :param order: order with the REST field names
+        """
+        with self.condition:
+            if order["status"] in self.open_statuses:
+                self.open_orders[order["clientOrderId"]] = order
+            else:
+                self.open_orders.pop(order["clientOrderId"], None)
+            # the order of an unconfirmed intent was accepted, rejected or cancelled
+            for key in [key for key in self.unconfirmed if order["clientOrderId"].startswith(key)]:
+                del self.unconfirmed[key]
+            self.condition.notify_all()
+
+    def stop(self):
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+
+    def __wait(self, predicate):
+        """
+        wait for an order update
+        :return: False on timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(predicate, timeout=self.confirm_timeout):
+                logger.info(f"Order update not received in {self.confirm_timeout}s")
+                return False
+            return True
+
+    def __reconcile_due(self):
+        return self.reconcile is not None and \
+            any(time.time() - since >= self.reconcile_interval for since in self.unconfirmed.values())
+
+    def __reconcile(self):
+        """
+        settle the unconfirmed intents with the open orders read from REST
+        """
+        started = time.time()
+        try:
+            orders = self.reconcile()
+        except Exception as e:
+            logger.error(f"An error occurred. {e}")
+            orders = None
+            failed = True
+        else:
+            failed = False
+
+        with self.condition:
+            if failed:
+                # try again after the interval
+                self.unconfirmed = {key: max(since, started) for key, since in self.unconfirmed.items()}
+                return
+            self.open_orders = {o["clientOrderId"]: o for o in orders or []}
+            for key, since in list(self.unconfirmed.items()):
+                # open, or not open in a snapshot taken long enough after the request
+                if since + self.reconcile_interval <= started or \
+                        any(id.startswith(key) for id in self.open_orders):
+                    logger.info(f"{key} order reconciled with the open orders")
+                    del self.unconfirmed[key]
+            self.condition.notify_all()
+
+    def __run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: not self.is_running or len(self.intents) > 0 or self.__reconcile_due(),
+                                        timeout=self.reconcile_interval if len(self.unconfirmed) > 0 else None)
+                if not self.is_running:
+                    return
+                if len(self.intents) == 0:
+                    intent = None
+                else:
+                    key, (cancel_id, cancel, place) = self.intents.popitem(last=False)
+                    self.running = key
+                    intent = key
+
+            if intent is None:
+                if self.__reconcile_due():
+                    self.__reconcile()
+                continue
+
+            confirmed = False
+            try:
+                if cancel_id is not None:
+                    cancel(cancel_id)
+                    if not self.__wait(lambda: cancel_id not in self.open_orders):
+                        # the old order may still be open, the new one is not placed
+                        continue
+                if place is not None:
+                    place()
+                    if not self.__wait(lambda: self.open_order(key) is not None):
+                        continue
+                confirmed = True
+            except Exception as e:
+                logger.error(f"An error occurred. {e}")
+                logger.error(traceback.format_exc())
+                notify(f"An error occurred. {e}")
+                notify(traceback.format_exc())
+            finally:
+                with self.condition:
+                    self.running = None
+                    if not confirmed:
+                        logger.info(f"{key} order not confirmed, pending until an order update or a reconcile")
+                        self.unconfirmed[key] = time.time()
+                    self.condition.notify_all()
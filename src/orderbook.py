@@ -1,18 +1,134 @@
 import sys, time
+from heapq import heappush, heappop, heapify
 
 from src.bitmex_websocket import BitMexWs
 from src import logger
 
+
+class Ladder:
+    """
+    One side of the book, price levels in a dict of price -> size.
+    Changing the size of a level is a dict update, adding one also pushes its price on
+    a heap of the lowest and a heap of the highest prices, O(log n). Removed prices stay
+    in the heaps until they reach the top, so the best and worst levels are read from
+    the heaps and the levels are only sorted when the top n levels are read.
+    """
+    # Bid side, best price is the highest
+    bid = False
+    # Rebuild the heaps when their removed prices outnumber the levels and this count
+    compact_size = 64
+
+    def __init__(self, bid):
+        """
+        constructor
+        :param bid: bid side or ask side
+        """
+        self.bid = bid
+        # price -> size
+        self.sizes = {}
+        # lowest prices first
+        self.low = []
+        # negative prices, highest prices first
+        self.high = []
+        # ascending prices, None until read after a level is added or removed
+        self.prices = None
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def set(self, price, size):
+        """
+        set the size of a price level, a size of 0 removes the level
+        """
+        if size <= 0:
+            self.remove(price)
+            return
+        if price not in self.sizes:
+            heappush(self.low, price)
+            heappush(self.high, -price)
+            self.prices = None
+            if len(self.low) > 2 * len(self.sizes) + self.compact_size:
+                self.__compact()
+        self.sizes[price] = size
+
+    def remove(self, price):
+        """
+        remove a price level
+        """
+        if self.sizes.pop(price, None) is None:
+            return
+        self.prices = None
+
+    def clear(self):
+        self.sizes = {}
+        self.low = []
+        self.high = []
+        self.prices = None
+
+    def __compact(self):
+        self.low = list(self.sizes)
+        heapify(self.low)
+        self.high = [-price for price in self.sizes]
+        heapify(self.high)
+
+    def __lowest(self):
+        while len(self.low) > 0 and self.low[0] not in self.sizes:
+            heappop(self.low)
+        return self.low[0] if len(self.low) > 0 else None
+
+    def __highest(self):
+        while len(self.high) > 0 and -self.high[0] not in self.sizes:
+            heappop(self.high)
+        return -self.high[0] if len(self.high) > 0 else None
+
+    def best(self):
+        """
+        best price level
+        :return: (price, size) or None
+        """
+        price = self.__highest() if self.bid else self.__lowest()
+        return None if price is None else (price, self.sizes[price])
+
+    def worst(self):
+        """
+        price level the furthest from the best one
+        :return: (price, size) or None
+        """
+        price = self.__lowest() if self.bid else self.__highest()
+        return None if price is None else (price, self.sizes[price])
+
+    def levels(self, n=None):
+        """
+        price levels from the best one
+        :param n: number of levels, all when None
+        :return: list of (price, size)
+        """
+        if self.prices is None:
+            self.prices = sorted(self.sizes)
+        if self.bid:
+            prices = self.prices[::-1] if n is None else self.prices[:-n - 1:-1]
+        else:
+            prices = self.prices if n is None else self.prices[:n]
+        return [(price, self.sizes[price]) for price in prices]
+
+
 class OrderBook:
+    """
+    Local L2 order book fed by the orderBookL2 websocket stream.
+    Messages are lists of levels {"id", "side", "price", "size"}, the BitMex
+    orderBookL2 table or Binance partial depth snapshots which carry no id.
+    """
     inited = False
-    asks = {}
-    bids = {}
     ask_max_price = 0
     bid_min_price = 0
     best_bid_price = 0
     best_ask_price = 0
 
     def __init__(self, ws):
+        self.asks = Ladder(bid=False)
+        self.bids = Ladder(bid=True)
+        # level id -> (side, price), updates and deletes of BitMex only carry the id
+        self.ids = {}
         self.ws = ws
         self.ws.bind('orderBookL2', self.__update)
 
@@ -22,34 +138,84 @@ class OrderBook:
 
         if action == "partial":
             self.inited = True
+            self.asks.clear()
+            self.bids.clear()
+            self.ids = {}
 
         for v in values:
-            ordId = v['id']
-            side = v['side']
-            orders = self.asks if side == "Buy" else self.bids
+            ordId = v.get('id', v.get('price'))
             if action == "partial" or \
                     action == "insert":
-                orders[ordId] = v
-            elif action == "update" and ordId in orders:
-                orders[ordId]["size"] = v['size']
-            elif action == "delete" and ordId in orders:
-                del orders[ordId]
-
-        bid_prices = sorted([v['price'] for v in self.asks.values()])
-        ask_prices = sorted([v['price'] for v in self.bids.values()])        
-
-        if len(ask_prices) > 0:
-            self.ask_max_price = ask_prices[-1]
-        if len(bid_prices) > 0:
-            self.bid_min_price = bid_prices[0]
-        if len(ask_prices) > 0:
-            self.best_bid_price = bid_prices[-1]
-        if len(ask_prices) > 0:
-            self.best_ask_price = ask_prices[0]       
-        
+                self.ids[ordId] = (v['side'], v['price'])
+                self.__ladder(v['side']).set(v['price'], v['size'])
+            elif action == "update" and ordId in self.ids:
+                side, price = self.ids[ordId]
+                self.__ladder(side).set(price, v['size'])
+            elif action == "delete" and ordId in self.ids:
+                side, price = self.ids.pop(ordId)
+                self.__ladder(side).remove(price)
+
+        best_bid = self.bids.best()
+        best_ask = self.asks.best()
+        if best_ask is not None:
+            self.best_ask_price = best_ask[0]
+            self.ask_max_price = self.asks.worst()[0]
+        if best_bid is not None:
+            self.best_bid_price = best_bid[0]
+            self.bid_min_price = self.bids.worst()[0]
+
+    def __ladder(self, side):
+        return self.bids if side == "Buy" else self.asks
 
     def get_prices(self):
         return self.best_bid_price, self.best_ask_price
+
+    def depth(self, n):
+        """
+        best n levels of each side
+        :return: bids, asks as lists of (price, size), best first
+        """
+        return self.bids.levels(n), self.asks.levels(n)
+
+    def cumulative_size(self, n):
+        """
+        size available up to each of the best n levels
+        :return: bids, asks as lists of (price, cumulative size)
+        """
+        def cumulate(levels):
+            total = 0
+            rval = []
+            for price, size in levels:
+                total += size
+                rval.append((price, total))
+            return rval
+
+        bids, asks = self.depth(n)
+        return cumulate(bids), cumulate(asks)
+
+    def mid_price(self):
+        """
+        middle of the best bid and ask, None when a side is empty
+        """
+        best_bid = self.bids.best()
+        best_ask = self.asks.best()
+        if best_bid is None or best_ask is None:
+            return None
+        return (best_bid[0] + best_ask[0]) / 2
+
+    def microprice(self):
+        """
+        mid price weighted by the size on the opposite side, None when a side is empty
+        """
+        best_bid = self.bids.best()
+        best_ask = self.asks.best()
+        if best_bid is None or best_ask is None:
+            return None
+        bid_price, bid_size = best_bid
+        ask_price, ask_size = best_ask
+        return (bid_price * ask_size + ask_price * bid_size) / (bid_size + ask_size)
+
+
 if __name__ == '__main__':
     ws = BitMexWs(account=BitMexWs.account, pair=BitMexWs.pair)
     ob = OrderBook(ws)
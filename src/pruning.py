@@ -0,0 +1,67 @@
+# coding: UTF-8
+
+
+class Pruned(Exception):
+    """
+    A back test stopped by a pruning rule
+    """
+    pass
+
+
+class PruneRule:
+    """
+    Rule stopping a parameter search back test that can no longer give a good result.
+    Rules are checked by the back test exchange while it runs.
+    """
+
+    def check(self, exchange, progress):
+        """
+        :param exchange: back test exchange
+        :param progress: fraction of the bars evaluated so far, from 0 to 1
+        :return: the reason to stop the back test, None to continue
+        """
+        return None
+
+
+class MaxDrawdown(PruneRule):
+    """
+    Stop when the session drawdown exceeds a ceiling
+    """
+    # Drawdown ceiling in %
+    percent = 50
+
+    def __init__(self, percent):
+        """
+        constructor
+        :param percent: drawdown ceiling in %
+        """
+        self.percent = percent
+
+    def check(self, exchange, progress):
+        if exchange.max_draw_down_session_perc > self.percent:
+            return f"drawdown {exchange.max_draw_down_session_perc:.2f}% > {self.percent}%"
+        return None
+
+
+class MinTrades(PruneRule):
+    """
+    Stop when too few orders were filled by a checkpoint
+    """
+    # Min number of orders
+    count = 1
+    # Fraction of the bars at which the orders are counted
+    checkpoint = 0.5
+
+    def __init__(self, count, checkpoint=0.5):
+        """
+        constructor
+        :param count: min number of orders
+        :param checkpoint: fraction of the bars at which the orders are counted
+        """
+        self.count = count
+        self.checkpoint = checkpoint
+
+    def check(self, exchange, progress):
+        if progress >= self.checkpoint and exchange.order_count < self.count:
+            return f"{exchange.order_count} orders < {self.count} at {progress:.0%} of the bars"
+        return None
@@ -17,6 +17,8 @@ from src import (
     sma,
     crossover,
     crossunder,
+    crossover_series,
+    crossunder_series,
     over,
     under,
     last,
@@ -35,7 +37,9 @@ from src import (
     bbands,
     supertrend,
     heikinashi,
+    heikinashi_values,
 )
+from src.indicators import Sma
 from src.bitmex import BitMex
 from src.binance_futures import BinanceFutures
 from src.bitmex_stub import BitMexStub
@@ -95,14 +99,20 @@ class SMA(Bot):
             "slow_len": hp.quniform("slow_len", 1, 30, 1),
         }
 
-    def strategy(self, open, close, high, low, volume):
-        lot = self.exchange.get_lot()
+    def signals(self, df):
         fast_len = self.input("fast_len", int, 9)
         slow_len = self.input("slow_len", int, 16)
-        fast_sma = sma(close, fast_len)
-        slow_sma = sma(close, slow_len)
-        golden_cross = crossover(fast_sma, slow_sma)
-        dead_cross = crossunder(fast_sma, slow_sma)
+        fast_sma = self.memo(sma, df["close"].values, fast_len)
+        slow_sma = self.memo(sma, df["close"].values, slow_len)
+        return {
+            "long": crossover_series(fast_sma, slow_sma),
+            "short": crossunder_series(fast_sma, slow_sma),
+        }
+
+    def strategy(self, open, close, high, low, volume):
+        lot = self.exchange.get_lot()
+        golden_cross = self.exchange.signal("long")
+        dead_cross = self.exchange.signal("short")
         if golden_cross:
             self.exchange.entry("Long", True, lot)
         if dead_cross:
@@ -323,6 +333,23 @@ class Sample(Bot):
         factor = 10 ** decimals
         return math.floor(number * factor) / factor
 
+    def signals(self, df):
+        # indicator lengths
+        fast_len = self.input("fast_len", int, 6)
+        slow_len = self.input("slow_len", int, 18)
+
+        # setting indicators once over the whole data, they usually take source and length as arguments
+        sma1 = sma(df["close"].values, fast_len)
+        sma2 = sma(df["close"].values, slow_len)
+
+        # entry conditions of every bar
+        return {
+            "sma1": sma1,
+            "sma2": sma2,
+            "long_entry": crossover_series(sma1, sma2),
+            "short_entry": crossunder_series(sma1, sma2),
+        }
+
     def strategy(self, open, close, high, low, volume):
 
         # get lot or set your own value which will be used to size orders
@@ -330,17 +357,9 @@ class Sample(Bot):
         lot = self.exchange.get_lot()
         pos_size = self.exchange.get_position_size()
 
-        # indicator lengths
-        fast_len = self.input("fast_len", int, 6)
-        slow_len = self.input("slow_len", int, 18)
-
-        # setting indicators, they usually take source and length as arguments
-        sma1 = sma(close, fast_len)
-        sma2 = sma(close, slow_len)
-
-        # entry conditions
-        long_entry_condition = crossover(sma1, sma2)
-        short_entry_condition = crossunder(sma1, sma2)
+        # entry conditions of the current bar computed by signals
+        long_entry_condition = self.exchange.signal("long_entry")
+        short_entry_condition = self.exchange.signal("short_entry")
 
         # setting a simple stop loss and profit target in % using built-in simple profit take and stop loss implementation
         # which is placing the sl and tp automatically after entering a position
@@ -376,8 +395,8 @@ class Sample(Bot):
 
         # OHLCV and indicator data, you can access history using list index
         # log indicator values
-        logger.info(f"sma1: {sma1[-1]}")
-        logger.info(f"second last sma2: {sma2[-2]}")
+        logger.info(f"sma1: {self.exchange.signal('sma1')}")
+        logger.info(f"second last sma2: {self.exchange.signal('sma2', bars_ago=1)}")
         # log last candle OHLCV values
         logger.info(f"open: {open[-1]}")
         logger.info(f"high: {high[-1]}")
@@ -428,9 +447,9 @@ class SMA2(Bot):
         logger.info(f"slow_len: {slow_len}")
         logger.info(f"trend_len: {trend_len}")
 
-        fast_sma = sma(close, fast_len)
-        slow_sma = sma(close, slow_len)
-        trend_sma = sma(close, trend_len)
+        fast_sma = self.exchange.indicator(Sma, fast_len)
+        slow_sma = self.exchange.indicator(Sma, slow_len)
+        trend_sma = self.exchange.indicator(Sma, trend_len)
 
         uptrend = True if trend_sma[-1] > trend_sma[-3] or trend_sma[-1] > trend_sma[-10] else False
         downtrend = True if trend_sma[-1] < trend_sma[-3] or trend_sma[-1] < trend_sma[-10] else False
@@ -514,9 +533,9 @@ class YYY(Bot):
         slow_len = self.input("slow_len", int, int(os.environ.get("BOT_SLOW_LEN", 18)))
         trend_len = self.input("trend_len", int, int(os.environ.get("BOT_TREND_LEN", 1200)))
 
-        fast_sma = sma(close, fast_len)
-        slow_sma = sma(close, slow_len)
-        trend_sma = sma(close, trend_len)
+        fast_sma = self.exchange.indicator(Sma, fast_len)
+        slow_sma = self.exchange.indicator(Sma, slow_len)
+        trend_sma = self.exchange.indicator(Sma, trend_len)
 
         uptrend = True if trend_sma[-1] > trend_sma[-3] or trend_sma[-1] > trend_sma[-10] else False
         downtrend = True if trend_sma[-1] < trend_sma[-3] or trend_sma[-1] < trend_sma[-10] else False
@@ -615,11 +634,8 @@ class Heikinashi(Bot):
 
         source = self.exchange.security(str(resolution) + "m")
 
-        hadf = heikinashi(source)
-        hadf_fast = heikinashi(hadf)
-
-        ha_open_values = hadf_fast["HA_open"].values
-        ha_close_values = hadf_fast["HA_close"].values
+        ha_open_values, _, _, ha_close_values = heikinashi_values(source["open"].values, source["high"].values,
+                                                                  source["low"].values, source["close"].values)
         variant = self.variants[variant_type]
 
         ha_open_fast = variant(ha_open_values, fast_len)
@@ -0,0 +1,187 @@
+# coding: UTF-8
+
+import itertools
+
+import numpy as np
+import pandas as pd
+from hyperopt.pyll.stochastic import sample as sample_space
+
+from src import logger
+
+
+def grid(values):
+    """
+    every combination of parameter values
+    :param values: dict of parameter name -> list of values
+    :return: list of parameter sets
+    """
+    names = list(values.keys())
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def sample(space, n, seed=None):
+    """
+    distinct parameter sets drawn from a hyperopt space, for instance Bot.options()
+    :param space: hyperopt space
+    :param n: number of draws
+    :param seed: random seed
+    :return: list of parameter sets
+    """
+    rng = np.random.default_rng(seed)
+    params = {}
+    for _ in range(n):
+        p = sample_space(space, rng=rng)
+        params.setdefault(tuple(sorted(p.items())), p)
+    return list(params.values())
+
+
+class Sweep:
+    """
+    Evaluates a batch of parameter sets of a bot in one pass.
+    The bot computes its "long" and "short" entry signals with Bot.signals, indicators
+    being memoized across the parameter sets through Bot.memo, then the positions,
+    trades and balances of batch_size parameter sets are simulated together as 2-D
+    arrays (parameter set x bar).
+    The simulation is the one of the back test exchange for bots that only reverse
+    their position with market entries, the same bars are evaluated, fills are at the
+    close of the bar and the position is closed at the end.
+    """
+    # Number of parameter sets simulated together
+    batch_size = 32
+    # Order quantity
+    qty = 1
+
+    def __init__(self, bot, df_ohlcv, exchange, batch_size=32, qty=1):
+        """
+        constructor
+        :param bot: bot with signals
+        :param df_ohlcv: OHLCV data
+        :param exchange: back test exchange giving the balance, leverage and commission
+        :param batch_size: number of parameter sets simulated together
+        :param qty: order quantity of the entries
+        """
+        self.bot = bot
+        self.df_ohlcv = df_ohlcv
+        self.batch_size = batch_size
+        self.qty = qty
+        self.balance = exchange.get_balance()
+        self.leverage = exchange.get_leverage()
+        self.commission = exchange.get_commission()
+        # bars the strategy is evaluated on, same as BacktestEngine.bars
+        self.start = bot.ohlcv_len() - 1
+        self.end = len(df_ohlcv) - 1
+        self.close = np.ascontiguousarray(df_ohlcv["close"].values[self.start:self.end], dtype=np.float64)
+
+    def run(self, param_sets):
+        """
+        evaluate parameter sets
+        :param param_sets: list of parameter sets
+        :return: data frame of the parameters, profit_factor, drawdown (%), trades and profit,
+                 best profit factor first
+        """
+        results = []
+        params = self.bot.params
+        self.bot.memo_cache = {}
+        try:
+            for i in range(0, len(param_sets), self.batch_size):
+                batch = param_sets[i:i + self.batch_size]
+                long, short = self.__signals(batch)
+                results.append(pd.DataFrame(self.simulate(long, short)))
+                logger.info(f"Sweep : {i + len(batch)} / {len(param_sets)}")
+        finally:
+            self.bot.memo_cache = None
+            self.bot.params = params
+
+        if len(results) == 0:
+            return pd.DataFrame()
+        table = pd.concat([pd.DataFrame(param_sets), pd.concat(results, ignore_index=True)], axis=1)
+        return table.sort_values(["profit_factor", "trades"], ascending=[False, False], ignore_index=True)
+
+    def __signals(self, batch):
+        """
+        entry signals of the evaluated bars
+        :return: long, short bool arrays of len(batch) x bars
+        """
+        long = np.zeros((len(batch), len(self.close)), dtype=bool)
+        short = np.zeros((len(batch), len(self.close)), dtype=bool)
+        for i, params in enumerate(batch):
+            self.bot.params = params
+            signals = self.bot.signals(self.df_ohlcv)
+            long[i] = np.asarray(signals["long"], dtype=bool)[self.start:self.end]
+            short[i] = np.asarray(signals["short"], dtype=bool)[self.start:self.end]
+        return long, short
+
+    def profit(self, entry, exit, position):
+        """
+        profit of closing positions, same formula as the back test exchange
+        :param entry: entry prices
+        :param exit: exit prices
+        :param position: position sizes, negative when short
+        """
+        loss = entry > exit
+        rate = (np.where(loss, (entry - exit) / exit, (exit - entry) / entry) - self.commission) * self.leverage
+        return np.where(loss, -1 * position * rate, position * rate)
+
+    def simulate(self, long, short):
+        """
+        simulate stop and reverse market entries
+        :param long: bool array parameter set x bar of the long entries
+        :param short: bool array parameter set x bar of the short entries
+        :return: dict of arrays of the results of each parameter set
+        """
+        n, t = long.shape
+        signal = np.where(short, -1, np.where(long, 1, 0)).astype(np.int8)
+
+        # the position follows the last entry signal
+        last = np.where(signal != 0, np.arange(t), -1)
+        np.maximum.accumulate(last, axis=1, out=last)
+        position = np.where(last >= 0, np.take_along_axis(signal, np.maximum(last, 0), axis=1), 0).astype(np.int8)
+        previous = np.zeros_like(position)
+        previous[:, 1:] = position[:, :-1]
+
+        # fills in row major order, a fill closes the position opened by the previous fills of the row
+        rows, bars = np.nonzero(position != previous)
+        fills = np.bincount(rows, minlength=n)
+        first = np.cumsum(fills) - fills
+        column = np.arange(len(rows)) - first[rows]
+        price = np.zeros((n, fills.max() if len(rows) > 0 else 0))
+        price[rows, column] = self.close[bars]
+
+        # average entry price like the back test exchange, a reversal of the average a at the
+        # price p gives (a * size - p * 2 * size) / -size = 2 * p - a
+        average = price.copy()
+        for i in range(1, average.shape[1]):
+            average[:, i] = 2 * price[:, i] - average[:, i - 1]
+
+        closed = column > 0
+        close_rows = rows[closed]
+        close_bars = bars[closed]
+        profits = self.profit(average[close_rows, column[closed] - 1], price[close_rows, column[closed]],
+                              previous[close_rows, close_bars] * self.qty)
+
+        # positions still open are closed at the last bar
+        open_rows = np.flatnonzero(position[:, -1] != 0) if t > 0 else np.empty(0, dtype=np.int64)
+        if len(open_rows) > 0:
+            profits = np.concatenate([profits, self.profit(average[open_rows, fills[open_rows] - 1], self.close[-1],
+                                                           position[open_rows, -1] * self.qty)])
+            close_rows = np.concatenate([close_rows, open_rows])
+            close_bars = np.concatenate([close_bars, np.full(len(open_rows), t)])
+
+        win = np.bincount(close_rows, weights=np.where(profits > 0, profits, 0), minlength=n)
+        lose = np.bincount(close_rows, weights=np.where(profits > 0, 0, -profits), minlength=n)
+
+        # balance after every bar, the drawdown is measured from the highest balance
+        changes = np.zeros((n, t + 1))
+        np.add.at(changes, (close_rows, close_bars), profits)
+        balance = self.balance + np.cumsum(changes, axis=1)
+        high = np.maximum.accumulate(np.maximum(balance, self.balance), axis=1)
+        drawdown = ((high - balance) / high * 100).max(axis=1)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            profit_factor = win / lose
+        return {
+            "profit_factor": profit_factor,
+            "drawdown": drawdown,
+            "trades": fills + (position[:, -1] != 0 if t > 0 else 0),
+            "profit": balance[:, -1] - self.balance,
+        }
@@ -0,0 +1,115 @@
+# coding: UTF-8
+
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+
+def fingerprint(df_ohlcv):
+    """
+    hash of the OHLCV data, the trials of different data are kept apart
+    :param df_ohlcv: OHLCV data frame
+    """
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(df_ohlcv.index.asi8).tobytes())
+    for column in ["open", "high", "low", "close", "volume"]:
+        h.update(np.ascontiguousarray(df_ohlcv[column].values, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def params_key(params):
+    """
+    canonical text of a parameter set, numbers are compared as floats so 5 and 5.0 are the same point
+    """
+    def normalize(value):
+        if isinstance(value, (bool, np.bool_)):
+            return bool(value)
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            return float(value)
+        return value
+
+    return json.dumps({k: normalize(v) for k, v in params.items()}, sort_keys=True)
+
+
+def vals_text(vals):
+    """
+    json text of the hyperopt vals of a trial, label -> list of the sampled values,
+    the indices for hp.choice
+    """
+    return json.dumps({k: [v.item() if isinstance(v, np.generic) else v for v in values]
+                       for k, values in vals.items()}, sort_keys=True)
+
+
+class TrialStore:
+    """
+    On-disk database of parameter search results.
+    A trial is keyed by strategy, pair, time frame, data fingerprint and parameters,
+    so a search can be resumed and a parameter set that was already back tested on
+    the same data returns its stored result instead of running the back test again.
+    The hyperopt vals of a trial are stored with it, a search resumes from them.
+    """
+    # Database file
+    path = None
+
+    def __init__(self, path, strategy, pair, bin_size, fingerprint):
+        """
+        constructor
+        :param path: sqlite database file
+        :param strategy: strategy name
+        :param pair: pair
+        :param bin_size: time frame
+        :param fingerprint: fingerprint of the OHLCV data
+        """
+        self.path = path
+        self.key = (strategy, pair, bin_size, fingerprint)
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS trials ("
+                        "strategy TEXT, pair TEXT, bin_size TEXT, fingerprint TEXT, params TEXT, result TEXT, "
+                        "vals TEXT, PRIMARY KEY (strategy, pair, bin_size, fingerprint, params))")
+        # databases of older versions have no vals
+        if "vals" not in [row[1] for row in self.db.execute("PRAGMA table_info(trials)")]:
+            self.db.execute("ALTER TABLE trials ADD COLUMN vals TEXT")
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM trials WHERE strategy = ? AND pair = ? AND bin_size = ? "
+                               "AND fingerprint = ?", self.key).fetchone()[0]
+
+    def get(self, params):
+        """
+        stored result of a parameter set
+        :return: hyperopt result or None
+        """
+        row = self.db.execute("SELECT result FROM trials WHERE strategy = ? AND pair = ? AND bin_size = ? "
+                              "AND fingerprint = ? AND params = ?", self.key + (params_key(params),)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, params, result, vals=None):
+        """
+        store the result of a parameter set
+        :param result: hyperopt result
+        :param vals: hyperopt vals of the trial
+        """
+        self.db.execute("INSERT OR REPLACE INTO trials "
+                        "(strategy, pair, bin_size, fingerprint, params, result, vals) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        self.key + (params_key(params), json.dumps(result),
+                                    None if vals is None else vals_text(vals)))
+        self.db.commit()
+
+    def trials(self):
+        """
+        stored trials, oldest first
+        :return: list of (params, result, vals), vals is None for the trials stored without
+        """
+        rows = self.db.execute("SELECT params, result, vals FROM trials WHERE strategy = ? AND pair = ? "
+                               "AND bin_size = ? AND fingerprint = ? ORDER BY rowid", self.key).fetchall()
+        return [(json.loads(params), json.loads(result), None if vals is None else json.loads(vals))
+                for params, result, vals in rows]
+
+    def close(self):
+        self.db.close()
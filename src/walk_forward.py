@@ -0,0 +1,174 @@
+# coding: UTF-8
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from hyperopt import fmin, tpe, space_eval, Trials
+from hyperopt.exceptions import AllTrialsFailed
+
+from src import logger
+
+# Walk-forward runner of a worker process
+walk_forward_runner = None
+
+
+def init_walk_forward_worker(runner):
+    """
+    initialize a walk-forward worker process.
+    with the fork start method the runner is inherited, so the OHLCV data is shared copy-on-write
+    :param runner: WalkForward
+    """
+    global walk_forward_runner
+    walk_forward_runner = runner
+
+
+def run_walk_forward_window(window):
+    """
+    optimize and test a window in a worker process
+    :param window: (train, test) slices of the OHLCV data
+    :return: window result
+    """
+    return walk_forward_runner.run_window(*window)
+
+
+def windows(index, train, test, warmup):
+    """
+    rolling train / test windows, the test periods follow each other without overlap
+    and every test period is preceded by its train period.
+    a back test evaluates the bars of a window from its warmup + 1-th bar to the one
+    before its last, so the test slices start warmup bars before their period and end
+    one bar after it.
+    :param index: time index of the OHLCV data
+    :param train: length of the train periods (Timedelta)
+    :param test: length of the test periods (Timedelta)
+    :param warmup: bars needed before the first evaluated bar, ohlcv_len - 1
+    :return: list of (train, test) slices
+    """
+    result = []
+    start = index[0] + train
+    while start < index[-1]:
+        begin = index.searchsorted(start - train)
+        first = index.searchsorted(start)
+        last = index.searchsorted(start + test)
+        end = min(last + 1, len(index))
+        if first - begin > warmup + 1 and first >= warmup and end - first > 1:
+            result.append((slice(begin, first), slice(first - warmup, end)))
+        start += test
+    return result
+
+
+def stitch(results):
+    """
+    out of sample equity curve of the test periods, the profit of each period is added
+    to the profit at the end of the previous ones
+    :param results: window results, oldest first
+    :return: Series of the profit at every test bar
+    """
+    equity = []
+    offset = 0
+    for result in results:
+        if len(result["equity"]) == 0:
+            continue
+        equity.append(result["equity"] + offset)
+        offset += result["equity"].iloc[-1]
+    if len(equity) == 0:
+        return pd.Series(dtype=np.float64)
+    return pd.concat(equity)
+
+
+class WalkForward:
+    """
+    Walk-forward optimization of a bot.
+    The OHLCV history is split into rolling train / test windows, the parameters are
+    searched with TPE on the train period of a window and back tested on the following
+    test period, the windows running in parallel on worker processes.
+    The back tests of the test periods are then stitched into one out of sample equity
+    curve, which shows how the parameter search would have done when run periodically.
+    """
+    # Length of the train periods
+    train = pd.Timedelta(days=60)
+    # Length of the test periods
+    test = pd.Timedelta(days=15)
+    # Number of worker processes
+    workers = 1
+    # Random seed of the parameter searches, None for a random search
+    seed = None
+
+    def __init__(self, bot, df_ohlcv, train, test, workers=1):
+        """
+        constructor
+        :param bot: bot to optimize, its options() are searched for max_evals evaluations
+        :param df_ohlcv: OHLCV data
+        :param train: length of the train periods (Timedelta)
+        :param test: length of the test periods (Timedelta)
+        :param workers: number of worker processes
+        """
+        self.bot = bot
+        self.df_ohlcv = df_ohlcv
+        self.train = train
+        self.test = test
+        self.workers = workers
+
+    def run(self):
+        """
+        optimize and test every window
+        :return: data frame of the windows with their parameters and out of sample results,
+                 stitched out of sample equity curve
+        """
+        bounds = windows(self.df_ohlcv.index, self.train, self.test, self.bot.ohlcv_len() - 1)
+        logger.info(f"Walk-forward of {len(bounds)} windows with {self.workers} workers")
+
+        if self.workers > 1 and len(bounds) > 1:
+            context = multiprocessing.get_context("fork") \
+                if "fork" in multiprocessing.get_all_start_methods() else None
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                     initializer=init_walk_forward_worker, initargs=(self,)) as executor:
+                results = list(executor.map(run_walk_forward_window, bounds))
+        else:
+            results = [self.run_window(train, test) for train, test in bounds]
+
+        table = pd.DataFrame([{k: v for k, v in result.items() if k != "equity"} for result in results])
+        return table, stitch(results)
+
+    def run_window(self, train, test):
+        """
+        search the parameters on the train bars, then back test them on the test bars
+        :param train: slice of the train bars
+        :param test: slice of the test bars
+        :return: window result
+        """
+        bot = self.bot
+        train_ohlcv = self.df_ohlcv.iloc[train]
+        test_ohlcv = self.df_ohlcv.iloc[test]
+        space = bot.options()
+
+        trials = Trials()
+        fmin(lambda args: bot.evaluate(args, train_ohlcv), space, algo=tpe.suggest, trials=trials,
+             max_evals=bot.max_evals, show_progressbar=False,
+             rstate=None if self.seed is None else np.random.default_rng(self.seed))
+        try:
+            params = space_eval(space, trials.argmin)
+        except AllTrialsFailed:
+            logger.info(f"Walk-forward window {test_ohlcv.index[0]} : no parameter set could be evaluated")
+            return {"test_start": test_ohlcv.index[bot.ohlcv_len() - 1], "test_end": test_ohlcv.index[-2],
+                    "params": None, "equity": pd.Series(dtype=np.float64)}
+
+        bot.evaluate(params, test_ohlcv, pruning=False)
+        exchange = bot.exchange
+        with np.errstate(divide="ignore", invalid="ignore"):
+            profit_factor = np.float64(exchange.win_profit) / exchange.lose_loss
+        result = {
+            "test_start": test_ohlcv.index[bot.ohlcv_len() - 1],
+            "test_end": test_ohlcv.index[-2],
+            "params": params,
+            "train_loss": trials.best_trial["result"]["loss"],
+            "profit_factor": profit_factor,
+            "trades": exchange.order_count,
+            "profit": exchange.result.profit,
+            "equity": exchange.result.equity,
+        }
+        logger.info(f"Walk-forward window {result['test_start']} - {result['test_end']} : {params}, "
+                    f"profit factor {profit_factor}")
+        return result
@@ -0,0 +1,172 @@
+# coding: UTF-8
+
+import asyncio
+import json
+import threading
+import unittest
+
+from aiohttp import web
+
+from src.async_runtime import AsyncRuntime, AsyncClient, AsyncBinanceFuturesConnection, AsyncExchange
+from src.bar_builder import Bar
+from src.binance_futures_websocket import BinanceFuturesWs
+from src.exceptions import BinanceAPIException
+
+
+class TestAsyncRuntime(unittest.TestCase):
+
+    def setUp(self):
+        self.runtime = AsyncRuntime.get()
+        self.requests = []
+
+        async def order(request):
+            self.requests.append((request.method, dict(request.query), dict(await request.post()),
+                                  request.headers.get("X-MBX-APIKEY")))
+            if request.query.get("symbol") == "UNKNOWN":
+                return web.json_response({"code": -1121, "msg": "Invalid symbol."}, status=400)
+            return web.json_response({"orderId": 1})
+
+        async def stream(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            async for message in ws:
+                request = json.loads(message.data)
+                self.requests.append((request["method"], request["params"]))
+                await ws.send_str(json.dumps({"result": None, "id": request["id"]}))
+                await ws.send_str(json.dumps({"stream": "btcusdt@kline_1m", "data": {
+                    "e": "kline", "k": {"T": 1614602099999, "i": "1m", "o": "2.0", "h": "3.0", "l": "1.0",
+                                        "c": "2.5", "v": "10.0"}}}))
+            return ws
+
+        async def burst(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            async for message in ws:
+                # the bars of both pairs once the ETH stream, bound last, is subscribed
+                if "ethusdt@kline_1m" not in json.loads(message.data)["params"]:
+                    continue
+                for i in range(20):
+                    for pair in ["btcusdt", "ethusdt"]:
+                        await ws.send_str(json.dumps({"stream": f"{pair}@kline_1m", "data": {
+                            "e": "kline", "k": {"T": 1614602099999 + i * 60000, "i": "1m", "o": "2.0", "h": "3.0",
+                                                "l": "1.0", "c": str(i), "v": "10.0"}}}))
+            return ws
+
+        async def start():
+            app = web.Application()
+            app.router.add_route("*", "/fapi/v1/order", order)
+            app.router.add_get("/stream", stream)
+            app.router.add_get("/burst", burst)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            return runner, runner.addresses[0][1]
+
+        self.runner, self.port = self.runtime.submit(start()).result(10)
+        self.addCleanup(lambda: self.runtime.submit(self.runner.cleanup()).result(10))
+
+    def test_client_requests(self):
+        client = AsyncClient(api_key="key", api_secret="secret")
+        client.FUTURES_URL = f"http://127.0.0.1:{self.port}/fapi"
+
+        async def requests():
+            ret, res = await client.futures_get_order(symbol="BTCUSDT", orderId=1)
+            assert ret == {"orderId": 1} and res.status_code == 200
+            await client.futures_create_order(symbol="BTCUSDT", side="BUY", quantity=1)
+            try:
+                await client.futures_get_order(symbol="UNKNOWN")
+                assert False
+            except BinanceAPIException as e:
+                assert e.code == -1121 and e.status_code == 400
+            await client.close()
+
+        self.runtime.submit(requests()).result(10)
+
+        # signed requests carry the key and the signature, in the query like the requests client
+        (method, query, form, key) = self.requests[0]
+        assert method == "GET" and key == "key" and form == {}
+        assert list(query.keys()) == ["orderId", "symbol", "timestamp", "signature"]
+        assert self.requests[1][0] == "POST"
+        assert self.requests[1][1]["side"] == "BUY" and "signature" in self.requests[1][1]
+
+    def test_connection(self):
+        port = self.port
+
+        class LocalConnection(AsyncBinanceFuturesConnection):
+            connections = {}
+
+            def open(self):
+                self.endpoint = f"ws://127.0.0.1:{port}/stream"
+                super().open()
+
+        bars = []
+        received = threading.Event()
+
+        def on_bar(action, bar):
+            # handlers do not run on the loop
+            assert threading.current_thread() is not self.runtime.thread
+            bars.append(bar)
+            received.set()
+
+        ws = BinanceFuturesWs(account="binanceaccount1", pair="BTCUSDT", connection_class=LocalConnection)
+        ws.bind("1m", on_bar)
+        assert received.wait(10)
+        assert self.requests[0] == ("SUBSCRIBE", ["btcusdt@kline_1m"])
+        assert bars[0] == Bar(1614602099999000000, 2.0, 3.0, 1.0, 2.5, 10.0)
+
+        ws.close()
+        ws.connection.reader.result(10)
+        assert LocalConnection.connections == {}
+
+    def test_full_event_queue(self):
+        port = self.port
+
+        class LocalConnection(AsyncBinanceFuturesConnection):
+            connections = {}
+
+            def open(self):
+                self.endpoint = f"ws://127.0.0.1:{port}/burst"
+                super().open()
+
+        btc, eth = [], []
+        release = threading.Event()
+        self.addCleanup(release.set)
+        received = threading.Event()
+
+        def on_eth(action, bar):
+            eth.append(bar.close)
+            if len(eth) == 20:
+                received.set()
+
+        ws = BinanceFuturesWs(account="binanceaccount1", pair="BTCUSDT", connection_class=LocalConnection)
+        other = BinanceFuturesWs(account="binanceaccount1", pair="ETHUSDT", connection_class=LocalConnection)
+        ws.queue.maxsize = 2
+        ws.bind("1m", lambda action, bar: release.wait(10) and btc.append(bar.close))
+        other.bind("1m", on_eth)
+
+        # the BTC handler holds its queue full, the loop and the ETH events keep going
+        assert received.wait(10)
+        self.runtime.submit(asyncio.sleep(0)).result(1)
+        assert eth == [float(i) for i in range(20)]
+        metrics = ws.metrics()
+        assert metrics["overflow"] > 0 and metrics["blocked"] == 0 and metrics["depth"] <= 2
+        release.set()
+        assert ws.queue.join(10)
+        assert 0 < len(btc) < 20 and btc == sorted(btc)
+
+        other.close()
+        ws.close()
+        ws.connection.reader.result(10)
+
+    def test_exchange(self):
+        class Exchange:
+            pair = "BTCUSDT"
+
+            def get_position_size(self, offset=0):
+                return threading.current_thread(), 1 + offset
+
+        exchange = AsyncExchange(Exchange())
+        thread, size = self.runtime.submit(exchange.get_position_size(offset=1)).result(10)
+        assert thread is not self.runtime.thread and size == 2
+        assert exchange.pair == "BTCUSDT"
@@ -0,0 +1,100 @@
+# coding: UTF-8
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from src import sma, crossover, crossunder, load_data
+from src.backtest_engine import BacktestEngine
+from src.binance_futures_backtest import BinanceFuturesBackTest
+from src.binance_futures_stub import BinanceFuturesStub
+
+
+def random_ohlcv(size, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 10000 + np.cumsum(rng.normal(0, 10, size))
+    open = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open, close) + rng.uniform(0, 5, size)
+    low = np.minimum(open, close) - rng.uniform(0, 5, size)
+    volume = rng.uniform(1, 100, size)
+    index = pd.date_range("2021-01-01", periods=size, freq="1min", tz="UTC", name="timestamp")
+    return pd.DataFrame({"open": open, "high": high, "low": low, "close": close, "volume": volume}, index=index)
+
+
+class TestBacktestEngine(unittest.TestCase):
+
+    def test_windows_match_iloc(self):
+        df = random_ohlcv(50)
+        engine = BacktestEngine(df, 10)
+        assert len(engine) == 40
+        for i, timestamp, open, close, high, low, volume in engine.bars():
+            data = df.iloc[i:i + 10, :]
+            assert timestamp == data.iloc[-1].name
+            np.testing.assert_array_equal(open, data["open"].values)
+            np.testing.assert_array_equal(close, data["close"].values)
+            np.testing.assert_array_equal(high, data["high"].values)
+            np.testing.assert_array_equal(low, data["low"].values)
+            np.testing.assert_array_equal(volume, data["volume"].values)
+
+    def test_same_fills_as_iloc_crawler(self):
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        file = os.path.join(dir.name, "{}", "data.csv")
+        os.makedirs(os.path.dirname(file.format("1m")))
+        random_ohlcv(2000).to_csv(file.format("1m"))
+        df = load_data(file.format("1m"))
+
+        def run(legacy):
+            exchange = BinanceFuturesBackTest(account="binanceaccount1", pair="BTCUSDT")
+            exchange.ohlcv_len = 50
+            exchange.sync_history = False
+
+            def strategy(open, close, high, low, volume):
+                exchange.sltp(profit_long=0.5, profit_short=0.5, stop_long=0.3, stop_short=0.3)
+                fast = sma(close, 5)
+                slow = sma(close, 20)
+                if crossover(fast, slow):
+                    exchange.entry("Long", True, 1)
+                if crossunder(fast, slow):
+                    exchange.entry("Short", False, 1)
+
+            if legacy:
+                # the iloc crawler the engine replaced
+                exchange.df_ohlcv = df
+                BinanceFuturesStub.on_update(exchange, "1m", strategy)
+                for i in range(len(df) - exchange.ohlcv_len):
+                    data = df.iloc[i:i + exchange.ohlcv_len, :]
+                    close = data["close"].values
+                    open = data["open"].values
+                    high = data["high"].values
+                    low = data["low"].values
+                    volume = data["volume"].values
+                    if exchange.get_position_size() > 0 and low[-1] > exchange.get_trail_price():
+                        exchange.set_trail_price(low[-1])
+                    if exchange.get_position_size() < 0 and high[-1] < exchange.get_trail_price():
+                        exchange.set_trail_price(high[-1])
+                    exchange.market_price = close[-1]
+                    exchange.OHLC = {"open": open, "high": high, "low": low, "close": close}
+                    exchange.index = data.iloc[-1].name
+                    exchange.eval_sltp()
+                    exchange.strategy(open, close, high, low, volume)
+                    exchange.eval_exit()
+                exchange.close_all()
+            else:
+                with mock.patch("src.binance_futures_backtest.OHLC_FILENAME", file), \
+                     mock.patch("src.binance_futures_backtest.OHLC_STORE", os.path.join(dir.name, "{}", "{}")):
+                    exchange.on_update("1m", strategy)
+            return exchange
+
+        engine = run(legacy=False)
+        legacy = run(legacy=True)
+
+        assert engine.order_count > 0
+        assert engine.order_count == legacy.order_count
+        assert engine.get_balance() == legacy.get_balance()
+        assert engine.win_profit == legacy.win_profit
+        assert engine.lose_loss == legacy.lose_loss
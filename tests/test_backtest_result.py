@@ -0,0 +1,65 @@
+# coding: UTF-8
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import sma, crossover, crossunder
+from src.binance_futures_backtest import BinanceFuturesBackTest
+from tests.test_backtest_engine import random_ohlcv
+
+
+class TestBacktestResult(unittest.TestCase):
+
+    def setUp(self):
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        self.file = os.path.join(dir.name, "{}", "data.csv")
+        self.store = os.path.join(dir.name, "{}", "{}")
+        os.makedirs(os.path.dirname(self.file.format("1m")))
+        random_ohlcv(1000).to_csv(self.file.format("1m"))
+
+    def run_backtest(self):
+        exchange = BinanceFuturesBackTest(account="binanceaccount1", pair="BTCUSDT")
+        exchange.ohlcv_len = 50
+        exchange.sync_history = False
+
+        def strategy(open, close, high, low, volume):
+            fast = sma(close, 5)
+            slow = sma(close, 20)
+            exchange.plot("fast", fast[-1], "b")
+            if crossover(fast, slow):
+                exchange.entry("Long", True, 1)
+            if crossunder(fast, slow):
+                exchange.entry("Short", False, 1)
+
+        with mock.patch("src.binance_futures_backtest.OHLC_FILENAME", self.file), \
+             mock.patch("src.binance_futures_backtest.OHLC_STORE", self.store):
+            exchange.on_update("1m", strategy)
+        return exchange
+
+    def test_result(self):
+        exchange = self.run_backtest()
+        result = exchange.result
+        df = exchange.df_ohlcv
+
+        assert list(df.columns) == ["open", "high", "low", "close", "volume"]
+        assert len(result.equity) == len(df) - 50
+        assert result.equity.index[0] == df.index[49] and result.equity.index[-1] == df.index[-2]
+        assert result.profit == exchange.get_balance() - exchange.start_balance
+        assert result.equity.iloc[-1] == result.profit
+        assert result.drawdowns.max() == exchange.max_draw_down_session_perc
+        assert len(result.buy_signals) + len(result.sell_signals) == exchange.order_count
+        plots = result.plot_frame()
+        np.testing.assert_allclose(plots["fast"].values[49:-1], sma(df["close"].values, 5)[49:-1])
+        assert np.isnan(plots["fast"].values[:49]).all()
+
+    def test_no_leak_between_backtests(self):
+        first = self.run_backtest()
+        second = self.run_backtest()
+        assert first.result is not second.result
+        np.testing.assert_array_equal(first.result.balance, second.result.balance)
+        np.testing.assert_array_equal(first.result.sell, second.result.sell)
@@ -0,0 +1,123 @@
+# coding: UTF-8
+
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src import resample, to_data_frame
+from src.bar_builder import Bar, BarBuffer, BarBuilder, to_ns
+from src.binance_futures_backtest import BinanceFuturesBackTest
+from src.binance_futures_stub import BinanceFuturesStub
+from src.binance_futures_websocket import BinanceFuturesConnection, BinanceFuturesWs
+from src.bitmex_websocket import BitMexWs
+
+
+def random_ohlcv(size, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 10000 + np.cumsum(rng.normal(0, 10, size))
+    open = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open, close) + rng.uniform(0, 5, size)
+    low = np.minimum(open, close) - rng.uniform(0, 5, size)
+    volume = rng.uniform(1, 100, size)
+    # labels are the close time of each minute, like the kline stream
+    index = pd.date_range("2021-01-01 00:01", periods=size, freq="1min", tz="UTC", name="timestamp")
+    return pd.DataFrame({"open": open, "high": high, "low": low, "close": close, "volume": volume}, index=index)
+
+
+class TestBarBuilder(unittest.TestCase):
+
+    def test_ring_buffer(self):
+        buffer = BarBuffer(3)
+        for i in range(5):
+            buffer.append(i, i, i, i, i, i)
+        assert len(buffer) == 3
+        np.testing.assert_array_equal(buffer.timestamps(), [2, 3, 4])
+        open, close, high, low, volume = buffer.arrays()
+        np.testing.assert_array_equal(close, [2.0, 3.0, 4.0])
+        assert buffer.last_timestamp() == 4
+
+    def test_same_bars_as_resample(self):
+        df = random_ohlcv(24 * 60)
+        for bin_size in ["1m", "5m", "15m", "1h", "2h"]:
+            builder = BarBuilder(bin_size, 10000)
+            for timestamp, open, high, low, close, volume in zip(df.index, df["open"].values, df["high"].values,
+                                                                 df["low"].values, df["close"].values,
+                                                                 df["volume"].values):
+                timestamp = to_ns(timestamp)
+                # the stream updates the same kline several times before it closes
+                builder.update(timestamp, open, open, open, open, volume / 2)
+                builder.update(timestamp, open, high, low, close, volume)
+
+            expected = resample(df, bin_size)[:-1]
+            actual = builder.buffer.to_data_frame()
+            pd.testing.assert_frame_equal(actual, expected[actual.columns], check_freq=False, check_names=False)
+
+    def test_final_base_bar_closes_bin(self):
+        df = random_ohlcv(120)
+        builder = BarBuilder("1h", 100)
+        closed = [builder.update(to_ns(timestamp), row["open"], row["high"], row["low"], row["close"],
+                                 row["volume"], final=True) for timestamp, row in df.iterrows()]
+        assert sum(closed) == 2
+        expected = resample(df, "1h")[["open", "high", "low", "close", "volume"]]
+        pd.testing.assert_frame_equal(builder.buffer.to_data_frame(), expected, check_freq=False, check_names=False)
+
+    def test_seed_then_update(self):
+        df = random_ohlcv(180)
+        closed = resample(df[df.index <= "2021-01-01 02:00"], "1h")
+        builder = BarBuilder("1h", 100)
+        builder.seed(closed)
+        assert builder.last_timestamp() == to_ns(closed.index[-1])
+        # already closed base bars are ignored
+        assert not builder.update(to_ns(df.index[0]), 1, 1, 1, 1, 1)
+        for timestamp, row in df[df.index > "2021-01-01 02:00"].iterrows():
+            builder.update(to_ns(timestamp), row["open"], row["high"], row["low"], row["close"], row["volume"])
+        assert len(builder.buffer) == 2
+        assert builder.forming()[0] == to_ns("2021-01-01 03:00Z")
+
+    def test_timeframe_store_matches_backtest_slices(self):
+        df = random_ohlcv(600)
+        exchange = BinanceFuturesBackTest(account="binanceaccount1", pair="BTCUSDT")
+        exchange.ohlcv_len = 20
+        exchange.df_ohlcv = df
+        expected = {bin_size: resample(df, bin_size) for bin_size in ["5m", "15m"]}
+
+        def strategy(open, close, high, low, volume):
+            for bin_size in ["5m", "15m"]:
+                source = exchange.security(bin_size)
+                legacy = expected[bin_size][:exchange.index].iloc[-1 * exchange.ohlcv_len:, :]
+                pd.testing.assert_frame_equal(source, legacy[source.columns], check_freq=False, check_names=False)
+
+        BinanceFuturesStub.on_update(exchange, "1m", strategy)
+        exchange._BinanceFuturesBackTest__crawler_run()
+
+
+class TestBar(unittest.TestCase):
+
+    def test_same_frame_as_to_data_frame(self):
+        timestamp = pd.Timestamp("2021-03-01 12:34:59.999", tz="UTC")
+        expected = to_data_frame([{"timestamp": timestamp, "high": 3.0, "low": 1.0, "open": 2.0, "close": 2.5,
+                                   "volume": 10.0}])
+        bar = Bar(to_ns(timestamp), 2.0, 3.0, 1.0, 2.5, 10.0)
+        pd.testing.assert_frame_equal(bar.to_data_frame(), expected)
+        assert bar == Bar(to_ns(timestamp), 2.0, 3.0, 1.0, 2.5, 10.0)
+        assert not hasattr(bar, "__dict__")
+
+    def test_websocket_decoding(self):
+        bars = []
+        subscriber = object.__new__(BinanceFuturesWs)
+        subscriber.handlers = {"1m": lambda action, bar: bars.append(bar)}
+        binance = object.__new__(BinanceFuturesConnection)
+        binance.subscribers = {"btcusdt": (subscriber,)}
+        binance._BinanceFuturesConnection__on_message(None, json.dumps({"stream": "btcusdt@kline_1m", "data": {
+            "e": "kline", "k": {"T": 1614602099999, "i": "1m", "o": "2.0", "h": "3.0", "l": "1.0", "c": "2.5",
+                                "v": "10.0"}}}))
+        bitmex = object.__new__(BitMexWs)
+        bitmex.handlers = {"tradeBin1m": lambda action, bar: bars.append(bar)}
+        bitmex._BitMexWs__on_message(None, json.dumps({"table": "tradeBin1m", "action": "insert", "data": [{
+            "timestamp": "2021-03-01T12:35:00.000Z", "open": 2.0, "high": 3.0, "low": 1.0, "close": 2.5,
+            "volume": 10}]}))
+
+        assert bars == [Bar(to_ns(pd.Timestamp("2021-03-01 12:34:59.999", tz="UTC")), 2.0, 3.0, 1.0, 2.5, 10.0),
+                        Bar(to_ns(pd.Timestamp("2021-03-01 12:35:00", tz="UTC")), 2.0, 3.0, 1.0, 2.5, 10)]
@@ -0,0 +1,153 @@
+# coding: UTF-8
+
+import json
+import unittest
+from unittest import mock
+
+from src.binance_futures import BinanceFutures
+
+
+def response(value):
+    res = mock.Mock()
+    res.headers = {"X-MBX-USED-WEIGHT-1M": "1"}
+    return value, res
+
+
+class TestBinanceFutures(unittest.TestCase):
+
+    def setUp(self):
+        self.exchange = BinanceFutures(account="binanceaccount1", pair="BTCUSDT", threading=False)
+        self.exchange.client = mock.Mock()
+        self.exchange.client.futures_position_information.return_value = response([
+            {"symbol": "ETHUSDT", "positionAmt": "0", "entryPrice": "0", "leverage": "20", "unRealizedProfit": "0"},
+            {"symbol": "BTCUSDT", "positionAmt": "0.5", "entryPrice": "100", "leverage": "20", "unRealizedProfit": "0"}
+        ])
+        self.exchange.client.futures_account_balance_v2.return_value = response([{"asset": "USDT", "balance": "1000"}])
+        for name in ["eval_exit", "eval_sltp"]:
+            patcher = mock.patch.object(self.exchange, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_position_is_read_from_the_cache(self):
+        assert self.exchange.get_position_size() == 0.5
+        assert self.exchange.get_position_avg_price() == 100
+        assert self.exchange.get_leverage() == 20
+        assert self.exchange.client.futures_position_information.call_count == 1
+
+        # unrealized PnL follows the market price
+        self.exchange.market_price = 110
+        assert float(self.exchange.get_position()["unRealizedProfit"]) == 5
+        assert self.exchange.client.futures_position_information.call_count == 1
+
+    def test_user_data_stream_updates_the_position(self):
+        self.exchange.get_position()
+        self.exchange._BinanceFutures__on_update_position("", [
+            {"s": "BTCUSDT", "pa": "-1", "ep": "120", "mt": "cross", "up": "0", "ps": "BOTH"}
+        ])
+        assert self.exchange.get_position_size() == -1
+        assert self.exchange.get_position_avg_price() == 120
+        assert self.exchange.get_leverage() == 20
+        assert self.exchange.client.futures_position_information.call_count == 1
+
+    def test_fill_and_interval_reconcile_with_rest(self):
+        self.exchange.get_position()
+        self.exchange._BinanceFutures__on_update_order("", {"s": "BTCUSDT", "x": "TRADE"})
+        self.exchange.get_position()
+        assert self.exchange.client.futures_position_information.call_count == 2
+
+        self.exchange.position_time -= self.exchange.reconcile_interval
+        self.exchange.get_position()
+        assert self.exchange.client.futures_position_information.call_count == 3
+
+    def test_margin_is_read_from_the_cache(self):
+        assert self.exchange.get_balance() == 1000
+        self.exchange._BinanceFutures__on_update_margin("", [{"a": "USDT", "wb": "900", "cw": "900"}])
+        assert self.exchange.get_balance() == 900
+        assert self.exchange.client.futures_account_balance_v2.call_count == 1
+
+    def test_margin_is_cached_by_asset(self):
+        self.exchange.client.futures_account_balance_v2.return_value = response([
+            {"asset": "BNB", "balance": "2"}, {"asset": "USDT", "balance": "1000"}])
+        assert self.exchange.get_balance() == 1000
+        assert float(self.exchange.get_margin("BNB")["balance"]) == 2
+        # a BNB balance update does not touch the USDT balance
+        self.exchange._BinanceFutures__on_update_margin("", [{"a": "BNB", "wb": "1", "cw": "1"}])
+        assert self.exchange.get_balance() == 1000
+        assert self.exchange.get_margin("BNB")["balance"] == 1
+        assert self.exchange.client.futures_account_balance_v2.call_count == 1
+
+    def test_position_cache_is_not_changed_by_reads(self):
+        self.exchange.get_position()
+        self.exchange.market_price = 110
+        position = self.exchange.get_position()
+        position["positionAmt"] = "7"
+        assert self.exchange.position[0]["unRealizedProfit"] == "0"
+        assert self.exchange.get_position_size() == 0.5
+
+    def test_batch_orders_are_sent_in_one_request(self):
+        self.exchange.client.futures_get_open_orders.return_value = response([])
+        self.exchange.client.futures_place_batch_orders.return_value = response([{}, {}, {}])
+        with self.exchange.batch_orders():
+            self.exchange.order("Long1", True, 1, limit=100)
+            self.exchange.order("Long2", True, 1, limit=99)
+            self.exchange.order("Long3", True, 1, limit=98)
+
+        assert self.exchange.client.futures_create_order.call_count == 0
+        assert self.exchange.client.futures_place_batch_orders.call_count == 1
+        orders = json.loads(self.exchange.client.futures_place_batch_orders.call_args.kwargs["batchOrders"])
+        assert [o["price"] for o in orders] == ["100", "99", "98"]
+
+    def test_batch_orders_send_the_reduce_only_legs_last(self):
+        self.exchange.client.futures_get_open_orders.return_value = response([])
+        calls = []
+        self.exchange.client.futures_create_order.side_effect = \
+            lambda **params: calls.append([params["type"]]) or response({})
+        self.exchange.client.futures_place_batch_orders.side_effect = \
+            lambda batchOrders: calls.append([o["type"] for o in json.loads(batchOrders)]) or response([{}, {}])
+        with self.exchange.batch_orders():
+            self.exchange.order("TP", False, 1, take_profit=110, reduce_only=True)
+            self.exchange.order("Long", True, 1)
+            self.exchange.order("SL", False, 1, stop=90, reduce_only=True)
+
+        # the batch orders run concurrently, the legs closing the entry are not sent with it
+        assert calls == [["MARKET"], ["TAKE_PROFIT_MARKET", "STOP_MARKET"]]
+
+    def test_batch_orders_are_notified_when_accepted(self):
+        self.exchange.client.futures_get_open_orders.return_value = response([])
+        self.exchange.client.futures_place_batch_orders.return_value = response([
+            {}, {"code": -2010, "msg": "Order would immediately trigger."}])
+        with mock.patch("src.binance_futures.notify") as notify:
+            with self.exchange.batch_orders():
+                self.exchange.order("Long1", True, 1, limit=100)
+                self.exchange.order("Long2", True, 1, limit=99)
+                # queued, not sent yet
+                assert notify.call_count == 0
+
+        messages = [call.args[0] for call in notify.call_args_list]
+        assert len(messages) == 2
+        assert messages[0].startswith("New Order") and "Limit: 100" in messages[0]
+        assert messages[1].startswith("Batch order Long2_") and "rejected" in messages[1]
+
+    def test_batch_orders_are_split_by_batch_size(self):
+        self.exchange.client.futures_get_open_orders.return_value = response([])
+        self.exchange.client.futures_create_order.return_value = response({})
+        self.exchange.client.futures_place_batch_orders.return_value = response([{}] * 5)
+        with self.exchange.batch_orders():
+            for i in range(6):
+                self.exchange.order(f"Leg{i}", True, 1, limit=100 - i)
+
+        assert self.exchange.client.futures_place_batch_orders.call_count == 1
+        assert self.exchange.client.futures_create_order.call_count == 1
+
+    def test_batch_orders_are_dropped_on_error(self):
+        self.exchange.client.futures_get_open_orders.return_value = response([])
+        self.exchange.client.futures_create_order.return_value = response({})
+        with self.assertRaises(ValueError):
+            with self.exchange.batch_orders():
+                self.exchange.order("Long", True, 1, limit=100)
+                raise ValueError()
+
+        assert self.exchange.client.futures_place_batch_orders.call_count == 0
+        assert self.exchange.client.futures_create_order.call_count == 0
+        self.exchange.order("Long", True, 1, limit=100)
+        assert self.exchange.client.futures_create_order.call_count == 1
@@ -0,0 +1,137 @@
+# coding: UTF-8
+
+import json
+import threading
+import unittest
+from unittest import mock
+
+from src.binance_futures_websocket import BinanceFuturesConnection, BinanceFuturesWs
+
+
+class TestBinanceFuturesWs(unittest.TestCase):
+
+    def setUp(self):
+        def auth(connection):
+            connection.listenKey = "listenkey"
+
+        for name, side_effect in [("_BinanceFuturesConnection__start", None),
+                                  ("_BinanceFuturesConnection__keep_alive_user_datastream", None),
+                                  ("_BinanceFuturesConnection__get_auth_user_data_streams", auth)]:
+            patcher = mock.patch.object(BinanceFuturesConnection, name, autospec=True, side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch("src.binance_futures_websocket.websocket.WebSocketApp")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(BinanceFuturesConnection.connections.clear)
+        self.ws = BinanceFuturesWs(account="binanceaccount1", pair="BTCUSDT")
+        self.connection = self.ws.connection
+
+    def requests(self):
+        requests = [json.loads(call.args[0]) for call in self.connection.ws.send.call_args_list]
+        self.connection.ws.send.reset_mock()
+        return [(r["method"], r["params"]) for r in requests]
+
+    def message(self, stream, data):
+        self.connection._BinanceFuturesConnection__on_message(self.connection.ws,
+                                                              json.dumps({"stream": stream, "data": data}))
+
+    def test_subscribes_bound_streams(self):
+        self.ws.bind("1h", lambda action, value: None)
+        self.ws.bind("position", lambda action, value: None)
+        self.ws.bind("unknown", lambda action, value: None)
+        # nothing is sent before the connection is open
+        assert self.requests() == []
+
+        self.connection._BinanceFuturesConnection__on_open(self.connection.ws)
+        assert self.requests() == [("SUBSCRIBE", ["btcusdt@kline_1h", "listenkey"])]
+
+        self.ws.bind("orderBookL2", lambda action, value: None)
+        self.ws.bind("order", lambda action, value: None)
+        assert self.requests() == [("SUBSCRIBE", ["btcusdt@depth20@100ms"])]
+
+        # the user data stream is still needed by the order handler
+        self.ws.unbind("position")
+        self.ws.unbind("orderBookL2")
+        assert self.requests() == [("UNSUBSCRIBE", ["btcusdt@depth20@100ms"])]
+
+        # a new connection subscribes everything again
+        self.connection._BinanceFuturesConnection__on_close(self.connection.ws)
+        self.connection._BinanceFuturesConnection__on_open(self.connection.ws)
+        assert self.requests() == [("SUBSCRIBE", ["btcusdt@kline_1h", "listenkey"])]
+
+    def test_subscription_responses_are_not_emitted(self):
+        values = []
+        self.ws.bind("1m", lambda action, value: values.append(value))
+        self.connection._BinanceFuturesConnection__on_message(self.connection.ws, json.dumps({"result": None, "id": 1}))
+        assert values == []
+
+    def test_pairs_share_the_connection(self):
+        other = BinanceFuturesWs(account="binanceaccount1", pair="ETHUSDT")
+        assert other.connection is self.connection
+        assert BinanceFuturesConnection._BinanceFuturesConnection__start.call_count == 1
+
+        events = []
+        self.ws.bind("instrument", lambda action, value: events.append(("btc", value["s"])))
+        self.ws.bind("order", lambda action, value: events.append(("btc", value["s"])))
+        other.bind("instrument", lambda action, value: events.append(("eth", value["s"])))
+        other.bind("order", lambda action, value: events.append(("eth", value["s"])))
+        # handlers are kept by pair
+        assert self.ws.handlers.keys() == other.handlers.keys()
+        assert self.ws.handlers["24hrTicker"] is not other.handlers["24hrTicker"]
+
+        self.connection._BinanceFuturesConnection__on_open(self.connection.ws)
+        assert self.requests() == [("SUBSCRIBE", ["btcusdt@ticker", "ethusdt@ticker", "listenkey"])]
+
+        # pair streams go to the subscribers of the pair, user data events to every subscriber
+        self.message("ethusdt@ticker", {"e": "24hrTicker", "s": "ETHUSDT"})
+        self.message("btcusdt@ticker", {"e": "24hrTicker", "s": "BTCUSDT"})
+        self.message("listenkey", {"e": "ORDER_TRADE_UPDATE", "o": {"s": "ETHUSDT"}})
+        assert self.ws.queue.join(5) and other.queue.join(5)
+        # every pair handles its events in order on its own worker
+        assert [e for e in events if e[0] == "btc"] == [("btc", "BTCUSDT"), ("btc", "ETHUSDT")]
+        assert [e for e in events if e[0] == "eth"] == [("eth", "ETHUSDT"), ("eth", "ETHUSDT")]
+
+        # the user data stream is kept while a pair needs it
+        other.close()
+        assert self.requests() == [("UNSUBSCRIBE", ["ethusdt@ticker"])]
+        self.ws.close()
+        assert self.connection.is_running is False
+        self.connection.ws.close.assert_called_once()
+        assert BinanceFuturesConnection.connections == {}
+
+    def test_stalled_pair_does_not_stall_the_others(self):
+        other = BinanceFuturesWs(account="binanceaccount1", pair="ETHUSDT")
+        self.addCleanup(other.close)
+        self.addCleanup(self.ws.close)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        btc, eth = [], []
+        self.ws.bind("1m", lambda action, bar: release.wait(5) and btc.append(bar.close))
+        other.bind("1m", lambda action, bar: eth.append(bar.close))
+        self.ws.queue.maxsize = 2
+
+        def receive():
+            for i in range(10):
+                for pair in ["btcusdt", "ethusdt"]:
+                    self.message(pair + "@kline_1m", {"e": "kline", "k": {
+                        "T": 1614602099999 + i * 60000, "i": "1m", "o": "1", "h": "1", "l": "1", "c": str(i),
+                        "v": "1"}})
+
+        # the receive thread does not wait for the stalled BTC handler
+        thread = threading.Thread(target=receive)
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert other.queue.join(5)
+        assert eth == [float(i) for i in range(10)]
+        assert self.ws.metrics()["overflow"] > 0
+
+        release.set()
+        assert self.ws.queue.join(5)
+        assert 0 < len(btc) < 10 and btc == sorted(btc)
+
+    def test_connection_per_account(self):
+        other = BinanceFuturesWs(account="binanceaccount2", pair="BTCUSDT")
+        testnet = BinanceFuturesWs(account="binanceaccount1", pair="BTCUSDT", test=True)
+        assert len({id(self.connection), id(other.connection), id(testnet.connection)}) == 3
@@ -0,0 +1,162 @@
+# coding: UTF-8
+
+import copy
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from hyperopt import hp, STATUS_OK
+
+from src import sma, crossover, crossunder, crossover_series, crossunder_series, load_data
+from src.bot import Bot
+from src.pruning import MaxDrawdown, MinTrades
+from src.sweep import Sweep, grid
+from tests.test_backtest_engine import random_ohlcv
+
+
+class SmaCross(Bot):
+    def __init__(self):
+        Bot.__init__(self, "1m")
+
+    def options(self):
+        return {
+            "fast_len": hp.quniform("fast_len", 1, 10, 1),
+            "slow_len": hp.quniform("slow_len", 11, 30, 1),
+        }
+
+    def ohlcv_len(self):
+        return 50
+
+    def strategy(self, open, close, high, low, volume):
+        fast = sma(close, self.input("fast_len", int, 5))
+        slow = sma(close, self.input("slow_len", int, 20))
+        if crossover(fast, slow):
+            self.exchange.entry("Long", True, 1)
+        if crossunder(fast, slow):
+            self.exchange.entry("Short", False, 1)
+
+
+class SmaCrossSignals(SmaCross):
+
+    def signals(self, df):
+        fast = self.memo(sma, df["close"].values, self.input("fast_len", int, 5))
+        slow = self.memo(sma, df["close"].values, self.input("slow_len", int, 20))
+        return {"long": crossover_series(fast, slow), "short": crossunder_series(fast, slow)}
+
+    def strategy(self, open, close, high, low, volume):
+        if self.exchange.signal("long"):
+            self.exchange.entry("Long", True, 1)
+        if self.exchange.signal("short"):
+            self.exchange.entry("Short", False, 1)
+
+
+class TestBot(unittest.TestCase):
+
+    def test_signals_same_fills_as_windows(self):
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        file = os.path.join(dir.name, "{}", "data.csv")
+        os.makedirs(os.path.dirname(file.format("1m")))
+        random_ohlcv(2000).to_csv(file.format("1m"))
+        df = load_data(file.format("1m"))
+
+        exchanges = []
+        for bot in [SmaCross(), SmaCrossSignals()]:
+            bot.account = "binanceaccount1"
+            bot.exchange_arg = "binance"
+            assert bot.evaluate({}, df)["status"] == STATUS_OK
+            exchanges.append(bot.exchange)
+
+        windows, signals = exchanges
+        assert windows.order_count > 0
+        assert windows.order_count == signals.order_count
+        assert windows.get_balance() == signals.get_balance()
+        assert windows.win_profit == signals.win_profit
+
+    def test_parallel_params_search(self):
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        file = os.path.join(dir.name, "{}", "data.csv")
+        os.makedirs(os.path.dirname(file.format("1m")))
+        random_ohlcv(1000).to_csv(file.format("1m"))
+
+        bot = SmaCross()
+        bot.account = "binanceaccount1"
+        bot.exchange_arg = "binance"
+        bot.workers = 2
+        bot.max_evals = 6
+
+        # insert_trial_docs copies the docs when bson is installed
+        with mock.patch("src.binance_futures_backtest.OHLC_FILENAME", file), \
+             mock.patch("src.binance_futures_backtest.OHLC_STORE", os.path.join(dir.name, "{}", "{}")), \
+             mock.patch("hyperopt.base.SONify", copy.deepcopy):
+            exchange = bot.backtest_exchange()
+            exchange.sync_history = False
+            exchange.load_ohlcv(bot.bin_size)
+            trials = bot.parallel_params_search(exchange.df_ohlcv)
+
+        assert len(trials.trials) == 6
+        assert all(r["status"] == STATUS_OK for r in trials.results)
+        assert set(trials.argmin) == {"fast_len", "slow_len"}
+
+    def test_sweep_same_results_as_backtests(self):
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        file = os.path.join(dir.name, "{}", "data.csv")
+        os.makedirs(os.path.dirname(file.format("1m")))
+        random_ohlcv(3000).to_csv(file.format("1m"))
+        df = load_data(file.format("1m"))
+
+        bot = SmaCrossSignals()
+        bot.account = "binanceaccount1"
+        bot.exchange_arg = "binance"
+        param_sets = grid({"fast_len": [3, 5, 8], "slow_len": [13, 21]})
+        table = Sweep(bot, df, bot.backtest_exchange(), batch_size=4).run(param_sets)
+
+        assert len(table) == 6
+        assert list(table["profit_factor"]) == sorted(table["profit_factor"], reverse=True)
+        for _, row in table.iterrows():
+            bot.evaluate({"fast_len": row["fast_len"], "slow_len": row["slow_len"]}, df)
+            exchange = bot.exchange
+            assert row["trades"] == exchange.order_count
+            assert abs(row["profit_factor"] - exchange.win_profit / exchange.lose_loss) < 1e-9
+            assert abs(row["profit"] - (exchange.get_balance() - exchange.start_balance)) < 1e-9
+            assert abs(row["drawdown"] - exchange.max_draw_down_session_perc) < 1e-9
+
+    def test_pruning(self):
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        file = os.path.join(dir.name, "{}", "data.csv")
+        os.makedirs(os.path.dirname(file.format("1m")))
+        random_ohlcv(2000).to_csv(file.format("1m"))
+        df = load_data(file.format("1m"))
+
+        bot = SmaCrossSignals()
+        bot.account = "binanceaccount1"
+        bot.exchange_arg = "binance"
+        result = bot.evaluate({}, df)
+        assert "pruned" not in result
+        trades = bot.exchange.order_count
+
+        for rules in [[MinTrades(trades + 1, checkpoint=0.25)], [MaxDrawdown(0)]]:
+            bot.pruning = lambda: rules
+            result = bot.evaluate({}, df)
+            assert result["status"] == STATUS_OK
+            assert result["loss"] == bot.prune_loss
+            assert "pruned" in result
+            # stopped before the last bar with the position closed
+            assert bot.exchange.bar_index < len(df) - 2
+            assert bot.exchange.get_position_size() == 0
+
+    def test_memo(self):
+        bot = SmaCrossSignals()
+        df = random_ohlcv(100)
+        with mock.patch(f"{__name__}.sma", side_effect=sma) as func:
+            bot.memo_cache = {}
+            bot.signals(df)
+            bot.signals(df)
+            assert func.call_count == 2
+            bot.memo_cache = None
+            bot.signals(df)
+            assert func.call_count == 4
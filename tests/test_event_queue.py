@@ -0,0 +1,106 @@
+# coding: UTF-8
+
+import threading
+import unittest
+
+from src.event_queue import EventQueue
+
+
+class TestEventQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.release = threading.Event()
+        self.release.set()
+
+        def handler(key, action, value):
+            self.release.wait(5)
+            if value == "error":
+                raise ValueError(value)
+            self.events.append((key, value))
+
+        self.queue = EventQueue(handler, conflate=["ticker"], maxsize=3)
+        self.addCleanup(self.queue.stop)
+
+    def test_order(self):
+        self.queue.block = True
+        for i in range(10):
+            self.queue.put("order", "", i)
+        assert self.queue.join(5)
+        assert self.events == [("order", i) for i in range(10)]
+        assert self.queue.metrics()["processed"] == 10
+
+    def test_conflation(self):
+        self.release.clear()
+        # the worker waits on the first event
+        self.queue.put("order", "", 0)
+        while len(self.queue) > 0:
+            pass
+        self.queue.put("ticker", "", 1)
+        self.queue.put("order", "", 2)
+        self.queue.put("ticker", "", 3)
+        self.queue.put("ticker", "", 4)
+        assert len(self.queue) == 2
+        self.release.set()
+        assert self.queue.join(5)
+        # the pending ticker keeps its place with the latest value
+        assert self.events == [("order", 0), ("ticker", 4), ("order", 2)]
+        metrics = self.queue.metrics()
+        assert metrics["conflated"] == 2 and metrics["max_depth"] == 2
+
+    def test_full_queue_waits(self):
+        self.release.clear()
+        self.queue.block = True
+        done = threading.Event()
+
+        def receive():
+            for i in range(10):
+                self.queue.put("order", "", i)
+            done.set()
+
+        thread = threading.Thread(target=receive)
+        thread.start()
+        assert not done.wait(0.2)
+        assert self.queue.metrics()["depth"] == 3
+        assert self.queue.metrics()["lag"] > 0
+        self.release.set()
+        thread.join(5)
+        assert self.queue.join(5)
+        # no event is dropped
+        assert self.events == [("order", i) for i in range(10)]
+        metrics = self.queue.metrics()
+        assert metrics["blocked"] > 0 and metrics["max_depth"] == 3 and metrics["max_lag"] > 0
+
+    def test_full_queue_drops(self):
+        self.release.clear()
+        # the worker waits on the first event
+        self.queue.put("order", "", 0)
+        while len(self.queue) > 0:
+            pass
+        for i in range(1, 6):
+            self.queue.put("order", "", i)
+        # the receive thread does not wait, the events past the max size are dropped
+        metrics = self.queue.metrics()
+        assert metrics["overflow"] == 2 and metrics["blocked"] == 0 and metrics["depth"] == 3
+        self.release.set()
+        assert self.queue.join(5)
+        self.queue.put("order", "", 6)
+        assert self.queue.join(5)
+        assert self.events == [("order", i) for i in [0, 1, 2, 3, 6]]
+
+    def test_handler_error(self):
+        self.queue.put("order", "", "error")
+        self.queue.put("order", "", 1)
+        assert self.queue.join(5)
+        assert self.events == [("order", 1)]
+
+    def test_stop(self):
+        self.release.clear()
+        self.queue.put("order", "", 0)
+        self.queue.put("order", "", 1)
+        self.queue.stop()
+        self.release.set()
+        self.queue.thread.join(5)
+        self.queue.put("order", "", 2)
+        assert self.events == [("order", 0)] or self.events == []
+        assert not self.queue.thread.is_alive()
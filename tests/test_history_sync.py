@@ -0,0 +1,98 @@
+# coding: UTF-8
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from src import resample
+from src.binance_futures_backtest import BinanceFuturesBackTest
+from src.history_sync import HistorySync
+from src.ohlcv_store import OhlcvStore
+from tests.test_backtest_engine import random_ohlcv
+
+
+class TestHistorySync(unittest.TestCase):
+
+    def setUp(self):
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        self.path = os.path.join(dir.name, "BTCUSDT", "15m")
+        # 1m bars labeled by their close time
+        self.source = random_ohlcv(3 * 24 * 60)
+        self.source.index = self.source.index + pd.Timedelta(minutes=1)
+        self.requests = 0
+
+    def fetch(self, bin_size, start_time, end_time):
+        self.requests += 1
+        data = resample(self.source, bin_size)
+        return data[(data.index >= start_time) & (data.index <= end_time)].iloc[:100]
+
+    def test_sync_only_fetches_missing_ranges(self):
+        store = OhlcvStore(self.path)
+        sync = HistorySync(store, "15m", self.fetch, page_size=100)
+        start_time = pd.Timestamp("2021-01-01 06:00Z")
+        end_time = pd.Timestamp("2021-01-03 12:07Z")
+        expected = resample(self.source, "15m")
+        expected = expected[(expected.index >= start_time) & (expected.index <= "2021-01-03 12:00Z")]
+
+        assert sync.sync(start_time, end_time) == len(expected)
+        pd.testing.assert_frame_equal(store.read(), expected[store.read().columns], check_freq=False, check_names=False)
+
+        # up to date, nothing is fetched
+        self.requests = 0
+        assert sync.missing_ranges(start_time, end_time) == []
+        assert sync.sync(start_time, end_time) == 0
+        assert self.requests == 0
+
+        # punch a gap and drop the tail
+        data = store.read()
+        data = data.drop(data.index[10:20])[:-30]
+        for file in os.listdir(self.path):
+            os.remove(os.path.join(self.path, file))
+        store.append(data)
+        assert len(sync.missing_ranges(start_time, end_time)) == 2
+
+        self.requests = 0
+        assert sync.sync(start_time, end_time) == 40
+        # 10 and 30 bars of 15m are 30 and 90 base bars of 5m, one page each
+        assert self.requests == 2
+        pd.testing.assert_frame_equal(store.read(), expected[store.read().columns], check_freq=False, check_names=False)
+
+    def test_empty_ranges_are_not_fetched_again(self):
+        # a maintenance window without any bar
+        self.source = self.source[(self.source.index < "2021-01-02 03:00Z") | (self.source.index > "2021-01-02 05:00Z")]
+        store = OhlcvStore(self.path)
+        sync = HistorySync(store, "15m", self.fetch, page_size=100)
+        start_time = pd.Timestamp("2021-01-01 06:00Z")
+        end_time = pd.Timestamp("2021-01-03 12:07Z")
+
+        sync.sync(start_time, end_time)
+        assert store.empty_ranges() == [(pd.Timestamp("2021-01-02 03:15Z").value, pd.Timestamp("2021-01-02 05:00Z").value)]
+        assert sync.missing_ranges(start_time, end_time) == []
+
+        self.requests = 0
+        assert sync.sync(start_time, end_time) == 0
+        assert self.requests == 0
+
+        # the tail is only missing until the exchange has it
+        later = pd.Timestamp("2021-01-03 13:07Z")
+        assert len(sync.missing_ranges(start_time, later)) == 1
+
+    def test_backtest_sync_is_opt_in(self):
+        store = OhlcvStore(self.path)
+        store.append(resample(self.source, "15m"))
+        exchange = BinanceFuturesBackTest(account="binanceaccount1", pair="BTCUSDT")
+        stores = os.path.join(os.path.dirname(os.path.dirname(self.path)), "{}", "{}")
+        with mock.patch("src.binance_futures_backtest.OHLC_STORE", stores), \
+             mock.patch.object(BinanceFuturesBackTest, "download_data", return_value=0) as download:
+            # an offline run reads the local history
+            exchange.load_ohlcv("15m")
+            assert download.call_count == 0
+            assert len(exchange.df_ohlcv) == len(resample(self.source, "15m"))
+
+            exchange.sync_history = True
+            exchange.load_ohlcv("15m")
+            assert download.call_count == 1
@@ -0,0 +1,174 @@
+# coding: UTF-8
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import sma, ema, rsi, atr, wma, hull, stdev, highest, lowest, rci, rci_series, d, heikinashi, supertrend
+from src.binance_futures_backtest import BinanceFuturesBackTest
+from src.indicators import Sma, Ema, Rsi, Atr, Wma, Hull, Stdev, Highest, Lowest, Rci, Indicators
+from tests.test_backtest_engine import random_ohlcv
+
+
+class TestIndicators(unittest.TestCase):
+
+    def setUp(self):
+        df = random_ohlcv(3000)
+        self.open = df["open"].values
+        self.close = df["close"].values
+        self.high = df["high"].values
+        self.low = df["low"].values
+        self.volume = df["volume"].values
+
+    def stream(self, indicator):
+        return np.array([indicator.bar(*bar) for bar in zip(self.open, self.close, self.high, self.low, self.volume)])
+
+    def test_same_values_as_series_functions(self):
+        cases = [
+            (sma(self.close, 20), Sma(20)),
+            (sma(self.close, 1200), Sma(1200)),
+            (ema(self.close, 20), Ema(20)),
+            (rsi(self.close, 14), Rsi(14)),
+            (atr(self.high, self.low, self.close, 14), Atr(14)),
+            (wma(self.close, 20), Wma(20)),
+            (hull(self.close, 21), Hull(21)),
+            (stdev(self.close, 20), Stdev(20)),
+            (highest(self.high, 20), Highest(20)),
+            (lowest(self.low, 20), Lowest(20)),
+            (sma(self.volume, 10), Sma(10, source="volume")),
+        ]
+        for expected, indicator in cases:
+            np.testing.assert_allclose(self.stream(indicator), expected, rtol=1e-9, equal_nan=True,
+                                       err_msg=type(indicator).__name__)
+
+    def test_history(self):
+        indicator = Sma(5, history=3)
+        values = self.stream(indicator)
+        assert len(indicator) == 3
+        assert indicator.value == values[-1]
+        assert indicator[-3] == values[-3]
+
+    def test_registry_seeds_new_indicators(self):
+        indicators = Indicators()
+        bars = (self.open[:100], self.close[:100], self.high[:100], self.low[:100], self.volume[:100])
+        indicator = indicators.get(Sma, (20,), {}, lambda: bars)
+        assert indicators.get(Sma, (20,), {}, lambda: bars) is indicator
+        assert len(indicators) == 1
+        indicators.update(self.open[100], self.close[100], self.high[100], self.low[100], self.volume[100])
+        assert indicator.value == sma(self.close[:101], 20)[-1]
+
+    def test_backtest_indicators(self):
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        file = os.path.join(dir.name, "{}", "data.csv")
+        os.makedirs(os.path.dirname(file.format("1m")))
+        random_ohlcv(500).to_csv(file.format("1m"))
+
+        exchange = BinanceFuturesBackTest(account="binanceaccount1", pair="BTCUSDT")
+        exchange.ohlcv_len = 50
+        exchange.sync_history = False
+        values = []
+
+        def strategy(open, close, high, low, volume):
+            values.append((exchange.indicator(Sma, 20)[-1], sma(close, 20)[-1],
+                           exchange.indicator(Rsi, 14)[-1], rsi(close, 14)[-1]))
+
+        with mock.patch("src.binance_futures_backtest.OHLC_FILENAME", file), \
+             mock.patch("src.binance_futures_backtest.OHLC_STORE", os.path.join(dir.name, "{}", "{}")):
+            exchange.on_update("1m", strategy)
+
+        values = np.array(values)
+        assert len(values) == 450
+        np.testing.assert_allclose(values[:, 0], values[:, 1], rtol=1e-9)
+        # seeded with the first window, the first value is the one of the series function
+        assert abs(values[0, 2] - values[0, 3]) < 1e-9
+
+
+class TestRci(unittest.TestCase):
+
+    @staticmethod
+    def legacy_rci(src, itv):
+        """
+        src.rci before the vectorized implementation
+        """
+        reversed_src = src[::-1]
+        ret = [(1.0 - 6.0 * d(reversed_src[i: i + itv], itv) / (itv * (itv * itv - 1.0))) * 100.0 for i in range(2)]
+        return ret[::-1]
+
+    def setUp(self):
+        # rounded prices, so windows have equal prices
+        self.close = np.round(random_ohlcv(400)["close"].values, 0)
+
+    def test_same_values_as_sort_and_scan(self):
+        for itv in [2, 9, 21, 55]:
+            series = rci_series(self.close, itv)
+            assert np.isnan(series[:itv - 1]).all()
+            for i in range(itv + 1, len(self.close) + 1):
+                assert self.legacy_rci(self.close[:i], itv) == list(series[i - 2:i])
+            assert rci(self.close, itv) == self.legacy_rci(self.close, itv)
+
+    def test_rolling(self):
+        for itv in [9, 55]:
+            indicator = Rci(itv)
+            values = [indicator.update(value) for value in self.close]
+            np.testing.assert_array_equal(values, rci_series(self.close, itv))
+
+
+class TestCandles(unittest.TestCase):
+
+    def setUp(self):
+        self.df = random_ohlcv(500)
+
+    def test_heikinashi(self):
+        df = self.df
+        ha_close = ((df["open"] + df["high"] + df["low"] + df["close"]) / 4).values
+        # row loop of the previous implementation
+        ha_open = np.zeros(len(df))
+        ha_open[0] = (df["open"].iat[0] + df["close"].iat[0]) / 2
+        for i in range(1, len(df)):
+            ha_open[i] = (ha_open[i - 1] + ha_close[i - 1]) / 2
+
+        columns = list(df.columns)
+        hadf = heikinashi(df)
+        assert list(df.columns) == columns
+        np.testing.assert_array_equal(hadf["HA_open"].values, ha_open)
+        np.testing.assert_array_equal(hadf["HA_close"].values, ha_close)
+        np.testing.assert_array_equal(hadf["HA_high"].values, np.maximum.reduce([ha_open, ha_close, df["high"].values]))
+        np.testing.assert_array_equal(hadf["HA_low"].values, np.minimum.reduce([ha_open, ha_close, df["low"].values]))
+        np.testing.assert_array_equal(heikinashi(hadf)["HA_open"].values, ha_open)
+
+    def test_supertrend(self):
+        df, f, n = self.df, 3, 7
+        high, low, close = df["high"].values, df["low"].values, df["close"].values
+        # row loop of the previous implementation
+        tr = [high[0] - low[0]] + [max(high[i] - low[i], abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1]))
+                                   for i in range(1, len(df))]
+        atr = [np.nan] * len(df)
+        atr[n - 1] = np.mean(tr[:n - 1])
+        for i in range(n, len(df)):
+            atr[i] = (atr[i - 1] * (n - 1) + tr[i]) / n
+        basic_ub = (high + low) / 2 + f * np.array(atr)
+        basic_lb = (high + low) / 2 - f * np.array(atr)
+        ub, lb = basic_ub.copy(), basic_lb.copy()
+        for i in range(n, len(df)):
+            ub[i] = min(basic_ub[i], ub[i - 1]) if close[i - 1] <= ub[i - 1] else basic_ub[i]
+            lb[i] = max(basic_lb[i], lb[i - 1]) if close[i - 1] >= lb[i - 1] else basic_lb[i]
+        st = np.full(len(df), np.nan)
+        st[n - 1] = ub[n - 1] if close[n - 1] <= ub[n - 1] else lb[n - 1]
+        for i in range(n, len(df)):
+            if st[i - 1] == ub[i - 1]:
+                st[i] = ub[i] if close[i] <= ub[i] else lb[i]
+            elif st[i - 1] == lb[i - 1]:
+                st[i] = lb[i] if close[i] >= lb[i] else ub[i]
+
+        columns = list(df.columns)
+        stdf = supertrend(df, f, n)
+        assert list(df.columns) == columns
+        np.testing.assert_allclose(stdf["Upper Band"].values[n - 1:], ub[n - 1:], rtol=1e-12)
+        np.testing.assert_allclose(stdf["Lower Band"].values[n - 1:], lb[n - 1:], rtol=1e-12)
+        np.testing.assert_allclose(stdf["SuperTrend"].values, st, rtol=1e-12)
+        np.testing.assert_array_equal(stdf["Trend"].values[n - 1:], st[n - 1:] == lb[n - 1:])
+        assert stdf["Trend"].values[n:].any() and not stdf["Trend"].values[n:].all()
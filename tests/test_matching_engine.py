@@ -0,0 +1,77 @@
+# coding: UTF-8
+
+import random
+import unittest
+
+from src.matching_engine import MatchingEngine
+
+
+def scan(orders, high, low, close):
+    """
+    order list scan of the stubs before the matching engine
+    :return: fills, resting orders
+    """
+    fills = []
+    resting = []
+    for order in orders:
+        id, long, qty, limit, stop = order["id"], order["long"], order["qty"], order["limit"], order["stop"]
+        if limit > 0 and stop > 0:
+            if (long and high > stop and close < limit) or (not long and low < stop and close > limit):
+                fills.append((id, long, qty, limit))
+                continue
+            elif (long and high > stop) or (not long and low < stop):
+                resting.append(dict(order, stop=0))
+                continue
+        elif limit > 0:
+            if (long and low < limit) or (not long and high > limit):
+                fills.append((id, long, qty, limit))
+                continue
+        elif stop > 0:
+            if (long and high > stop) or (not long and low < stop):
+                fills.append((id, long, qty, stop))
+                continue
+        resting.append(order)
+    return fills, resting
+
+
+class TestMatchingEngine(unittest.TestCase):
+
+    def test_same_fills_as_scan(self):
+        rng = random.Random(7)
+        engine = MatchingEngine()
+        orders = []
+        price = 100.0
+        for bar in range(3000):
+            for _ in range(rng.randint(0, 4)):
+                id = f"order{rng.randint(0, 40)}"
+                long = rng.random() < 0.5
+                kind = rng.randint(0, 2)
+                limit = round(price + rng.uniform(-5, 5), 1) if kind != 1 else 0
+                stop = round(price + rng.uniform(-5, 5), 1) if kind != 0 else 0
+                if rng.random() < 0.3:
+                    engine.cancel(id)
+                    orders = [o for o in orders if o["id"] != id]
+                engine.add(id, long, 1, limit, stop)
+                orders.append({"id": id, "long": long, "qty": 1, "limit": limit, "stop": stop, "post_only": False})
+            if rng.random() < 0.01:
+                engine.clear()
+                orders = []
+
+            price += rng.uniform(-2, 2)
+            high = round(price + rng.uniform(0, 3), 1)
+            low = round(price - rng.uniform(0, 3), 1)
+            close = round(rng.uniform(low, high), 1)
+            fills, orders = scan(orders, high, low, close)
+            assert engine.match(high, low, close) == fills
+            assert engine.open_orders() == orders
+
+    def test_cancelled_entries_are_dropped(self):
+        engine = MatchingEngine()
+        for i in range(1000):
+            engine.add(f"order{i}", True, 1, 100 - i * 0.01)
+        for i in range(990):
+            engine.cancel(f"order{i}")
+        assert len(engine) == 10
+        assert len(engine.buy_limits) < 10 + 2 * engine.compact_size
+        assert [fill[0] for fill in engine.match(200, 0, 100)] == [f"order{i}" for i in range(990, 1000)]
+        assert len(engine) == 0 and engine.dead == 0
@@ -0,0 +1,53 @@
+# coding: UTF-8
+
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from src import load_data
+from src.ohlcv_store import OhlcvStore
+from tests.test_backtest_engine import random_ohlcv
+
+
+class TestOhlcvStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "BTCUSDT", "1m")
+
+    def test_round_trip(self):
+        df = random_ohlcv(100)
+        store = OhlcvStore(self.path)
+        assert not store.exists()
+        assert store.append(df) == 100
+        assert store.last_timestamp() == df.index[-1]
+        pd.testing.assert_frame_equal(load_data(self.path), df[["open", "high", "low", "close", "volume"]],
+                                      check_freq=False)
+
+    def test_append_only_writes_new_rows(self):
+        df = random_ohlcv(100)
+        store = OhlcvStore(self.path)
+        store.append(df[:60])
+        with open(os.path.join(self.path, "close.bin"), "rb") as f:
+            head = f.read()
+
+        # overlapping rows are skipped
+        assert store.append(df[40:]) == 40
+        assert len(store) == 100
+        with open(os.path.join(self.path, "close.bin"), "rb") as f:
+            assert f.read(len(head)) == head
+        pd.testing.assert_frame_equal(store.read(), df[["open", "high", "low", "close", "volume"]], check_freq=False)
+
+    def test_interrupted_append(self):
+        df = random_ohlcv(10)
+        store = OhlcvStore(self.path)
+        store.append(df[:5])
+        # a row only written to some of the columns is ignored and overwritten
+        with open(os.path.join(self.path, "timestamp.bin"), "ab") as f:
+            f.write(df.index[5:6].asi8.tobytes())
+        assert len(store) == 5
+        store.append(df[5:])
+        pd.testing.assert_frame_equal(store.read(), df[["open", "high", "low", "close", "volume"]], check_freq=False)
@@ -0,0 +1,95 @@
+# coding: UTF-8
+
+import threading
+import time
+import unittest
+
+from src.order_manager import OrderManager
+
+
+def order(id, status):
+    return {"clientOrderId": id, "side": "SELL", "origQty": "1", "status": status}
+
+
+class TestOrderManager(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = OrderManager(confirm_timeout=2)
+        self.addCleanup(self.manager.stop)
+        self.events = []
+
+    def wait_idle(self, key):
+        for i in range(200):
+            if not self.manager.pending(key):
+                return
+            time.sleep(0.01)
+        raise AssertionError("intent did not complete")
+
+    def test_replace_waits_for_the_cancel_confirmation(self):
+        self.manager.load([order("TP_1", "NEW")])
+        assert self.manager.open_order("TP")["clientOrderId"] == "TP_1"
+
+        def cancel(id):
+            self.events.append("cancel " + id)
+            # the exchange confirms on the user data stream a bit later
+            threading.Timer(0.1, lambda: (self.events.append("canceled"),
+                                          self.manager.on_order_update(order(id, "CANCELED")))).start()
+
+        def place():
+            self.events.append("place")
+            self.manager.on_order_update(order("TP_2", "NEW"))
+
+        self.manager.submit("TP", "TP_1", cancel, place)
+        assert self.manager.pending("TP")
+        self.wait_idle("TP")
+        assert self.events == ["cancel TP_1", "canceled", "place"]
+        assert self.manager.open_order("TP")["clientOrderId"] == "TP_2"
+
+    def test_intents_are_coalesced(self):
+        release = threading.Event()
+
+        def place(n):
+            def run():
+                release.wait(2)
+                self.events.append(n)
+                self.manager.on_order_update(order(f"SL_{n}", "NEW"))
+            return run
+
+        self.manager.submit("SL", place=place(1))
+        time.sleep(0.05)
+        # queued while the first one is running, only the last one is kept
+        self.manager.submit("SL", place=place(2))
+        self.manager.submit("SL", place=place(3))
+        release.set()
+        self.wait_idle("SL")
+        assert self.events == [1, 3]
+
+    def test_unconfirmed_order_stays_pending(self):
+        self.manager.confirm_timeout = 0.1
+        placed = []
+        self.manager.submit("TP", place=lambda: placed.append(1))
+        time.sleep(0.3)
+        # the new order was never confirmed, it may still be accepted
+        assert self.manager.pending("TP")
+        assert placed == [1]
+        self.manager.on_order_update(order("TP_1", "NEW"))
+        self.wait_idle("TP")
+        assert self.manager.open_order("TP")["clientOrderId"] == "TP_1"
+        assert placed == [1]
+
+    def test_unconfirmed_order_is_reconciled(self):
+        open_orders = [order("SL_1", "NEW")]
+        manager = OrderManager(confirm_timeout=0.1, reconcile=lambda: open_orders, reconcile_interval=0.2)
+        self.addCleanup(manager.stop)
+        manager.submit("TP", place=lambda: None)
+        manager.submit("SL", place=lambda: None)
+        time.sleep(0.15)
+        assert manager.pending("TP") and manager.pending("SL")
+        for i in range(200):
+            if not manager.pending("TP") and not manager.pending("SL"):
+                break
+            time.sleep(0.01)
+        # the open order confirms SL, TP was rejected
+        assert not manager.pending("TP") and not manager.pending("SL")
+        assert manager.open_order("SL")["clientOrderId"] == "SL_1"
+        assert manager.open_order("TP") is None
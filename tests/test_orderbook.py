@@ -0,0 +1,88 @@
+# coding: UTF-8
+
+import random
+import unittest
+
+from src.orderbook import OrderBook, Ladder
+
+
+class Ws:
+    def __init__(self):
+        self.handlers = {}
+
+    def bind(self, key, func):
+        self.handlers[key] = func
+
+
+class TestOrderBook(unittest.TestCase):
+
+    def test_bitmex_l2_updates(self):
+        ws = Ws()
+        ob = OrderBook(ws)
+        update = ws.handlers['orderBookL2']
+        update("partial", [{"id": i, "side": "Buy" if i < 10 else "Sell", "price": 100 + i, "size": 1}
+                           for i in range(20)])
+        assert ob.get_prices() == (109, 110)
+
+        rng = random.Random(1)
+        levels = {i: (100 + i, 1) for i in range(20)}
+        for i in range(500):
+            id = rng.randrange(40)
+            if id in levels and rng.random() < 0.5:
+                update("delete", [{"id": id, "side": "Buy" if id < 10 else "Sell"}])
+                del levels[id]
+            elif id in levels:
+                size = rng.randrange(1, 10)
+                update("update", [{"id": id, "side": "Buy" if id < 10 else "Sell", "size": size}])
+                levels[id] = (levels[id][0], size)
+            else:
+                size = rng.randrange(1, 10)
+                update("insert", [{"id": id, "side": "Buy" if id < 10 else "Sell", "price": 100 + id, "size": size}])
+                levels[id] = (100 + id, size)
+
+            bids = sorted([v for k, v in levels.items() if k < 10], reverse=True)
+            asks = sorted([v for k, v in levels.items() if k >= 10])
+            assert ob.depth(5) == (bids[:5], asks[:5])
+
+    def test_binance_snapshot(self):
+        ws = Ws()
+        ob = OrderBook(ws)
+        ws.handlers['orderBookL2']("partial", [{"side": "Buy", "price": 99.0, "size": 3.0},
+                                              {"side": "Buy", "price": 98.0, "size": 1.0},
+                                              {"side": "Sell", "price": 101.0, "size": 1.0},
+                                              {"side": "Sell", "price": 102.0, "size": 2.0}])
+        assert ob.get_prices() == (99.0, 101.0)
+        assert ob.mid_price() == 100.0
+        assert ob.microprice() == (99.0 * 1.0 + 101.0 * 3.0) / 4.0
+        assert ob.cumulative_size(2) == ([(99.0, 3.0), (98.0, 4.0)], [(101.0, 1.0), (102.0, 3.0)])
+
+        # the next snapshot replaces the book
+        ws.handlers['orderBookL2']("partial", [{"side": "Buy", "price": 100.0, "size": 1.0},
+                                              {"side": "Sell", "price": 100.5, "size": 1.0}])
+        assert ob.depth(5) == ([(100.0, 1.0)], [(100.5, 1.0)])
+
+    def test_ladder(self):
+        rng = random.Random(2)
+        for bid in [True, False]:
+            ladder = Ladder(bid=bid)
+            levels = {}
+            for i in range(5000):
+                price = rng.randrange(1000)
+                size = rng.choice([0, 0, 1, 2, 3])
+                ladder.set(price, size)
+                if size > 0:
+                    levels[price] = size
+                else:
+                    levels.pop(price, None)
+                if len(levels) == 0:
+                    assert ladder.best() is None
+                    continue
+                best, worst = (max(levels), min(levels)) if bid else (min(levels), max(levels))
+                assert ladder.best() == (best, levels[best])
+                assert ladder.worst() == (worst, levels[worst])
+                if i % 100 == 0:
+                    expected = sorted(levels.items(), reverse=bid)
+                    assert ladder.levels(10) == expected[:10]
+                    assert ladder.levels() == expected
+            # removed prices do not pile up in the heaps
+            assert len(ladder.low) <= 2 * len(ladder) + ladder.compact_size + 1
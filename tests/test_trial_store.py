@@ -0,0 +1,156 @@
+# coding: UTF-8
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from hyperopt import hp, space_eval, STATUS_OK
+from hyperopt.base import spec_from_misc
+
+from src import load_data
+from src.binance_futures_backtest import BinanceFuturesBackTest
+from src.ohlcv_store import OhlcvStore
+from src.trial_store import TrialStore, fingerprint
+from tests.test_backtest_engine import random_ohlcv
+from tests.test_bot import SmaCross
+
+
+class SmaCrossChoice(SmaCross):
+
+    def options(self):
+        return {
+            "fast_len": hp.choice("fast_len", [3, 5, 8]),
+            "slow_len": hp.quniform("slow_len", 11, 30, 1),
+        }
+
+
+class TestTrialStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "trials", "trials.sqlite")
+
+    def test_get_put(self):
+        store = TrialStore(self.path, "SmaCross", "BTCUSDT", "1m", "data")
+        assert store.get({"fast_len": 5}) is None
+        store.put({"fast_len": 5.0, "slow_len": 20}, {"status": STATUS_OK, "loss": 0.5})
+        assert store.get({"slow_len": 20.0, "fast_len": 5}) == {"status": STATUS_OK, "loss": 0.5}
+        store.close()
+
+        store = TrialStore(self.path, "SmaCross", "BTCUSDT", "1m", "data")
+        assert len(store) == 1
+        assert store.trials() == [({"fast_len": 5.0, "slow_len": 20.0}, {"status": STATUS_OK, "loss": 0.5}, None)]
+        store.put({"fast_len": 3}, {"status": STATUS_OK, "loss": 0.2}, {"fast_len": [np.int64(0)], "slow_len": []})
+        assert store.trials()[1][2] == {"fast_len": [0], "slow_len": []}
+        # other data, other trials
+        assert len(TrialStore(self.path, "SmaCross", "BTCUSDT", "1m", "other")) == 0
+
+    def test_database_without_vals(self):
+        os.makedirs(os.path.dirname(self.path))
+        db = sqlite3.connect(self.path)
+        db.execute("CREATE TABLE trials (strategy TEXT, pair TEXT, bin_size TEXT, fingerprint TEXT, params TEXT, "
+                   "result TEXT, PRIMARY KEY (strategy, pair, bin_size, fingerprint, params))")
+        db.execute("INSERT INTO trials VALUES ('SmaCross', 'BTCUSDT', '1m', 'data', '{\"fast_len\": 5.0}', "
+                   "'{\"loss\": 0.5}')")
+        db.commit()
+        db.close()
+
+        store = TrialStore(self.path, "SmaCross", "BTCUSDT", "1m", "data")
+        assert store.trials() == [({"fast_len": 5.0}, {"loss": 0.5}, None)]
+        store.put({"fast_len": 3}, {"loss": 0.2}, {"fast_len": [3.0]})
+        assert store.trials()[1] == ({"fast_len": 3.0}, {"loss": 0.2}, {"fast_len": [3.0]})
+
+    def test_fingerprint(self):
+        df = random_ohlcv(100)
+        assert fingerprint(df) == fingerprint(df.copy())
+        changed = df.copy()
+        changed.iloc[50, changed.columns.get_loc("close")] += 1
+        assert fingerprint(df) != fingerprint(changed)
+
+    def test_params_search_resume(self):
+        file = os.path.join(self.dir.name, "{}", "data.csv")
+        os.makedirs(os.path.dirname(file.format("1m")))
+        random_ohlcv(1000).to_csv(file.format("1m"))
+
+        bot = SmaCross()
+        bot.account = "binanceaccount1"
+        bot.exchange_arg = "binance"
+        bot.trials_path = self.path
+
+        with mock.patch("src.binance_futures_backtest.OHLC_FILENAME", file), \
+             mock.patch("src.binance_futures_backtest.OHLC_STORE", os.path.join(self.dir.name, "{}", "{}")), \
+             mock.patch.object(BinanceFuturesBackTest, "sync_history", False), \
+             mock.patch.object(bot, "evaluate", wraps=bot.evaluate) as evaluate:
+            bot.max_evals = 5
+            bot.params_search()
+            first = evaluate.call_count
+            assert 0 < first <= 5
+
+            # resumes from the stored trials and only back tests new parameter sets
+            bot.max_evals = 8
+            bot.params_search()
+            assert evaluate.call_count - first <= 3
+
+        # every back test is stored once, repeated parameter sets are not run again
+        store = TrialStore(self.path, "SmaCross", bot.pair, "1m", fingerprint(bot.exchange.df_ohlcv))
+        assert len(store) == evaluate.call_count
+
+    def search(self, bot):
+        file = os.path.join(self.dir.name, "{}", "data.csv")
+        if not os.path.exists(file.format("1m")):
+            os.makedirs(os.path.dirname(file.format("1m")))
+            random_ohlcv(1000).to_csv(file.format("1m"))
+
+        def download_data(exchange, path, bin_size, start_time, end_time):
+            # the exchange always has a new bar
+            df = load_data(path)
+            bar = df.iloc[-1:].copy()
+            bar.index = bar.index + pd.Timedelta(minutes=1)
+            OhlcvStore(path).append(bar)
+            return 1
+
+        bot.account = "binanceaccount1"
+        bot.exchange_arg = "binance"
+        bot.trials_path = self.path
+        with mock.patch("src.binance_futures_backtest.OHLC_FILENAME", file), \
+             mock.patch("src.binance_futures_backtest.OHLC_STORE", os.path.join(self.dir.name, "{}", "{}")), \
+             mock.patch.object(BinanceFuturesBackTest, "download_data", autospec=True,
+                               side_effect=download_data) as download, \
+             mock.patch.object(bot, "evaluate", wraps=bot.evaluate) as evaluate:
+            bot.params_search()
+        return download.call_count, evaluate.call_count
+
+    def test_params_search_same_data(self):
+        bot = SmaCross()
+        bot.max_evals = 5
+        downloads, first = self.search(bot)
+        assert 0 < first <= 5
+
+        # the history is not synced by a search, the second one runs on the same data
+        downloads, second = self.search(bot)
+        assert downloads == 0 and second == 0
+
+    def test_params_search_choice(self):
+        bot = SmaCrossChoice()
+        bot.max_evals = 5
+        _, first = self.search(bot)
+        bot.max_evals = 8
+        _, second = self.search(bot)
+        assert first + second <= 8
+
+        # the resumed trials are rebuilt with the choice indices, not the chosen values
+        bot.trial_store = TrialStore(self.path, "SmaCrossChoice", bot.pair, "1m", fingerprint(bot.exchange.df_ohlcv))
+        self.addCleanup(bot.trial_store.close)
+        stored = bot.trial_store.trials()
+        trials = bot.stored_trials(bot.options())
+        assert len(trials.trials) == len(stored) == first + second
+        for doc, (params, result, vals) in zip(trials.trials, stored):
+            assert vals["fast_len"][0] in [0, 1, 2]
+            args = space_eval(bot.options(), spec_from_misc(doc["misc"]))
+            assert {k: float(v) for k, v in args.items()} == params
+            assert doc["result"] == result
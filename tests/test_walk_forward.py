@@ -0,0 +1,48 @@
+# coding: UTF-8
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.walk_forward import WalkForward, windows
+from tests.test_backtest_engine import random_ohlcv
+from tests.test_bot import SmaCrossSignals
+
+
+class TestWalkForward(unittest.TestCase):
+
+    def test_windows(self):
+        index = random_ohlcv(3000).index
+        warmup = 49
+        bounds = windows(index, pd.Timedelta(minutes=600), pd.Timedelta(minutes=300), warmup)
+        assert len(bounds) > 5
+        evaluated = []
+        for train, test in bounds:
+            assert train.stop == test.start + warmup
+            assert index[train.stop - 1] < index[test.start + warmup] <= index[train.start] + pd.Timedelta(minutes=600)
+            evaluated.extend(range(test.start + warmup, test.stop - 1))
+        # the test periods cover every bar once up to the last evaluated bar of a back test
+        assert evaluated == list(range(bounds[0][1].start + warmup, len(index) - 1))
+
+    def test_parallel_same_as_sequential(self):
+        df = random_ohlcv(3000)
+        bot = SmaCrossSignals()
+        bot.account = "binanceaccount1"
+        bot.exchange_arg = "binance"
+        bot.max_evals = 4
+
+        results = []
+        for workers in [1, 2]:
+            runner = WalkForward(bot, df, pd.Timedelta(minutes=1000), pd.Timedelta(minutes=500), workers)
+            runner.seed = 1
+            results.append(runner.run())
+
+        (table, equity), (parallel_table, parallel_equity) = results
+        assert len(table) == 4
+        assert list(table["params"]) == list(parallel_table["params"])
+        pd.testing.assert_series_equal(equity, parallel_equity)
+        assert equity.index.is_monotonic_increasing and equity.index.is_unique
+        assert len(equity) == len(df) - 1 - df.index.searchsorted(df.index[0] + pd.Timedelta(minutes=1000))
+        # each test period starts from the profit at the end of the previous ones
+        np.testing.assert_allclose(equity.iloc[-1], table["profit"].sum())